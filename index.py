@@ -35,6 +35,7 @@ class Menus:
         self.select_player = self.SelectPlayer(self)
 
         self.button_analyze = self.ButtonAnalyze(self)
+        self.button_refresh = self.ButtonRefresh(self)
 
         self._init_analyzers()
 
@@ -150,13 +151,16 @@ class Menus:
             try:
                 if not self.parent.client:
                     self.parent.update_client()
-                self.parent.metadata = await self.parent.client._get_metadata(log_id)
+                analyzer = self.parent.analyzers.get(self.parent.select_analyzer.obj.value)
+                self.parent.metadata = await self.parent.client._get_metadata(log_id, fields=analyzer and analyzer.get_metadata_fields())
                 await asyncio.sleep(0.01)
 
                 self.parent.select_player.obj.options = sorted(self.parent.metadata.df_mage_fire.name.to_list())
                 self.parent.select_encounter.obj.options = self.parent.metadata.encounters.formattedName.to_list()[::-1]
                 self.parent.statictext_report.SetText(f"Loaded: {log_id}<br>{await self.parent.client.get_api_rate()}")
                 self.parent.select_analyzer.handler(None)
+                if analyzer:
+                    analyzer.on_report_loaded()
                 if HAS_PYSCRIPT:
                     ls = window.localStorage
                     ls.setItem("WCLAnalyzerLogID", self.parent.log_id)
@@ -230,6 +234,24 @@ class Menus:
             return
         
 
+    # -------------------------------------------------------------------------
+    class ButtonRefresh:
+        def __init__(self, parent):
+            self.parent = parent
+            self.obj = pn.widgets.Button(icon='refresh', align='center', button_type='primary', margin=(5, 12, 0, -7))
+            self.obj.on_click(self.handler)
+
+        async def handler(self, event):
+            if not event:
+                return
+            if not self.parent._is_task_done():
+                return
+
+            analyzer = self.parent.analyzers.get(self.parent.select_analyzer.obj.value)
+            if analyzer:
+                self.parent.current_task = asyncio.create_task(analyzer.on_button_refresh())
+                await self.parent.current_task
+
     # -------------------------------------------------------------------------
     class Analyzer:
         def __init__(self, parent):
@@ -241,6 +263,16 @@ class Menus:
         def on_menu_encounter(self):
             pass
 
+        def on_report_loaded(self):
+            pass
+
+        def get_metadata_fields(self):
+            # None requests the full report metadata
+            return None
+
+        async def on_button_refresh(self):
+            pass
+
         async def on_button_analyze(self):
             pass
 
@@ -251,15 +283,52 @@ class Menus:
             if self.parent.metadata:
                 self.parent.select_encounter.obj.options = self.parent.metadata.encounters.formattedName.to_list()[::-1]
 
+        def get_metadata_fields(self):
+            return PixolClassAnalyzerMageFire.metadata_fields
+
+        def on_report_loaded(self):
+            # download all fire mages of a finished report in the background, later analyze clicks are then served from memory
+            self.parent.client.prefetch_report(self.parent.log_id, PixolClassAnalyzerMageFire.get_prefetch_streams(self.parent.metadata), self.parent.metadata)
+
+        def set_downsample_width(self, obj_analyzer):
+            # the charts stretch to the panel, area series need no more points than it is px wide
+            if HAS_PYSCRIPT and document.getElementById('panel2').clientWidth > 0:
+                obj_analyzer.downsample_width = document.getElementById('panel2').clientWidth
+
         async def graph(self, log_id, fight_id, player_id):
             if HAS_PYSCRIPT:
                 pydom['#panel2'][0].html = '<div id="pydomdiv"></div>'
             # await PixolWCLWarlock.generate_graph(self.parent.client, self.parent.metadata, log_id, fight_id, player_id, target_div="pydomdiv")
             obj_analyzer = PixolClassAnalyzerMageFire(self.parent.client, self.parent.metadata, player_id, fight_id)
+            self.set_downsample_width(obj_analyzer)
             await obj_analyzer.fetch_events()
             obj_analyzer.generate_panel_to_div("pydomdiv")
+            self.obj_analyzer = obj_analyzer
             self.parent.statictext_report.SetText("Done")
 
+        async def on_button_refresh(self):
+            # live logs: append the events logged since the last fetch and redraw, without reloading the report
+            obj_analyzer = getattr(self, 'obj_analyzer', None)
+            if obj_analyzer is None:
+                self.parent.statictext_report.SetText("Please analyze a player first")
+                return
+            self.parent.statictext_report.SetText("Refreshing...")
+            try:
+                self.parent.metadata = await self.parent.client._get_metadata(self.parent.log_id, fields=self.get_metadata_fields())
+                if not await obj_analyzer.refresh(self.parent.metadata):
+                    self.parent.statictext_report.SetText("No new events")
+                    return
+                self.parent.button_analyze.destroy_highcharts()
+                if HAS_PYSCRIPT:
+                    pydom['#panel2'][0].html = '<div id="pydomdiv"></div>'
+                self.set_downsample_width(obj_analyzer)
+                obj_analyzer.generate_panel_to_div("pydomdiv")
+                self.parent.statictext_report.SetText("Done")
+            except Exception as e:
+                self.parent.error = e
+                self.parent.statictext_report.SetText(f"Error: {e}")
+            await asyncio.sleep(1)
+
         async def on_button_analyze(self):
             encounter = self.parent.select_encounter.obj.value
             if not encounter:
@@ -325,6 +394,7 @@ class Menus:
                         self.select_encounter.obj,
                         self.select_player.obj,
                         self.button_analyze.obj,
+                        self.button_refresh.obj,
                     ),
                     self.statictext_report.obj,
             )
@@ -0,0 +1,62 @@
+import random
+
+import pandas as pd
+import pytest
+
+class MetaData:
+    # the parts of WCLReportMetaData the report, graph, store and client code read: one 300 s boss fight per id,
+    # fight 1 starting at 1000 ms. Live (not finished) fights have no endTime yet.
+    abilities = pd.DataFrame({'name': ['Fireball', 'Ignite', 'Pyroblast'], 'icon': ['fb.jpg', 'ignite.jpg', 'pyro.jpg']}, index=[133, 413843, 11366])
+    actors = pd.DataFrame({'name': ['Me', 'Boss', 'Add'], 'type': ['Player', 'NPC', 'NPC']}, index=[1, 5, 6])
+
+    def __init__(self, fight_ids=(1,), finished=True):
+        fights = []
+        for i in fight_ids:
+            start_time = 1000 + (i-1)*1000000
+            fights.append(dict(id=i, encounterID=7, name='Boss', startTime=start_time, endTime=finished and start_time + 300000 or None, kill=True, difficulty=3))
+        self.rawData = dict(title='t', guild=None, startTime=0, fights=fights, masterData=dict(
+            abilities=[dict(gameID=i, name=row['name'], icon=row['icon']) for i, row in self.abilities.iterrows()],
+            actors=[dict(id=i, name=row['name'], type=row['type']) for i, row in self.actors.iterrows()],
+        ))
+        self.fights = pd.DataFrame(fights).set_index('id')
+        self.fights['duration'] = (pd.to_numeric(self.fights['endTime']) - self.fights['startTime'])/1000
+        self.encounters = self.fights
+
+def build_events(num_events, seed=0, amount=None, fight_id=1, resources=False):
+    # random events of a fight (see MetaData), with resources: damage events carrying the resources of their target
+    rng = random.Random(seed)
+    start_time = 1000 + (fight_id-1)*1000000
+    events = []
+    for i in range(num_events):
+        event = {
+            'timestamp': start_time + (i//3)*10, # events share timestamps, like in real logs
+            'type': rng.choice(['damage', 'cast', 'applybuff', 'removebuff', 'applydebuff']),
+            'sourceID': rng.choice([1, 1, 5]),
+            'targetID': rng.choice([5, 6, -1]),
+            'abilityGameID': rng.choice([133, 413843, 11366]),
+            'fight': fight_id,
+        }
+        if rng.random() < 0.5:
+            event['targetInstance'] = rng.randint(1, 3)
+        if event['type'] == 'damage':
+            event.update(hitType=rng.choice([1, 2]), amount=amount or rng.randint(0, 9000), unmitigatedAmount=9000, mitigated=0)
+            if rng.random() < 0.3:
+                event['tick'] = True
+            if rng.random() < 0.1:
+                event['absorbed'] = rng.randint(0, 100)
+            if resources and rng.random() < 0.5:
+                event.update(resourceActor=rng.choice([1, 2]), hitPoints=rng.randint(0, 100), classResources=[{'amount': rng.randint(0, 1000), 'max': 1000, 'type': 0}])
+        events.append(event)
+    return events
+
+@pytest.fixture
+def metadata():
+    return MetaData()
+
+@pytest.fixture
+def make_metadata():
+    return MetaData
+
+@pytest.fixture
+def make_events():
+    return build_events
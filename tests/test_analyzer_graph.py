@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.analyzers.PixolClassAnalyzerGraph import PixolGraphBase
+
+def make_intervals(num_rows=500, seed=0):
+    # interval rows as the aura/dot graphs pass them to generate_polys: damage columns are missing on non-damage rows
+    rng = np.random.default_rng(seed)
+    poly_start = np.round(rng.uniform(0, 290, num_rows), 3)
+    amount = rng.integers(0, 200000, num_rows).astype(np.float64)
+    is_damage = rng.random(num_rows) < 0.7
+    amount[~is_damage] = np.nan
+    absorbed = np.where(rng.random(num_rows) < 0.2, rng.integers(1, 5000, num_rows), 0)
+    overkill = np.where(rng.random(num_rows) < 0.1, rng.integers(1, 5000, num_rows), 0)
+    resisted = np.where(rng.random(num_rows) < 0.1, rng.integers(1, 500, num_rows), 0)
+    return pd.DataFrame({
+        'polyStart': poly_start,
+        'polyEnd': poly_start + np.round(rng.uniform(0, 30, num_rows), 3),
+        'polyClip': rng.random(num_rows) < 0.3,
+        'polyStacks': rng.integers(0, 6, num_rows),
+        'amount': amount,
+        'hitTypeStr': np.where(is_damage, rng.choice(['NORMAL', 'CRIT', 'ABSORB'], num_rows), None),
+        'absorbed': absorbed,
+        'overkill': overkill,
+        'resisted': resisted,
+        'resistedRatio': resisted/10000,
+        'amountTotal': amount + absorbed + overkill,
+        'dmgMultiplier': np.where(is_damage, np.round(rng.uniform(0.5, 3), 4), np.nan),
+        'targetNameInstanceUnique': rng.choice(['Boss-1', 'Add-001-6', None], num_rows),
+        'abilityGameName': rng.choice(['Ignite', 'Living Bomb', None], num_rows),
+    }, index=rng.permutation(num_rows) + 100)
+
+COLUMN_SETS = [
+    None, # all
+    ['polyStart', 'polyEnd'],
+    ['polyStart', 'polyEnd', 'polyClip', 'abilityGameName'],
+    ['polyStart', 'polyEnd', 'polyStacks', 'polyClip', 'targetNameInstanceUnique'],
+    ['polyStart', 'polyEnd', 'amount', 'hitTypeStr', 'absorbed', 'overkill', 'resisted', 'resistedRatio', 'amountTotal'],
+]
+
+@pytest.mark.parametrize('columns', COLUMN_SETS)
+@pytest.mark.parametrize('kwargs', [
+    dict(y_center=2.5, y_height=0.8, max_stacks=1, linkedTo='ignite'),
+    dict(y_center=0.5, y_height=1, max_stacks=5, linkedTo=None),
+    dict(y_center=1.5, y_height=0.6, max_stacks=3, linkedTo=None, color=np.nan),
+])
+def test_generate_polys_matches_generate_poly(columns, kwargs, metadata):
+    df = make_intervals()
+    if columns is not None:
+        df = df[columns]
+    graph = PixolGraphBase(df, metadata, 1)
+    expected = df.apply(graph.generate_poly, axis=1, **kwargs)
+    out = graph.generate_polys(df, **kwargs)
+    assert out.index.equals(df.index)
+    assert out.tolist() == expected.tolist()
+
+def test_generate_polys_skips_rows_without_interval(metadata):
+    df = make_intervals(50)
+    df.loc[df.index[::3], 'polyStart'] = np.nan
+    graph = PixolGraphBase(df, metadata, 1)
+    out = graph.generate_polys(df, y_center=0.5, y_height=1)
+    assert out.tolist() == df.apply(graph.generate_poly, axis=1, y_center=0.5, y_height=1).tolist()
+    assert out.isna().sum() == len(df.index[::3])
@@ -0,0 +1,146 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.misc import EventTransitions
+from utils.analyzers.PixolClassAnalyzerGraph import DOT_DEBUFF_RULES, DOT_DEBUFF_RULES_CLIP_ON_REFRESH, IGNITE_DEBUFF_RULES, MERGED_DEBUFF_RULES, BUFF_RULES, BUFF_RULES_CLIP_ON_REFRESH
+
+KEYS = ['abilityGameID', 'sourceKey', 'targetKey']
+DEBUFF_TYPES = ['applydebuff', 'refreshdebuff', 'removedebuff', 'damage']
+BUFF_TYPES = ['applybuff', 'refreshbuff', 'removebuff']
+
+def make_aura_events(types, num_events=3000, seed=0):
+    # aura/dot events of a few groups, with repeated timestamps, gaps around 0.1 s and rows without a group (NaN key)
+    rng = np.random.default_rng(seed)
+    target_key = rng.choice([1, 2, 3, np.nan], num_events, p=[0.3, 0.3, 0.3, 0.1])
+    return pd.DataFrame({
+        'timestamp': np.cumsum(rng.choice([0, 0.05, 0.099, 0.1, 0.5, 2], num_events)),
+        'type': rng.choice(types, num_events),
+        'abilityGameID': rng.choice([12654, 413843], num_events),
+        'sourceKey': rng.choice([1, 2], num_events),
+        'targetKey': target_key,
+    })
+
+# the groupby().shift() chains EventTransitions replaces, as the graphs computed them
+def reference_dot_debuff(df, groupby_settings, show_clip_on_refresh):
+    df = df.assign(polyStart=np.nan, polyClip=False)
+    if show_clip_on_refresh:
+        mask = (df.groupby(groupby_settings)['type'].shift().isin(['applydebuff','refreshdebuff','damage'])) & (df.groupby(groupby_settings)['type'].shift(0) == 'damage')
+    else:
+        mask = (df.groupby(groupby_settings)['type'].shift().isin(['applydebuff','damage'])) & (df.groupby(groupby_settings)['type'].shift(0) == 'damage')
+    df.loc[mask,'polyStart'] = df.groupby(groupby_settings)['timestamp'].shift()
+
+    if show_clip_on_refresh:
+        mask = (df.groupby(groupby_settings)['type'].shift().isin(['damage','applydebuff','refreshdebuff'])) \
+            & (df.groupby(groupby_settings)['type'].shift(0).isin(['refreshdebuff','removedebuff'])) \
+            & (df.groupby(groupby_settings)['timestamp'].shift() != df.groupby(groupby_settings)['timestamp'].shift(0))
+    else:
+        mask = (df.groupby(groupby_settings)['type'].shift().isin(['damage','applydebuff'])) \
+            & (df.groupby(groupby_settings)['type'].shift(0).isin(['removedebuff'])) \
+            & (df.groupby(groupby_settings)['timestamp'].shift() != df.groupby(groupby_settings)['timestamp'].shift(0))
+    df.loc[mask,'polyStart'] = df.groupby(groupby_settings)['timestamp'].shift()
+    df.loc[mask,'polyClip'] = True
+    return df['polyStart'], df['polyClip']
+
+def reference_ignite_debuff(df, groupby_settings):
+    df = df.assign(polyStart=np.nan, polyClip=False)
+    mask = (df.groupby(groupby_settings)['type'].shift().isin(['applydebuff','damage'])) & (df.groupby(groupby_settings)['type'].shift(0) == 'damage')
+    df.loc[mask,'polyStart'] = df.groupby(groupby_settings)['timestamp'].shift()
+
+    mask = (df.groupby(groupby_settings)['type'].shift().isin(['damage','applydebuff'])) \
+        & (df.groupby(groupby_settings)['type'].shift(0).isin(['removedebuff'])) \
+        & (df.groupby(groupby_settings)['timestamp'].shift() != df.groupby(groupby_settings)['timestamp'].shift(0))
+    df.loc[mask,'polyStart'] = df.groupby(groupby_settings)['timestamp'].shift()
+    df.loc[mask,'polyClip'] = True
+
+    mask = (df.groupby(groupby_settings)['type'].shift(2).isin(['damage'])) \
+        & (df.groupby(groupby_settings)['type'].shift().isin(['removedebuff'])) \
+        & (df.groupby(groupby_settings)['type'].shift(0).isin(['damage'])) \
+        & ((df.groupby(groupby_settings)['timestamp'].shift(0) - df.groupby(groupby_settings)['timestamp'].shift()) < 0.1)
+    df.loc[mask,'polyStart'] = df.groupby(groupby_settings)['timestamp'].shift(2)
+
+    mask = (df.groupby(groupby_settings)['type'].shift(1).isin(['damage'])) \
+        & (df.groupby(groupby_settings)['type'].shift(0).isin(['removedebuff'])) \
+        & (df.groupby(groupby_settings)['type'].shift(-1).isin(['damage'])) \
+        & ((df.groupby(groupby_settings)['timestamp'].shift(-1) - df.groupby(groupby_settings)['timestamp'].shift(0)) < 0.1)
+    df.loc[mask,'polyStart'] = np.nan
+    df.loc[mask,'polyClip'] = False
+    return df['polyStart'], df['polyClip']
+
+def reference_merged_debuff(df):
+    df = df.assign(polyStart=np.nan)
+    mask = (df.groupby(KEYS)['type'].shift().isin(['applydebuff','refreshdebuff'])) & (df.groupby(KEYS)['type'].shift(0).isin(['refreshdebuff','removedebuff']))
+    df.loc[mask,'polyStart'] = df.groupby(KEYS)['timestamp'].shift()
+    return df['polyStart']
+
+def reference_buff(df, show_clip_on_refresh):
+    # (polyStart, polyClip, polyEnd set to the fight end, rows of a trailing refreshbuff)
+    df = df.assign(polyStart=np.nan, polyClip=False, polyEnd=np.nan)
+    first = df.reset_index().groupby(KEYS).nth(0).reset_index()['index']
+    idx = first[df.loc[first,'type'].isin(['removebuff','refreshbuff']).to_numpy()]
+    df.loc[idx, 'polyStart'] = 0
+
+    last = df.reset_index().groupby(KEYS).nth(-1).reset_index()['index']
+    idx = last[df.loc[last,'type'].isin(['applybuff']).to_numpy()]
+    df.loc[idx, 'polyStart'] = df.loc[idx, 'timestamp']
+    df.loc[idx, 'polyEnd'] = 1000
+
+    mask = (df.groupby(KEYS)['type'].shift().isin(['applybuff','refreshbuff'])) & (df.groupby(KEYS)['type'].shift(0).isin(['refreshbuff','removebuff']))
+    df.loc[mask,'polyStart'] = df.groupby(KEYS)['timestamp'].shift()
+    if show_clip_on_refresh:
+        mask = (df.groupby(KEYS)['type'].shift().isin(['applybuff','refreshbuff'])) & (df.groupby(KEYS)['type'].shift(0).isin(['refreshbuff']))
+        df.loc[mask,'polyClip'] = True
+    idx_refresh = last[df.loc[last,'type'].isin(['refreshbuff']).to_numpy()]
+    return df['polyStart'], df['polyClip'], df['polyEnd'].notna(), sorted(idx_refresh)
+
+def assert_intervals_equal(poly_start, poly_clip, expected_start, expected_clip):
+    np.testing.assert_array_equal(poly_start, expected_start.to_numpy(dtype=np.float64))
+    np.testing.assert_array_equal(poly_clip, expected_clip.to_numpy(dtype=bool))
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+@pytest.mark.parametrize('show_clip_on_refresh', [False, True])
+def test_dot_debuff_rules_match_shift_chains(seed, show_clip_on_refresh):
+    df = make_aura_events(DEBUFF_TYPES, seed=seed)
+    rules = show_clip_on_refresh and DOT_DEBUFF_RULES_CLIP_ON_REFRESH or DOT_DEBUFF_RULES
+    for groupby_settings in [KEYS, ['sourceKey', 'targetKey']]:
+        assert_intervals_equal(*EventTransitions(df, groupby_settings).get_intervals(rules), *reference_dot_debuff(df, groupby_settings, show_clip_on_refresh))
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_ignite_debuff_rules_match_shift_chains(seed):
+    df = make_aura_events(DEBUFF_TYPES, seed=seed)
+    # ignore_ability_id_grouping groups by source and target only
+    for groupby_settings in [KEYS, ['sourceKey', 'targetKey']]:
+        poly_start, poly_clip = EventTransitions(df, groupby_settings).get_intervals(IGNITE_DEBUFF_RULES)
+        expected_start, expected_clip = reference_ignite_debuff(df, groupby_settings)
+        assert_intervals_equal(poly_start, poly_clip, expected_start, expected_clip)
+        assert expected_start.notna().sum() > 0
+
+@pytest.mark.parametrize('seed', [0, 1])
+def test_merged_debuff_rules_match_shift_chains(seed):
+    df = make_aura_events(DEBUFF_TYPES, seed=seed)
+    np.testing.assert_array_equal(EventTransitions(df, KEYS).get_intervals(MERGED_DEBUFF_RULES)[0], reference_merged_debuff(df).to_numpy())
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+@pytest.mark.parametrize('show_clip_on_refresh', [False, True])
+def test_buff_rules_match_shift_chains(seed, show_clip_on_refresh):
+    # few events per group, so groups often start with a remove/refresh or end with an apply/refresh
+    df = make_aura_events(BUFF_TYPES, num_events=300, seed=seed)
+    expected_start, expected_clip, expected_end, expected_refresh = reference_buff(df, show_clip_on_refresh)
+
+    # as PixolBuff.generate_graph_df does
+    events = EventTransitions(df, KEYS)
+    poly_start = np.where(events.match({1: [None], 0: ['removebuff','refreshbuff']}), 0, np.nan)
+    mask_end = events.match({0: ['applybuff'], -1: [None]})
+    poly_start[mask_end] = df['timestamp'].to_numpy(dtype=np.float64)[mask_end]
+    rules = show_clip_on_refresh and BUFF_RULES_CLIP_ON_REFRESH or BUFF_RULES
+    assert_intervals_equal(*events.get_intervals(rules, poly_start=poly_start), expected_start, expected_clip)
+    np.testing.assert_array_equal(mask_end, expected_end.to_numpy())
+    assert np.flatnonzero(events.match({0: ['refreshbuff'], -1: [None]})).tolist() == expected_refresh
+    assert (expected_start == 0).any() and mask_end.any() and len(expected_refresh) > 0
+
+def test_shift_matches_groupby_shift():
+    df = make_aura_events(DEBUFF_TYPES)
+    events = EventTransitions(df, KEYS)
+    # not periods=0: pandas returns the values of rows without a group there, the rules always pair it with a lag that is missing on them
+    for periods in [-2, -1, 1, 3]:
+        np.testing.assert_array_equal(events.shift(periods), df.groupby(KEYS)['timestamp'].shift(periods).to_numpy())
@@ -0,0 +1,180 @@
+import gc
+import json
+import asyncio
+
+import pytest
+
+from utils.wcl.PixolWCLClient import WCLClient
+from utils.wcl.PixolWCLCache import WCLQueryCache
+from utils.wcl.PixolWCLTransport import WCLTransport, WCLResponse
+from utils.wcl.PixolWCLScheduler import WCLRequestScheduler, PRIORITY_INTERACTIVE, PRIORITY_BATCH
+from utils.wcl.PixolWCLReplay import REPLAY_TOKEN, parse_events_selections
+from utils.wcl.PixolWCLQuery import estimate_metadata_query, estimate_events_page
+
+STREAMS = {
+    'player': dict(source_id=1),
+    'combatantInfo': dict(source_id=1, data_type='CombatantInfo'),
+}
+
+def fight_events(make_events, fight_ids):
+    return [e for i in fight_ids for e in make_events(30, seed=i, fight_id=i)]
+
+def fight_timestamps(events, fight_id):
+    start_time = min(e['timestamp'] for e in events if e['fight'] == fight_id)
+    return [(e['timestamp'] - start_time)/1000 for e in events if e['fight'] == fight_id]
+
+class FakeWCLTransport(WCLTransport):
+    # upstream API answering every events selection with all of its (fightIDs filtered) events in a single page,
+    # and other report queries with the report metadata. Whole-report events queries (no fightIDs) wait for release
+    # and fail if fail_report is set.
+    def __init__(self, events, fail_report=False, report=None):
+        self.events = events
+        self.report = report
+        self.fail_report = fail_report
+        self.release = asyncio.Event()
+        self.queries = []
+
+    async def post(self, url, json_body=None, data=None, headers=None):
+        if json_body is None:
+            return WCLResponse(200, json.dumps(REPLAY_TOKEN).encode('utf-8'))
+        query = json_body['query']
+        if 'rateLimitData' in query:
+            body = {'data': {'rateLimitData': {'limitPerHour': 3600, 'pointsSpentThisHour': 0, 'pointsResetIn': 3600}}}
+            return WCLResponse(200, json.dumps(body).encode('utf-8'))
+
+        selections = parse_events_selections(query)
+        fight_ids = {args.get('fightIDs') for _, args, _ in selections}
+        self.queries.append(fight_ids)
+        if not selections:
+            return WCLResponse(200, json.dumps({'data': {'reportData': {'report': self.report}}}).encode('utf-8'))
+        if None in fight_ids:
+            await self.release.wait()
+            if self.fail_report:
+                raise ConnectionError("prefetch failed")
+        report = {}
+        for alias, args, fields in selections:
+            data = [e for e in self.events if args.get('fightIDs') in [None, f"[{e['fight']}]"]]
+            if args.get('dataType') == 'CombatantInfo':
+                data = list({e['fight']: dict(e, type='combatantinfo') for e in reversed(data)}.values()) # one per fight
+            report[alias] = {'data': data}
+            if 'nextPageTimestamp' in fields:
+                report[alias]['nextPageTimestamp'] = None
+        return WCLResponse(200, json.dumps({'data': {'reportData': {'report': report}}}).encode('utf-8'))
+
+class RecordingScheduler(WCLRequestScheduler):
+    def __init__(self):
+        super().__init__()
+        self.priorities = []
+        self.costs = []
+
+    async def acquire(self, priority=PRIORITY_INTERACTIVE, cost=1):
+        self.priorities.append(priority)
+        self.costs.append(cost)
+        await super().acquire(priority=priority, cost=cost)
+
+def run_client(test, transport, cache=None):
+    async def run():
+        client = WCLClient(client_id="test-prefetch", transport=transport, scheduler=RecordingScheduler(), cache=cache)
+        try:
+            return await test(client)
+        finally:
+            await client.close()
+    return asyncio.run(run())
+
+def fetch_fight(client, metadata, fight_id):
+    return client._fetch_events_batched("abc", STREAMS, fight_id=fight_id, metadata=metadata)
+
+def test_prefetch_serves_finished_fights_from_memory(make_metadata, make_events):
+    async def test(client):
+        metadata = make_metadata([1, 2])
+        transport.release.set()
+        await client.prefetch_report("abc", STREAMS, metadata)
+        assert client._scheduler.priorities == [PRIORITY_BATCH]
+        out = await fetch_fight(client, metadata, 2)
+        assert transport.queries == [{None}]
+        assert out['player'].events.timestamp.tolist() == fight_timestamps(transport.events, 2)
+        assert len(out['combatantInfo']) == 1
+
+        # logged after the prefetch started (e.g. after a refresh): downloaded instead of served as an empty fight
+        transport.events += fight_events(make_events, [3])
+        out = await fetch_fight(client, make_metadata([1, 2, 3]), 3)
+        assert transport.queries == [{None}, {'[3]'}]
+        assert len(out['player'].events) == 30
+    transport = FakeWCLTransport(fight_events(make_events, [1, 2]))
+    run_client(test, transport)
+
+def test_prefetch_skips_live_reports(make_metadata, make_events):
+    async def test(client):
+        assert client.prefetch_report("abc", STREAMS, make_metadata([1, 2], finished=False)) is None
+        out = await fetch_fight(client, make_metadata([1, 2], finished=False), 1)
+        assert transport.queries == [{'[1]'}]
+        assert len(out['player'].events) == 30
+    transport = FakeWCLTransport(fight_events(make_events, [1, 2]))
+    run_client(test, transport)
+
+def test_fetch_does_not_wait_for_running_prefetch(make_metadata, make_events):
+    async def test(client):
+        metadata = make_metadata([1, 2])
+        task = client.prefetch_report("abc", STREAMS, metadata)
+        out = await asyncio.wait_for(fetch_fight(client, metadata, 1), 5)
+        assert len(out['player'].events) == 30
+        assert not task.done()
+        assert client._scheduler.priorities == [PRIORITY_BATCH, PRIORITY_INTERACTIVE]
+
+        # only the current report is kept, the previous prefetch is cancelled
+        transport.release.set()
+        task_next = client.prefetch_report("def", STREAMS, metadata)
+        await asyncio.sleep(0)
+        assert task.cancelled()
+        assert client._prefetched['report_code'] == "def"
+        await task_next
+    transport = FakeWCLTransport(fight_events(make_events, [1, 2]))
+    run_client(test, transport)
+
+def test_failed_prefetch_is_dropped_and_retrieved(make_metadata, make_events):
+    errors = []
+    async def test(client):
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: errors.append(context))
+        metadata = make_metadata([1, 2])
+        transport.release.set()
+        task = client.prefetch_report("abc", STREAMS, metadata)
+        await asyncio.wait([task])
+        await asyncio.sleep(0)
+        assert client._prefetched is None
+        del task
+        gc.collect()
+        out = await fetch_fight(client, metadata, 1)
+        assert len(out['player'].events) == 30
+    transport = FakeWCLTransport(fight_events(make_events, [1, 2]), fail_report=True)
+    run_client(test, transport)
+    assert errors == []
+
+@pytest.mark.parametrize('finished', [False, True])
+def test_cache_only_keeps_finished_reports(tmp_path, finished, make_metadata, make_events):
+    async def test(client):
+        for _ in range(2):
+            metadata = await client._fetch_metadata("abc")
+            assert metadata.fights.index.tolist() == [1, 2]
+            await fetch_fight(client, metadata, 1)
+    transport = FakeWCLTransport(fight_events(make_events, [1, 2]), report=make_metadata([1, 2], finished=finished).rawData)
+    cache = WCLQueryCache(str(tmp_path / "cache.sqlite"))
+    try:
+        run_client(test, transport, cache=cache)
+        assert cache.is_report_immutable("abc") == finished
+    finally:
+        cache.close()
+    # live reports are queried again every time, finished ones are served from the cache
+    assert transport.queries == (finished and [set(), {'[1]'}] or [set(), {'[1]'}]*2)
+
+def test_requests_are_charged_their_estimated_points(make_metadata, make_events):
+    async def test(client):
+        metadata = await client._fetch_metadata("abc")
+        streams = dict(STREAMS, misc=dict(filter_exp='ability.id in (1490)'))
+        await client._fetch_events_batched("abc", streams, fight_id=1, metadata=metadata)
+        # one player stream (~40 events/s) and one raid-wide stream (~400 events/s) of the fight in one page request
+        duration = metadata.fights.loc[1, 'duration']
+        expected = [estimate_metadata_query().points, estimate_events_page(duration, 40) + estimate_events_page(duration, 400)]
+        assert client._scheduler.costs == pytest.approx(expected)
+        assert client._scheduler.tokens == pytest.approx(3600 - sum(expected))
+    transport = FakeWCLTransport(fight_events(make_events, [1, 2]), report=make_metadata([1, 2]).rawData)
+    run_client(test, transport)
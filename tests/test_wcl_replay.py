@@ -0,0 +1,118 @@
+import json
+import asyncio
+
+import pandas as pd
+
+from utils.wcl.PixolWCLClient import WCLClient
+from utils.wcl.PixolWCLTransport import WCLTransport, WCLResponse
+from utils.wcl.PixolWCLReplay import WCLReplayStore, WCLReplayServer, WCLRecordingTransport, WCLReplayTransport, REPLAY_TOKEN, split_page, get_fixture_key, parse_events_selections
+
+QUERY = """
+query {
+    reportData {
+        report(code: "abc") {
+            events(startTime: %s, endTime: 100, sourceID: 1, limit: 10000) { data nextPageTimestamp }
+        }
+    }
+}
+"""
+
+def write_fixture(path, events, start_timestamp=0):
+    query = QUERY % start_timestamp
+    body = {'data': {'reportData': {'report': {'events': {'data': events, 'nextPageTimestamp': None}}}}}
+    with open(path / f"{get_fixture_key(query)}.json", 'w') as f:
+        json.dump({'query': query, 'status': 200, 'body': json.dumps(body)}, f)
+
+def page_through(store, max_pages=100):
+    out = []
+    ts = 0
+    for _ in range(max_pages):
+        status, body = store.query(QUERY % ts)
+        assert status == 200
+        page = body['data']['reportData']['report']['events']
+        out += page['data']
+        if page['nextPageTimestamp'] is None:
+            return out
+        ts = page['nextPageTimestamp']
+    raise AssertionError("pagination did not finish")
+
+def test_split_page_ends_on_timestamp_boundary():
+    events = [{'timestamp': t} for t in [1, 2, 2, 3]]
+    assert split_page(events, 2) == (events[:1], 2)
+    assert split_page(events, 10) == (events, None)
+
+def test_split_page_emits_full_timestamp_group():
+    events = [{'timestamp': t} for t in [5, 5, 5, 6]]
+    assert split_page(events, 2) == (events[:3], 6)
+    assert split_page(events[:3], 2) == (events[:3], None)
+
+def test_store_pages_repeated_timestamps_once(tmp_path):
+    events = [{'timestamp': t, 'type': 'cast', 'sourceID': 1, 'idx': i} for i, t in enumerate([1, 2, 2, 3, 5, 5, 5, 6])]
+    write_fixture(tmp_path, events)
+    for page_size in [1, 2, 3, 10]:
+        store = WCLReplayStore(str(tmp_path), page_size=page_size)
+        assert [e['idx'] for e in page_through(store)] == list(range(len(events)))
+
+def test_store_keeps_repeated_events_of_a_page(tmp_path):
+    # WCL can return identical events more than once in a page, overlapping fixtures repeat events of each other
+    events = [{'timestamp': t, 'type': 'cast', 'sourceID': 1} for t in [1, 2, 2, 2, 3, 4]]
+    write_fixture(tmp_path, events[:5])
+    write_fixture(tmp_path, events[1:], start_timestamp=2)
+    for page_size in [1, 2, 10]:
+        store = WCLReplayStore(str(tmp_path), page_size=page_size)
+        assert page_through(store) == events
+
+class FakeWCLTransport(WCLTransport):
+    # upstream API answering every events selection with all of its events in a single page
+    def __init__(self, events):
+        self.events = events
+
+    async def post(self, url, json_body=None, data=None, headers=None):
+        if json_body is None:
+            return WCLResponse(200, json.dumps(REPLAY_TOKEN).encode('utf-8'))
+        query = json_body['query']
+        if 'rateLimitData' in query:
+            body = {'data': {'rateLimitData': {'limitPerHour': 3600, 'pointsSpentThisHour': 0, 'pointsResetIn': 3600}}}
+        else:
+            report = {}
+            for alias, args, fields in parse_events_selections(query):
+                report[alias] = {'data': [e for e in self.events if e['timestamp'] >= float(args.get('startTime', 0))]}
+                if 'nextPageTimestamp' in fields:
+                    report[alias]['nextPageTimestamp'] = None
+            body = {'data': {'reportData': {'report': report}}}
+        return WCLResponse(200, json.dumps(body).encode('utf-8'))
+
+STREAMS = {
+    'player': dict(source_id=1),
+    'misc': dict(filter_exp='ability.id in (1490)'),
+}
+
+def make_events():
+    timestamps = [1000, 1010, 1010, 1020, 1050, 1050, 1050, 1050, 1060, 1100]
+    return [{'timestamp': t, 'type': 'cast', 'sourceID': 1, 'targetID': 5, 'abilityGameID': 133 + i, 'fight': 1} for i, t in enumerate(timestamps)]
+
+def fetch_events(client):
+    async def fetch():
+        try:
+            return await client._fetch_events_batched("abc", STREAMS)
+        finally:
+            await client.close()
+    return asyncio.run(fetch())
+
+def test_replay_transport_serves_recorded_responses(tmp_path):
+    recorded = fetch_events(WCLClient(client_id="test-record", transport=WCLRecordingTransport(FakeWCLTransport(make_events()), str(tmp_path))))
+    replayed = fetch_events(WCLClient(client_id="test-replay", transport=WCLReplayTransport(str(tmp_path))))
+    for alias in STREAMS:
+        assert len(recorded[alias].events) == len(make_events())
+        pd.testing.assert_frame_equal(replayed[alias].events, recorded[alias].events)
+
+def test_replay_server_repaginates_recorded_events(tmp_path):
+    recorded = fetch_events(WCLClient(client_id="test-record-server", transport=WCLRecordingTransport(FakeWCLTransport(make_events()), str(tmp_path))))
+    server = WCLReplayServer(str(tmp_path), port=0, page_size=3).start()
+    try:
+        served = fetch_events(WCLClient(client_id="test-replay-server", base_url=server.base_url, token_url=server.token_url))
+    finally:
+        server.stop()
+    for alias in STREAMS:
+        pd.testing.assert_frame_equal(served[alias].events, recorded[alias].events)
+    assert server.store.points_spent >= 4 # several pages of 3 events
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+
+from utils.analyzers.PixolClassAnalyzerGraph import PixolGraphBase
+from utils.wcl.PixolWCLReport import WCLEventIndex, WCLReportFightData, fit_memory_budget
+
+def test_compact_keeps_summed_amounts_exact(metadata, make_events):
+    fight_data = WCLReportFightData(make_events(5000, amount=1234567), metadata, 1, derived_columns=None)
+    expected = fight_data.events.groupby('targetID').amountTotal.sum()
+    fit_memory_budget([fight_data])
+    events = fight_data.events
+    assert events['amount'].dtype != np.float32
+    assert events['amountTotal'].dtype != np.float32
+    totals = events.groupby('targetID').amountTotal.sum()
+    assert totals.dtype == np.float64
+    assert (totals > 2**24).all()
+    pd.testing.assert_series_equal(totals, expected)
+
+def poll(events, num_events, last_timestamp=None):
+    # events a live poll returns: the first num_events, from last_timestamp on (inclusive, like nextPageTimestamp)
+    return [e for e in events[:num_events] if last_timestamp is None or e['timestamp'] >= last_timestamp]
+
+def test_append_events_matches_full_fetch(metadata, make_events):
+    events = make_events(3000, seed=1)
+    expected = WCLReportFightData(list(events), metadata, 1, derived_columns=None)
+
+    fight_data = WCLReportFightData(poll(events, 1000), metadata, 1, derived_columns=None)
+    for num_events in [1000, 1001, 2000, 2999, 3000, 3000]:
+        num_before = len(fight_data.events)
+        num_new = fight_data.append_events(WCLReportFightData(poll(events, num_events, fight_data.last_timestamp), metadata, 1))
+        assert num_new == len(fight_data.events) - num_before
+
+    # columns first seen in a later poll come after the derived ones, so only the column order may differ
+    pd.testing.assert_frame_equal(fight_data.events, expected.events, check_categorical=False, check_like=True)
+    assert (fight_data.last_timestamp, fight_data.num_last_timestamp) == (expected.last_timestamp, expected.num_last_timestamp)
+    assert fight_data.rawData == events
+
+INDEX_QUERIES = [
+    {},
+    {'types': ['damage']},
+    {'types': ['cast', 'applybuff'], 'ability_ids': [133]},
+    {'ability_ids': [413843, 11366], 'source_ids': [1], 'target_ids': [5, -1]},
+    {'types': ['damage'], 'ability_ids': [133, 999], 'target_ids': [6]},
+    {'types': ['resourcechange']},
+    {'source_ids': []},
+]
+
+def isin_positions(events, types=None, ability_ids=None, source_ids=None, target_ids=None):
+    # the boolean scan the index replaces
+    mask = pd.Series(True, index=events.index)
+    for column, values in [('type', types), ('abilityGameID', ability_ids), ('sourceID', source_ids), ('targetID', target_ids)]:
+        if values is not None:
+            mask = mask & events[column].isin(values)
+    return np.flatnonzero(mask)
+
+def test_event_index_matches_isin_masks(metadata, make_events):
+    fight_data = WCLReportFightData(make_events(3000, seed=2), metadata, 1)
+    for compact in [False, True]:
+        if compact:
+            fight_data.compact(max_category_ratio=1)
+            assert isinstance(fight_data.events['type'].dtype, pd.CategoricalDtype)
+        for query in INDEX_QUERIES:
+            np.testing.assert_array_equal(fight_data.query_positions(**query), isin_positions(fight_data.events, **query))
+    # plain strings, e.g. a type column read back from the store
+    events = fight_data.events.astype({'type': str})
+    index = WCLEventIndex(events)
+    for query in INDEX_QUERIES:
+        np.testing.assert_array_equal(index.query(**query), isin_positions(events, **query))
+
+def test_graph_get_rows_same_with_and_without_index(metadata, make_events):
+    fight_data = WCLReportFightData(make_events(3000, seed=3), metadata, 1)
+    graph = PixolGraphBase(fight_data.events, metadata, 1)
+    for query in INDEX_QUERIES:
+        graph.set_event_index(None)
+        expected = graph.get_rows(**query)
+        graph.set_event_index(fight_data.get_event_index())
+        pd.testing.assert_frame_equal(graph.get_rows(**query), expected)
@@ -0,0 +1,98 @@
+import copy
+import time
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from utils.wcl.PixolWCLReport import WCLReportMetaData
+
+def make_player(player_id, player_type, specs):
+    return dict(name=f"p{player_id}", id=player_id, guid=1000+player_id, type=player_type, server='s', icon=f"{player_type}-x", specs=specs,
+        minItemLevel=1, maxItemLevel=2, potionUse=0, healthstoneUse=0, combatantInfo=[])
+
+def make_metadata(dps=None, healers=None, tanks=None):
+    fights = [
+        dict(id=1, encounterID=0, name='Trash', startTime=0, endTime=30000, kill=None, difficulty=None, phaseTransitions=None),
+        dict(id=2, encounterID=7, name='Boss', startTime=60000, endTime=180000, kill=False, difficulty=3, phaseTransitions=[{'id': 1, 'startTime': 60000}, {'id': 2, 'startTime': 90000}]),
+        dict(id=3, encounterID=7, name='Boss', startTime=240000, endTime=420500, kill=True, difficulty=3, phaseTransitions=[]),
+    ]
+    if dps is None:
+        dps = [
+            make_player(1, 'Mage', [{'spec': 'Fire', 'role': 'dps'}]),
+            make_player(2, 'Mage', [{'spec': 'Fire'}, {'spec': 'Fire'}]),
+            make_player(3, 'Mage', [{'spec': 'Arcane'}]),
+            make_player(4, 'Priest', [{'spec': 'Shadow'}, {'spec': 'Holy'}]),
+            make_player(5, 'Mage', []),
+        ]
+    return dict(
+        title='t', guild=None, startTime=1700000000000, fights=fights,
+        masterData=dict(abilities=[dict(gameID=133, name='Fireball', icon='fb.jpg')], actors=[dict(id=1, name='p1', type='Player')]),
+        playerDetails=dict(data=dict(playerDetails=dict(dps=dps, healers=healers or [], tanks=tanks or []))),
+    )
+
+def test_class_spec_keeps_int_ids_with_empty_roles():
+    metadata = WCLReportMetaData(make_metadata())
+    assert metadata.df_mage_fire['id'].tolist() == [1, 2]
+    assert metadata.df_mage_fire['id'].dtype.kind == 'i'
+    assert metadata.df_mage_fire['guid'].dtype.kind == 'i'
+    assert [f"player{player_id}" for player_id in metadata.df_mage_fire.id] == ['player1', 'player2']
+
+def test_class_spec_without_players():
+    metadata = WCLReportMetaData(dict(make_metadata(), playerDetails={}))
+    assert len(metadata.df_mage_fire) == 0
+    assert 'id' in metadata.df_mage_fire.columns
+
+def test_class_spec_player_in_several_roles():
+    raw = make_metadata(healers=[make_player(4, 'Priest', [{'spec': 'Holy'}])])
+    metadata = WCLReportMetaData(copy.deepcopy(raw))
+    assert metadata.get_class_spec('Priest', 'Holy')['id'].tolist() == [4, 4]
+    assert metadata.get_class_spec('Priest', 'Holy')['id'].dtype.kind == 'i'
+    assert metadata.rawData == raw
+
+# row-wise versions of the encounter names, phase transitions and class specs the metadata computes with whole columns
+def reference_formatted_name(x, report_start_time):
+    durationInSeconds = (x['endTime']-x['startTime'])//1000
+    return f"{datetime.fromtimestamp((x['startTime']+report_start_time)/1000).strftime('%I:%M %p')} - {x['name']}{x['difficulty'] == 4 and ' [H]' or ''} ({durationInSeconds//60:0d}:{durationInSeconds%60:02d}, {(x['kill'] and 'Kill') or ('Wipe ' + str(x['wipeCounter']))})"
+
+def reference_phase_transitions(x):
+    return x['phaseTransitions'] and [{'id': datum['id'], 'timestamp': (datum['startTime'] - x['startTime'])/1000} for datum in x['phaseTransitions']]
+
+def reference_class_spec(metadata, c, s):
+    def filter_class_spec(d):
+        return d['type'] == c and any(('spec' in spec) and spec['spec'] == s for spec in d['specs'])
+    return pd.concat([role[role.apply(filter_class_spec, axis=1)] for role in [metadata.dps, metadata.healers, metadata.tanks]])
+
+@pytest.fixture(params=['UTC', 'America/New_York'])
+def timezone(request, monkeypatch):
+    monkeypatch.setenv('TZ', request.param)
+    time.tzset()
+    yield request.param
+    monkeypatch.undo()
+    time.tzset()
+
+@pytest.mark.parametrize('report_start_time', [1700000000000, 1699160000000]) # the second one spans the end of DST in New York
+@pytest.mark.parametrize('include_all_fights', [False, True])
+def test_metadata_matches_row_wise_reference(timezone, report_start_time, include_all_fights):
+    raw = make_metadata(
+        healers=[make_player(6, 'Priest', [{'spec': 'Holy'}]), make_player(4, 'Priest', [{'spec': 'Holy'}])],
+        tanks=[make_player(7, 'Warrior', [{'spec': 'Protection'}])],
+    )
+    raw['startTime'] = report_start_time
+    raw['fights'] += [
+        dict(id=4, encounterID=8, name='Other Boss', startTime=3600000, endTime=3659000, kill=False, difficulty=4, phaseTransitions=None),
+        dict(id=5, encounterID=7, name='Boss', startTime=7200000, endTime=7800000, kill=False, difficulty=3, phaseTransitions=[{'id': 1, 'startTime': 7200000}]),
+    ]
+    metadata = WCLReportMetaData(copy.deepcopy(raw), includeAllFightsAsEncounters=include_all_fights)
+
+    encounters = metadata.encounters
+    assert encounters.index.tolist() == (include_all_fights and [1, 2, 3, 4, 5] or [2, 3, 4, 5])
+    assert encounters['formattedName'].tolist() == [reference_formatted_name(x, report_start_time) for _, x in encounters.iterrows()]
+    fights = pd.DataFrame(raw['fights']).set_index('id').loc[encounters.index]
+    assert encounters['phaseTransitions'].tolist() == [reference_phase_transitions(x) for _, x in fights.iterrows()]
+    for c, s in [('Mage', 'Fire'), ('Mage', 'Arcane'), ('Priest', 'Holy'), ('Priest', 'Shadow'), ('Warrior', 'Protection'), ('Mage', 'Frost')]:
+        expected = reference_class_spec(metadata, c, s)
+        if len(expected):
+            pd.testing.assert_frame_equal(metadata.get_class_spec(c, s), expected)
+        else:
+            assert len(metadata.get_class_spec(c, s)) == 0
@@ -0,0 +1,20 @@
+import pytest
+
+from utils.wcl.PixolWCLReport import WCLReportFightData
+
+pytest.importorskip('pyarrow')
+from utils.wcl.PixolWCLStore import WCLFightStore
+
+@pytest.mark.parametrize('format', ['arrow', 'parquet'])
+def test_round_trip_restores_dtypes(tmp_path, format, metadata, make_events):
+    fight_data = WCLReportFightData(make_events(200, resources=True), metadata, 1, derived_columns=None)
+    store = WCLFightStore(str(tmp_path), format=format)
+    streams = {'player': dict(source_id=1)}
+    store.save_streams('abc', 1, streams, {'player': fight_data})
+    loaded = store.load_streams('abc', 1, streams, metadata=metadata)['player'].events
+
+    assert loaded.columns.tolist() == fight_data.events.columns.tolist()
+    assert loaded.dtypes.astype(str).to_dict() == fight_data.events.dtypes.astype(str).to_dict()
+    assert loaded['classResources'].tolist() == fight_data.events['classResources'].tolist()
+    assert all(isinstance(v, list) for v in loaded['classResources'].dropna())
+    assert loaded['resourceActorID'].tolist() == fight_data.events['resourceActorID'].tolist()
@@ -2,34 +2,36 @@ import pandas as pd
 import numpy as np
 from utils.misc import dict_deep_update, get_mmss, wrap_trtd, merge_overlapping_intervals, get_idx_from_bool_series
 
-def isAuraActive(df, df_auras, debuffSpellID, auraType="debuff", targetID=None):
+def isAuraActive(df, df_auras, debuffSpellID, auraType="debuff", targetID=None, event_index=None):
 
     ## Set up df_auras
+    if event_index is not None and event_index.num_rows == len(df_auras):
+        df_auras = df_auras.iloc[event_index.query(ability_ids=[debuffSpellID], types=[f"apply{auraType}",f"remove{auraType}"])]
     mask = (df_auras['abilityGameID'] == debuffSpellID) & (df_auras['type'].isin([f"apply{auraType}",f"remove{auraType}"]))
-    df_auras = df_auras.loc[mask,['type','abilityGameID','sourceNameInstanceUnique','targetNameInstanceUnique','targetID']].copy()
+    df_auras = df_auras.loc[mask,['type','abilityGameID','sourceKey','targetKey','targetID']].copy()
     df_auras['idx'] = df_auras.index
 
     # [np.nan, 'applydebuff'] -> ['removedebuff'] (np.nan means applydebuff occured before the log started)
-    mask = (df_auras.groupby(['abilityGameID','sourceNameInstanceUnique','targetNameInstanceUnique'])['type'].shift().isin([np.nan, f"apply{auraType}"])) & (df_auras.groupby(['abilityGameID','sourceNameInstanceUnique','targetNameInstanceUnique'])['type'].shift(0).isin([np.nan, f"remove{auraType}"]))
-    df_auras.loc[mask,'idxStart'] = df_auras.groupby(['abilityGameID','sourceNameInstanceUnique','targetNameInstanceUnique'])['idx'].shift()
+    mask = (df_auras.groupby(['abilityGameID','sourceKey','targetKey'])['type'].shift().isin([np.nan, f"apply{auraType}"])) & (df_auras.groupby(['abilityGameID','sourceKey','targetKey'])['type'].shift(0).isin([np.nan, f"remove{auraType}"]))
+    df_auras.loc[mask,'idxStart'] = df_auras.groupby(['abilityGameID','sourceKey','targetKey'])['idx'].shift()
     df_auras.loc[mask,'idxEnd'] = df_auras.loc[mask,'idx']
 
     # ['applybuff'] -> [np.nan] (np.nan means removebuff occured after log ended)
-    mask = (df_auras.groupby(['abilityGameID','sourceNameInstanceUnique','targetNameInstanceUnique'])['type'].shift(0) == "applybuff") & (df_auras.groupby(['abilityGameID','sourceNameInstanceUnique','targetNameInstanceUnique'])['type'].shift(-1).isna())
+    mask = (df_auras.groupby(['abilityGameID','sourceKey','targetKey'])['type'].shift(0) == "applybuff") & (df_auras.groupby(['abilityGameID','sourceKey','targetKey'])['type'].shift(-1).isna())
     df_auras.loc[mask,'idxStart'] = df_auras.loc[mask,'idx']
     df_auras.loc[mask,'idxEnd'] = 1e8
 
     mask = df_auras['idxStart'].notna() | df_auras['idxEnd'].notna()
 
     # copy subset
-    df_auras = df_auras.loc[mask,['targetNameInstanceUnique','targetID','idxStart','idxEnd']].copy()
+    df_auras = df_auras.loc[mask,['targetKey','targetID','idxStart','idxEnd']].copy()
     df_auras.loc[df_auras['idxStart'].isna(),'idxStart'] = -1
 
     ## set up mask condition
     if targetID:
         target_mask = df_auras['targetID'].values == targetID
     else:
-        target_mask = df['targetNameInstanceUnique'].values[:, np.newaxis] == df_auras['targetNameInstanceUnique'].values
+        target_mask = df['targetKey'].values[:, np.newaxis] == df_auras['targetKey'].values
     start_mask = df.index.values[:, np.newaxis] >= df_auras['idxStart'].values
     end_mask = df.index.values[:, np.newaxis] <= df_auras['idxEnd'].values
     within_range_mask = target_mask & start_mask & end_mask
@@ -41,8 +43,11 @@ def isAuraActive(df, df_auras, debuffSpellID, auraType="debuff", targetID=None):
     return within_range_mask.any(axis=1)
 
 class CombustionEstimatorClass:
-    def __init__(self, df, enableDebug=False):
+    def __init__(self, df, enableDebug=False, event_index=None):
         self.df_player = df
+        self.event_index = event_index
+        if event_index is not None and event_index.num_rows == len(df):
+            df = df.iloc[event_index.query(ability_ids=[11129,83853], types=["cast","applydebuff","removedebuff","damage"])]
         mask_castdebuff = (df['abilityGameID'].isin([11129,83853])) & (df['type'].isin(["cast","applydebuff","removedebuff"]))
         mask_tick = (df['abilityGameID'].isin([11129,83853])) & (df['type'] == 'damage') & (df['tick'] == True)
         mask = mask_castdebuff | mask_tick
@@ -67,18 +72,18 @@ class CombustionEstimatorClass:
             self.tsLastTick = 0
 
     def eventHandler_cast(self, idx, datum):
-        combustion = self.combustionTracker(datum.targetNameInstanceUnique, idx, enableDebug=self.enableDebug)
-        self.combustionTrackers[datum.targetNameInstanceUnique] = combustion
+        combustion = self.combustionTracker(datum.targetKey, idx, enableDebug=self.enableDebug)
+        self.combustionTrackers[datum.targetKey] = combustion
 
     def eventHandler_applydebuff(self, idx, datum):
-        combustion = self.combustionTrackers.get(datum.targetNameInstanceUnique)
+        combustion = self.combustionTrackers.get(datum.targetKey)
         if not combustion:
             return
         combustion.tsApplied = datum.timestamp
         combustion.tsLastTick = datum.timestamp
 
     def eventHandler_removedebuff(self, idx, datum):
-        combustion = self.combustionTrackers.get(datum.targetNameInstanceUnique)
+        combustion = self.combustionTrackers.get(datum.targetKey)
         if not combustion:
             return
         combustion.tsRemoved = datum.timestamp
@@ -110,7 +115,7 @@ class CombustionEstimatorClass:
         }
 
         # Remove
-        self.combustionTrackers[datum.targetNameInstanceUnique] = None
+        self.combustionTrackers[datum.targetKey] = None
 
         return results
 
@@ -118,7 +123,7 @@ class CombustionEstimatorClass:
         if datum.tick == False:
             return
         
-        combustion = self.combustionTrackers.get(datum.targetNameInstanceUnique)
+        combustion = self.combustionTrackers.get(datum.targetKey)
         if not combustion:
             return
         
@@ -128,8 +133,8 @@ class CombustionEstimatorClass:
     
     def estimate(self):
         mask = self.df['type'] == "cast"
-        self.df.loc[mask,'isLBActive'] = isAuraActive(self.df[mask], self.df_player, 44457, auraType="debuff")
-        self.df.loc[mask,'isPBActive'] = isAuraActive(self.df[mask], self.df_player, 11366, auraType="debuff") | isAuraActive(self.df[mask], self.df_player, 92315, auraType="debuff")
+        self.df.loc[mask,'isLBActive'] = isAuraActive(self.df[mask], self.df_player, 44457, auraType="debuff", event_index=self.event_index)
+        self.df.loc[mask,'isPBActive'] = isAuraActive(self.df[mask], self.df_player, 11366, auraType="debuff", event_index=self.event_index) | isAuraActive(self.df[mask], self.df_player, 92315, auraType="debuff", event_index=self.event_index)
 
         # self.df['is10%SPActive'] = True or isAuraActive(self.df, self.df_player, 53646, auraType="buff", targetID=obj_analyzer.player_id) | isAuraActive(self.df, self.df_player, 77747, auraType="buff", targetID=obj_analyzer.player_id)
         self.df.loc[mask,'spellPower'] = self.df.loc[mask,'spellPower']*1.1 # Combat Log doesn't track 10% SP buff properly at beginning of encounter, so just assume it's up.
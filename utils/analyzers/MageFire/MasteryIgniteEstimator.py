@@ -4,7 +4,7 @@ from utils.analyzers.PixolClassAnalyzerGraph import PixolGraphBase
 from utils.misc import dict_deep_update, get_mmss, wrap_trtd, merge_overlapping_intervals, get_idx_from_bool_series
 
 class masteryEstimatorClass:
-    def __init__(self, df_player, player_id, enableDebug=False):
+    def __init__(self, df_player, player_id, enableDebug=False, event_index=None):
         self.enableDebug = enableDebug
         self.igniteTrackers = {}
         self.masteryBuffTrackers = {}
@@ -61,6 +61,20 @@ class masteryEstimatorClass:
             87560 : {'mastery':   60, 'stacksMax':  1}, # Well Fed
         }
 
+        self.player_id = player_id
+        self.num_processed = 0 # rows of self.df already run through the event handlers
+        self.df = self._select_events(df_player, event_index)
+
+    def _select_events(self, df_player, event_index=None):
+        player_id = self.player_id
+        if event_index is not None and event_index.num_rows == len(df_player):
+            # only the player's own spells and the mastery buffs on the player are checked against the masks below
+            ability_ids = self.dict_spellIDs["CRITS"] + [self.dict_spellIDs[k] for k in ["IGNITE_DEBUFF","IGNITE_TICK","IMPACT_BUFF","FIRE_BLAST","COMBUSTION_CAST"]]
+            positions = np.union1d(
+                event_index.query(source_ids=[player_id], ability_ids=ability_ids),
+                event_index.query(target_ids=[player_id], ability_ids=list(self.dict_mastery_buffs.keys())),
+            )
+            df_player = df_player.iloc[positions]
         mask_source = df_player['sourceID'] == player_id
         mask_crits = (df_player['abilityGameID'].isin(self.dict_spellIDs["CRITS"])) & (df_player['hitTypeStr'] == "CRIT") & (df_player['tick'] == False)
         mask_crits_absorb_full = (df_player['abilityGameID'].isin(self.dict_spellIDs["CRITS"])) & (df_player['isAbsorbFull'] == True) & (df_player['tick'] == False)
@@ -69,18 +83,23 @@ class masteryEstimatorClass:
         mask_impact = (df_player['abilityGameID'].isin([self.dict_spellIDs["IMPACT_BUFF"],self.dict_spellIDs["FIRE_BLAST"]]))
         mask_combust_cast = (df_player['abilityGameID'] == self.dict_spellIDs["COMBUSTION_CAST"]) & (df_player['type'] == "cast")
         mask = ( (mask_source) & (mask_crits | mask_crits_absorb_full | mask_ignites | mask_impact | mask_combust_cast) ) | mask_mastery_buffs
-        self.df = df_player.loc[mask,['timestamp','type','targetNameInstanceUnique','abilityGameID','abilityGameName','hitTypeStr','isAbsorbFull','amountTotal']].copy()
-        self.df.loc[:,'m-igniteTicksRemaining'] = np.nan
-        self.df.loc[:,'m-igniteTicksMax'] = np.nan
-        self.df.loc[:,'m-igniteBank'] = np.nan
-        self.df.loc[:,'m-bankMaxTicks'] = np.nan
-        self.df.loc[:,'m-bankBeforeRefresh'] = np.nan
-        self.df.loc[:,'m-igniteListAmount'] = None
-        self.df.loc[:,'m-sum_crit'] = np.nan
-        self.df.loc[:,'m-mEstimate'] = np.nan
-        self.df.loc[:,'m-masteryOffset'] = np.nan
-        self.df.loc[:,'m-masteryEstimateInitial'] = np.nan
-        self.df.loc[:,'m-masteryEstimate'] = np.nan
+        df = df_player.loc[mask,['timestamp','type','targetNameInstanceUnique','targetKey','abilityGameID','abilityGameName','hitTypeStr','isAbsorbFull','amountTotal']].copy()
+        df.loc[:,'m-igniteTicksRemaining'] = np.nan
+        df.loc[:,'m-igniteTicksMax'] = np.nan
+        df.loc[:,'m-igniteBank'] = np.nan
+        df.loc[:,'m-bankMaxTicks'] = np.nan
+        df.loc[:,'m-bankBeforeRefresh'] = np.nan
+        df.loc[:,'m-igniteListAmount'] = None
+        df.loc[:,'m-sum_crit'] = np.nan
+        df.loc[:,'m-mEstimate'] = np.nan
+        df.loc[:,'m-masteryOffset'] = np.nan
+        df.loc[:,'m-masteryEstimateInitial'] = np.nan
+        df.loc[:,'m-masteryEstimate'] = np.nan
+        return df
+
+    def append(self, df_player_new):
+        # live logs: add newly polled events, the next estimateMastery() only runs the new rows through the trackers
+        self.df = pd.concat([self.df, self._select_events(df_player_new)])
 
 
 
@@ -213,7 +232,7 @@ class masteryEstimatorClass:
             self.list_timestamp_mastery.append({'idx': idx, 'timestamp': datum['timestamp'], 'masteryOffset': totalMasteryOffset})
 
     def _on_applydebuff(self, idx, datum):
-        ignite = self._getIgniteFromGUID(datum.targetNameInstanceUnique)
+        ignite = self._getIgniteFromGUID(datum.targetKey)
 
         if datum.abilityGameID == self.dict_spellIDs["IGNITE_DEBUFF"]:
             ignite.setTicksMax(2)
@@ -225,7 +244,7 @@ class masteryEstimatorClass:
 
 
     def _on_refreshdebuff(self, idx, datum):
-        ignite = self._getIgniteFromGUID(datum.targetNameInstanceUnique)
+        ignite = self._getIgniteFromGUID(datum.targetKey)
 
         if datum.abilityGameID == self.dict_spellIDs["IGNITE_DEBUFF"]:
             ignite.setTicksMax(3)
@@ -237,7 +256,7 @@ class masteryEstimatorClass:
             # self.df.at[idx,'igniteListAmount'] = ignite.listAmount
 
     def _on_damage(self, idx, datum):
-        ignite = self._getIgniteFromGUID(datum.targetNameInstanceUnique)
+        ignite = self._getIgniteFromGUID(datum.targetKey)
 
         if datum.abilityGameID == self.dict_spellIDs["IGNITE_TICK"]:
             ignite.decrementTicksRemaining()
@@ -296,9 +315,11 @@ class masteryEstimatorClass:
                 pass
 
     def estimateMastery(self):
-        for idx, datum in self.df.iterrows():
+        # trackers keep their state between calls, so only rows added since the last call are handled
+        for idx, datum in self.df.iloc[self.num_processed:].iterrows():
             if datum.type in self.eventHandler:
                 self.eventHandler[datum.type](idx, datum)
+        self.num_processed = len(self.df)
 
         # Take the median of the estimates in hopes of eliminating any errors in calculation due to ignite batching bug
         # where ignite can tick for an unexpected value when it is refreshed at the same time it ticks
@@ -346,6 +367,10 @@ class igniteEstimatorClass:
 
         if "timestampStr" not in self.df.columns:
             self.df.insert(0, "timestampStr", self.df['timestamp'].apply(lambda ts : self.timestamp_to_mmss(ts)))
+        else:
+            # rows appended since a previous run (live logs)
+            mask = self.df['timestampStr'].isna()
+            self.df.loc[mask, "timestampStr"] = self.df.loc[mask, 'timestamp'].apply(lambda ts : self.timestamp_to_mmss(ts))
         
         self.df.loc[:,'i-Contribution'] = np.nan
         self.df.loc[:,'i-Buffer'] = np.nan
@@ -492,7 +517,7 @@ class igniteEstimatorClass:
         return ignite
 
     def eventHandler_damage(self, idx, datum):
-        ignite = self._getIgniteFromGUID(datum.targetNameInstanceUnique)
+        ignite = self._getIgniteFromGUID(datum.targetKey)
 
         if datum.abilityGameID == self.dict_spellIDs["IGNITE_TICK"]:
             ignite.removeIgniteDamageFromBank(datum.amountTotal)
@@ -508,13 +533,13 @@ class igniteEstimatorClass:
                 pass
 
         if datum.abilityGameID == self.dict_spellIDs["FIRE_BLAST"]:
-            self.impactTracker.processFireBlastDamageEvent(datum.targetNameInstanceUnique, datum.timestamp)
+            self.impactTracker.processFireBlastDamageEvent(datum.targetKey, datum.timestamp)
 
     def eventHandler_applydebuff(self, idx, datum):
-        ignite = self._getIgniteFromGUID(datum.targetNameInstanceUnique)
+        ignite = self._getIgniteFromGUID(datum.targetKey)
 
         if datum.abilityGameID == self.dict_spellIDs["IGNITE_DEBUFF"]:
-            igniteImpactSource, shouldHaveImpactSource = self.impactTracker.getIgniteImpactSource(datum.targetNameInstanceUnique, datum.timestamp)
+            igniteImpactSource, shouldHaveImpactSource = self.impactTracker.getIgniteImpactSource(datum.targetKey, datum.timestamp)
             if shouldHaveImpactSource:
                 ignite.copyForImpact(igniteImpactSource)
                 ignite.setIsFromImpact(True)
@@ -533,10 +558,10 @@ class igniteEstimatorClass:
                 # print(f"[{self.timestamp_to_mmss(datum.timestamp)}]\t[{datum.type}]\t[{ignite.guid}]\tBank: {ignite.bank:.2f}")
 
     def eventHandler_refreshdebuff(self, idx, datum):
-        ignite = self._getIgniteFromGUID(datum.targetNameInstanceUnique)
+        ignite = self._getIgniteFromGUID(datum.targetKey)
 
         if datum.abilityGameID == self.dict_spellIDs["IGNITE_DEBUFF"]:
-            igniteImpactSource, shouldHaveImpactSource = self.impactTracker.getIgniteImpactSource(datum.targetNameInstanceUnique, datum.timestamp)
+            igniteImpactSource, shouldHaveImpactSource = self.impactTracker.getIgniteImpactSource(datum.targetKey, datum.timestamp)
             if shouldHaveImpactSource:
                 ignite.copyForImpact(igniteImpactSource)
                 ignite.setIsFromImpact(True)
@@ -551,7 +576,7 @@ class igniteEstimatorClass:
                 # print(f"[{self.timestamp_to_mmss(datum.timestamp)}]\t[{datum.type}]\t[{ignite.guid}]\tBank: {ignite.bank:.2f}")
 
     def eventHandler_removedebuff(self, idx, datum):
-        ignite = self._getIgniteFromGUID(datum.targetNameInstanceUnique)
+        ignite = self._getIgniteFromGUID(datum.targetKey)
 
         if datum.abilityGameID == self.dict_spellIDs["IGNITE_DEBUFF"] and ignite:
             # ignite.moveBufferToBank()
@@ -562,7 +587,7 @@ class igniteEstimatorClass:
 
     def eventHandler_cast(self, idx, datum):
         if datum.abilityGameID == self.dict_spellIDs["FIRE_BLAST"]:
-            self.impactTracker.processFireBlastCastEvent(datum.targetNameInstanceUnique, datum.timestamp)
+            self.impactTracker.processFireBlastCastEvent(datum.targetKey, datum.timestamp)
 
     def eventHandler_applybuff(self, idx, datum):
         if datum.abilityGameID == self.dict_spellIDs["IMPACT_BUFF"]:
@@ -581,7 +606,7 @@ class igniteEstimatorClass:
             if datum.type in self.eventHandler:
                 self.eventHandler[datum.type](idx, datum)
             
-            ignite = self.igniteTrackers.get(datum.targetNameInstanceUnique)
+            ignite = self.igniteTrackers.get(datum.targetKey)
             if ignite:
                 self.df.loc[idx,'i-Buffer'] = round(ignite.buffer, ndigits=2)
                 self.df.loc[idx,'i-Bank'] = round(ignite.bank, ndigits=2)
@@ -1,6 +1,6 @@
 import pandas as pd
 import numpy as np
-from utils.analyzers.PixolClassAnalyzerGraph import PixolGraphBase
+from utils.analyzers.PixolClassAnalyzerGraph import PixolGraphBase, AREA_TOOLTIP_FIELDS, SCATTER_TOOLTIP_FIELDS
 from utils.analyzers.MageFire.CombustionEstimator import CombustionEstimatorClass
 
 from utils.misc import dict_deep_update, get_mmss, wrap_trtd, merge_overlapping_intervals, get_idx_from_bool_series
@@ -13,17 +13,14 @@ class PixolIgniteTickEstimate(PixolGraphBase):
             self.poly_series = None
             return
 
-        if target:
-            df_poly = self.df_poly[self.df_poly.targetNameInstanceUnique==target]
-        else:
-            df_poly = self.df_poly
+        df_poly = self.get_target_rows(target)
 
         self.poly_series = [{
             'name': self.config['id'] + ' (Est)',
             'id': self.config['id'],
             'type': 'area',
             'step': True,
-            'data': df_poly['results'].to_list(),
+            'data': self.downsample_area(df_poly)['results'].to_list(),
             'threshold': pd.notna(self.config['area_thres']) and self.config['area_thres'] or df_poly['y_val_norm'].max(),
             'marker': {
                 'enabled': False,
@@ -32,6 +29,7 @@ class PixolIgniteTickEstimate(PixolGraphBase):
             'lineWidth': 1,
             'lineColor': 'rgba(0,0,0,0.5)',
             'turboThreshold': 100000,
+            **self.get_series_compact_options(self.data_type, ['x','y'] + AREA_TOOLTIP_FIELDS[self.data_type]),
         }]
 
         self.poly_series += [{
@@ -57,6 +55,7 @@ class PixolIgniteTickEstimate(PixolGraphBase):
             'color': "rgba(255,0,0,1)",
             'turboThreshold': 100000,
             'data': df_poly['results_scatter'].to_list(),
+            **self.get_series_compact_options('scatter', ['x','y'] + SCATTER_TOOLTIP_FIELDS),
         }]
         return self.poly_series
 
@@ -75,10 +74,10 @@ class PixolIgniteTickEstimate(PixolGraphBase):
 
         df_poly['y_val_norm'] = (1-(df_poly['y_val']-0)/(self.config['y_val_max']-0)) * self.config['row_span'] * (1-row_spacing*2/self.config['row_span']) + row_spacing + self.config['row_num']
 
-        df_poly['results'] = df_poly.apply(self.generate_area_datapoint, data_type='ignite_tick_estimate', axis=1)
+        df_poly['results'] = self.generate_area_datapoints(df_poly)
 
         df_poly['y_val_norm_scatter'] = (1-(df_poly['amountTotal']-0)/(self.config['y_val_max']-0)) * self.config['row_span'] * (1-row_spacing*2/self.config['row_span']) + row_spacing + self.config['row_num']
-        df_poly.loc[idx_ignite_ticks, 'results_scatter'] = df_poly.apply(self.generate_scatter, axis=1)
+        df_poly.loc[idx_ignite_ticks, 'results_scatter'] = self.generate_scatter_datapoints(df_poly)
 
         # self.df_ignite_estimates = df_ignite_estimates
 
@@ -176,7 +175,7 @@ class PixolCombustionStats(PixolGraphBase):
         return out
 
     def generate_graph_df(self):
-        combustionEstimatorObj = CombustionEstimatorClass(self.df)
+        combustionEstimatorObj = CombustionEstimatorClass(self.df, event_index=self.event_index)
         combustionEstimatorObj.estimate()
         df_combustion_stats = combustionEstimatorObj.getStats()
         df_combustion_stats['polyResults'] = df_combustion_stats.apply(self.generate_poly, y_center=0.5+self.config['row_num']+self.config['yOffset'], y_height=self.config['height'], max_stacks=self.config['max_stacks'], linkedTo=self.config['id'], axis=1)
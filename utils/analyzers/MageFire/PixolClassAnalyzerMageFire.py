@@ -88,7 +88,7 @@ class PixolClassAnalyzerMageFire(PixolClassAnalyzerBase):
             {
                 'obj': PixolMergedDebuff(self.df_misc, self.metadata, self.fight_id,
                     id = '8% Magic',
-                    # any additional ability ids must be added below in fetch_events function below for df_misc to contain them
+                    # any additional ability ids must be added to misc_filter_exp below for df_misc to contain them
                     ability_ids = [1490, 60433, 65142, 86105, 93068], # Curse of the Elements, Earth and Moon, Ebon Plague, Jinx: Curse of the Elements, Master Poisoner
                     always_show = True,
                     is_secondary = True,
@@ -369,27 +369,98 @@ class PixolClassAnalyzerMageFire(PixolClassAnalyzerBase):
             },
         ]
 
+    # derived event columns read by the analyzer, its graphs and the mastery/ignite/combustion estimators (df_player)
+    event_columns = [
+        'amountTotal', 'dmgMultiplier', 'resistedRatio', 'hitTypeStr', 'isAbsorbFull', 'abilityGameName', 'resourceActorID', 'manaAmount', 'manaMax',
+        'sourceNameInstance', 'sourceNameInstanceUnique', 'sourceKey', 'targetNameInstance', 'targetNameInstanceUnique', 'targetKey',
+    ]
+    # derived event columns read by the df_misc graphs (PixolMergedDebuff, PixolEnemyHealth), no damage columns
+    misc_event_columns = [
+        'resourceActorID',
+        'sourceNameInstance', 'sourceNameInstanceUnique', 'sourceKey', 'targetNameInstance', 'targetNameInstanceUnique', 'targetKey',
+    ]
+
+    # width (px) the area series are downsampled to: the charts stretch to the page, so default to a full HD wide plot area.
+    # index.py replaces it with the width of the panel the charts are rendered into (see PixolGraphBase.downsample_area)
+    downsample_width = 1920
+
+    # any additional ability ids used by df_misc graphs must be added here
+    misc_filter_exp = 'ability.id in (1490, 17800, 22959, 60433, 65142, 86105, 93068) or resources.actor.type = "NPC"'
+
+    @classmethod
+    def get_event_streams(cls, player_id):
+        # player events, misc (debuffs/NPC health) events and combatantinfo are fetched together, one request per page
+        return {
+            'player': dict(source_id=player_id),
+            'misc': dict(filter_exp=cls.misc_filter_exp),
+            'combatantInfo': dict(source_id=player_id, data_type='CombatantInfo'),
+        }
+
+    @classmethod
+    def get_prefetch_streams(cls, metadata):
+        # every fire mage of the report plus the shared misc stream, see WCLClient.prefetch_report
+        streams = {'misc': dict(filter_exp=cls.misc_filter_exp)}
+        for player_id in metadata.df_mage_fire.id:
+            streams[f'player{player_id}'] = dict(source_id=player_id)
+            streams[f'combatantInfo{player_id}'] = dict(source_id=player_id, data_type='CombatantInfo')
+        return streams
+
+    def get_fight_data(self):
+        return [self.data_player, self.data_misc]
+
     async def fetch_events(self):
-        self.data_player, self.data_combatant, _ = await self.client._fetch_events(self.metadata.reportCode, metadata=self.metadata, source_id=self.player_id, fight_id=self.fight_id, include_combatant_info=True)
+        # served from memory if the report was prefetched
+        results = await self.client._fetch_events_batched(self.metadata.reportCode, self.get_event_streams(self.player_id), metadata=self.metadata, fight_id=self.fight_id)
+        self.data_player, self.data_misc, self.data_combatant = results['player'], results['misc'], results['combatantInfo']
         if len(self.data_player.events) == 0 or 'amount' not in self.data_player.events.columns:
             raise Exception('No data found for this player')
-        self.data_misc, _, _ = await self.client._fetch_events(self.metadata.reportCode, metadata=self.metadata, fight_id=self.fight_id, include_combatant_info=False, filter_exp='ability.id in (1490, 17800, 22959, 60433, 65142, 86105, 93068) or resources.actor.type = "NPC"')
 
-        self.df_player = self.data_player.events
-        self.df_misc = self.data_misc.events
+        # combatantInfo never needs the derived columns, they are left uncomputed
+        self.df_player = self.data_player.ensure_columns(self.event_columns)
+        self.df_misc = self.data_misc.ensure_columns(self.misc_event_columns)
+        self.client.save_fight_data(self.metadata.reportCode, self.fight_id, self.get_event_streams(self.player_id), results, self.metadata)
         self.add_mastery_data()
         self.add_ignite_data()
+        self.fit_memory_budget(self.data_player, self.data_misc)
+        self.load_configs()
+
+    async def refresh(self, metadata=None):
+        # Live logs: poll only the events after the last seen timestamp, append them and update the analysis from memory.
+        # The mastery trackers only handle the new events; the ignite estimate and the graphs depend on the fight-wide
+        # mastery median and are recomputed from the in-memory frames. Returns False if there was nothing new.
+        if metadata is not None:
+            self.metadata = metadata
+            self.fight_duration = self.metadata.encounters.loc[self.fight_id].duration
+        num_new = await self.client._fetch_new_events(self.metadata.reportCode, self.get_event_streams(self.player_id), {'player': self.data_player, 'misc': self.data_misc}, fight_id=self.fight_id, metadata=self.metadata)
+        if not any(num_new.values()):
+            return False
+
+        self.df_player = self.data_player.events
+        self.df_misc = self.data_misc.events
+        self.fight_duration = max(self.fight_duration, self.df_player.timestamp.iloc[-1])
+        self.options_kwargs = self.load_config_chart()
+        self.add_encounter_phase_lines()
+
+        if num_new['player']:
+            self.add_mastery_data(df_player_new=self.df_player.iloc[-num_new['player']:])
+            self.add_ignite_data()
+        self.fit_memory_budget(self.data_player, self.data_misc)
         self.load_configs()
+        return True
 
-    def add_mastery_data(self):
-        self.masteryEstimatorObj = masteryEstimatorClass(self.df_player, self.player_id, enableDebug=True)
+    def add_mastery_data(self, df_player_new=None):
+        if df_player_new is None:
+            self.masteryEstimatorObj = masteryEstimatorClass(self.df_player, self.player_id, enableDebug=True, event_index=self.data_player.get_event_index())
+        else:
+            self.masteryEstimatorObj.append(df_player_new)
         self.masteryEstimatorObj.estimateMastery()
 
         # No Mastery procs
-        if len(self.masteryEstimatorObj.list_timestamp_mastery) == 1:
-            self.masteryEstimatorObj.list_timestamp_mastery.append({'idx': -1, 'timestamp': self.fight_duration, 'masteryOffset': self.masteryEstimatorObj.list_timestamp_mastery[0]['masteryOffset'] + 1e-6})
+        list_timestamp_mastery = list(self.masteryEstimatorObj.list_timestamp_mastery)
+        if len(list_timestamp_mastery) == 1:
+            list_timestamp_mastery.append({'idx': -1, 'timestamp': self.fight_duration, 'masteryOffset': list_timestamp_mastery[0]['masteryOffset'] + 1e-6})
 
-        self.df_mastery = pd.DataFrame(self.masteryEstimatorObj.list_timestamp_mastery)
+        self.df_mastery = pd.DataFrame(list_timestamp_mastery)
         self.df_mastery['mastery'] = self.df_mastery['masteryOffset'] + self.masteryEstimatorObj.df['m-mEstimate'].median()
 
         mask = self.df_player["type"].isin(["damage","cast"])
@@ -403,11 +474,16 @@ class PixolClassAnalyzerMageFire(PixolClassAnalyzerBase):
         match_index[np.sum(within_range_mask, axis=1) == 0] = -1
 
         # df_timestamps.loc[match_index>=0, 'range_index'] = timestamp_ranges.loc[match_index[match_index>=0],'val'].values
+        if 'm-masteryEstimate' in self.df_player.columns:
+            # refresh: the column may have been compacted (fit_memory_budget)
+            self.df_player['m-masteryEstimate'] = self.df_player['m-masteryEstimate'].astype(np.float64)
         self.df_player.loc[get_idx_from_bool_series(mask)[match_index>=0], 'm-masteryEstimate'] = self.df_mastery.loc[match_index[match_index>=0],'mastery'].values
 
     def add_ignite_data(self):
         self.df_ignite_estimates = igniteEstimatorClass(self.masteryEstimatorObj.df, enableDebug=True).estimateIgnites()
         idx_ignite_tick_estimates = get_idx_from_bool_series(self.df_ignite_estimates['i-TickAmount'].notna())
+        if 'i-TickAmount' in self.df_player.columns:
+            self.df_player['i-TickAmount'] = self.df_player['i-TickAmount'].astype(np.float64)
         self.df_player.loc[idx_ignite_tick_estimates,"i-TickAmount"] = self.df_ignite_estimates['i-TickAmount']
         
     def generate_panel_to_div(self, target_div):
@@ -3,12 +3,30 @@ import numpy as np
 import panel as pn
 # from utils.analyzers.PixolAnalyzer import run_config
 from utils.misc import dict_deep_update
+from utils.wcl.PixolWCLReport import fit_memory_budget
 from utils.highcharts.PixolHighcharts import get_chart_html
 from bokeh.models.widgets.tables import NumberFormatter
 import importlib
 HAS_PYSCRIPT = importlib.util.find_spec('pyscript')
 
 class PixolClassAnalyzerBase:
+    # report metadata fields read by the analyzer on top of WCLReportMetaData's own (see PixolWCLQuery.build_metadata_query)
+    metadata_fields = {
+        'fights': {'phaseTransitions': {'id': None, 'startTime': None}},
+        'masterData': {
+            'abilities': {'name': None, 'icon': None},
+            'actors': {'name': None, 'type': None},
+        },
+    }
+    # derived event columns read by the analyzer and its graphs (see WCLReportFightData.ensure_columns), None for all
+    event_columns = None
+    # opt-in cap (bytes) for the event frames the analyzer keeps, they are compacted to fit it (see fit_memory_budget)
+    memory_budget = None
+    # opt-in: send raw tooltip fields with the points and build the tooltip html on hover (see pixolFormatTooltip)
+    compact_tooltips = False
+    # opt-in: width (px) of the chart plot area, area series are downsampled to it (see PixolGraphBase.downsample_area)
+    downsample_width = None
+
     def __init__(
         self,
         client,
@@ -39,6 +57,22 @@ class PixolClassAnalyzerBase:
             'color': '#707073',
         }
         self.df_mastery = None
+        self.memory_usage = None
+
+    def fit_memory_budget(self, *list_fight_data):
+        # call once the estimators have run, they read the full precision values
+        if self.memory_budget is not None:
+            self.memory_usage = fit_memory_budget(list_fight_data, self.memory_budget)
+
+    def get_fight_data(self):
+        # WCLReportFightData objects whose event frames the graphs are built from
+        return []
+
+    def get_event_index(self, df):
+        for fight_data in self.get_fight_data():
+            if fight_data.events is df:
+                return fight_data.get_event_index()
+        return None
 
     def load_configs(self):
         self.config_debuffs = self.load_config_debuffs()
@@ -121,6 +155,11 @@ class PixolClassAnalyzerBase:
                 row_num = max(-1, df_config['row_num'].max()) + (idx > 0  and df_config.at[idx-1, 'row_span'] or 1)
             
             row.obj.set_row_num(row_num)
+            row.obj.set_event_index(self.get_event_index(row.obj.df))
+            if self.compact_tooltips:
+                row.obj.set_compact_tooltips(True)
+            if self.downsample_width:
+                row.obj.set_downsample_width(self.downsample_width)
             row.obj.generate_graph_df()
             if row.obj.num_poly > 0 or row.obj.config['always_show'] or (row.obj.df_poly is not None and len(row.obj.df_poly) > 0):
                 df_config.at[idx, 'row_num'] = row_num
@@ -154,6 +193,10 @@ class PixolClassAnalyzerBase:
         subtitle_url = f'https://classic.warcraftlogs.com/reports/{self.metadata.reportCode}#fight={self.fight_id}&type=damage-done&source={self.player_id}'
         subtitle_url = f'<a href="{subtitle_url}" target="_blank" style="color:#0072b5;">{subtitle_url}</a>'
 
+        # same for every target, the graphs partition their df_poly by target once (see PixolGraphBase.get_target_rows)
+        plot_bands = [l for ll in df_config[df_config['row_num']>=0].apply(lambda x: x.obj.plot_bands, axis=1) if ll for l in ll]
+        plot_lines = [l for ll in df_config[df_config['row_num']>=0].apply(lambda x: x.obj.plot_lines, axis=1) if ll for l in ll]
+
         for target in list_targets:
             target_split = target.split("-")
             subtitle = (len(target_split) == 3 and f"{target_split[0]}-{target_split[1]} (ID: {target_split[2]})") or (len(target_split) == 2 and f"{target_split[0]} (ID: {target_split[1]})") or target
@@ -168,8 +211,8 @@ class PixolClassAnalyzerBase:
                     'series': tmp,
                     'yAxis': {
                         'max': h,
-                        'plotBands': [l for ll in df_config[df_config['row_num']>=0].apply(lambda x: x.obj.plot_bands, axis=1) if ll for l in ll],
-                        'plotLines': [l for ll in df_config[df_config['row_num']>=0].apply(lambda x: x.obj.plot_lines, axis=1) if ll for l in ll],
+                        'plotBands': plot_bands,
+                        'plotLines': plot_lines,
                     },
                     'chart': {
                         'marginLeft': 160,
@@ -281,6 +324,9 @@ class PixolClassAnalyzerBase:
                         'useHTML': True,
 
                         'pointFormatter': """FUNCTIONSTARTfunction() {
+                            if ((this.series.userOptions.custom != undefined) && (this.series.userOptions.custom.fmt != undefined)) {
+                                return pixolFormatTooltip(this)
+                            }
                             if (this.series.userOptions.custom != undefined) {
                                 return this.series.userOptions.custom.txt
                             }
@@ -299,6 +345,9 @@ class PixolClassAnalyzerBase:
                         'useHTML': True,
 
                         'pointFormatter': """FUNCTIONSTARTfunction() {
+                            if ((this.series.userOptions.custom != undefined) && (this.series.userOptions.custom.fmt != undefined)) {
+                                return pixolFormatTooltip(this)
+                            }
                             if (this.series.userOptions.custom != undefined) {
                                 return this.series.userOptions.custom.txt
                             }
@@ -317,6 +366,9 @@ class PixolClassAnalyzerBase:
                         'useHTML': True,
 
                         'pointFormatter': """FUNCTIONSTARTfunction() {
+                            if ((this.series.userOptions.custom != undefined) && (this.series.userOptions.custom.fmt != undefined)) {
+                                return pixolFormatTooltip(this)
+                            }
                             if (this.series.userOptions.custom != undefined) {
                                 return this.series.userOptions.custom.txt
                             }
@@ -1,9 +1,58 @@
 import pandas as pd
 import numpy as np
-from utils.misc import dict_deep_update, get_mmss, wrap_trtd, merge_overlapping_intervals, get_idx_from_bool_series
+from utils.misc import dict_deep_update, get_mmss, get_mmss_list, wrap_trtd, merge_overlapping_intervals, get_idx_from_bool_series, EventTransitions
 import importlib
 HAS_PYSCRIPT = importlib.util.find_spec('pyscript')
 
+# Compact point payloads (config compact_tooltips): instead of a pre-rendered html tooltip per point, the series
+# carries custom.fmt and the points only these fields; pixolFormatTooltip (utils/js/highchartssetup.js) renders them on hover.
+POLY_TOOLTIP_FIELDS = ['polyStart','polyEnd','polyStacks','amount','isCrit','absorbed','overkill','resisted','resistedRatio','amountTotal','dmgMultiplier','targetNameInstanceUnique']
+AREA_TOOLTIP_FIELDS = {
+    'haste': ['haste','abilityGameName','castDur'],
+    'spellpower': ['spellPower'],
+    'mastery': ['mastery'],
+    'mana': ['mana','manaMax','manaPerc'],
+    'enemy_health': ['hitPoints','maxHitPoints','healthPerc'],
+    'movement': ['distMoved'],
+    'heating_up': ['heatingUp'],
+    'ignite_storage': ['igniteStorage'],
+    'ignite_tick_estimate': ['y_val'],
+}
+SCATTER_TOOLTIP_FIELDS = ['startTime','timestamp','abilityGameName','abilityGameID','targetNameInstanceUnique','amountTotal']
+
+# Interval rules of the aura/dot graphs (see EventTransitions.get_intervals), an interval ends at the matching row.
+# types: {periods: types of the event <periods> events before the row (0: the row itself, -1: the next event)}
+DOT_DEBUFF_RULES = [
+    # ['applydebuff', 'damage'] -> ['damage']
+    {'types': {1: ['applydebuff','damage'], 0: ['damage']}, 'start': 1},
+    # ['damage','applydebuff'] -> ['removedebuff']: clipped if not same timestamp
+    {'types': {1: ['damage','applydebuff'], 0: ['removedebuff']}, 'new_timestamp': True, 'start': 1, 'clip': True},
+]
+DOT_DEBUFF_RULES_CLIP_ON_REFRESH = [
+    # ['applydebuff','refreshdebuff','damage'] -> ['damage']
+    {'types': {1: ['applydebuff','refreshdebuff','damage'], 0: ['damage']}, 'start': 1},
+    # ['damage','applydebuff','refreshdebuff'] -> ['refreshdebuff','removedebuff']: clipped if not same timestamp
+    {'types': {1: ['damage','applydebuff','refreshdebuff'], 0: ['refreshdebuff','removedebuff']}, 'new_timestamp': True, 'start': 1, 'clip': True},
+]
+IGNITE_DEBUFF_RULES = DOT_DEBUFF_RULES + [
+    # ['damage'] -> ['removedebuff'] -> ['damage']: special case for ignite where debuff falls off then tick damage happens
+    {'types': {2: ['damage'], 1: ['removedebuff'], 0: ['damage']}, 'max_gap': {0: 0.1}, 'start': 2},
+    # same case seen from the removedebuff: unsets the clipped interval from earlier
+    {'types': {1: ['damage'], 0: ['removedebuff'], -1: ['damage']}, 'max_gap': {-1: 0.1}, 'start': None, 'clip': False},
+]
+MERGED_DEBUFF_RULES = [
+    # ['applydebuff', 'refreshdebuff'] -> ['refreshdebuff', 'removedebuff']
+    {'types': {1: ['applydebuff','refreshdebuff'], 0: ['refreshdebuff','removedebuff']}, 'start': 1},
+]
+BUFF_RULES = [
+    # ['applybuff', 'refreshbuff'] -> ['refreshbuff', 'removebuff']
+    {'types': {1: ['applybuff','refreshbuff'], 0: ['refreshbuff','removebuff']}, 'start': 1},
+]
+BUFF_RULES_CLIP_ON_REFRESH = BUFF_RULES + [
+    # ['applybuff', 'refreshbuff'] -> ['refreshbuff']: clipped
+    {'types': {1: ['applybuff','refreshbuff'], 0: ['refreshbuff']}, 'start': 1, 'clip': True},
+]
+
 class PixolGraphBase:
     config = {
         'type': 'poly',
@@ -25,6 +74,8 @@ class PixolGraphBase:
         'url': None,
         'img': None,
         'df_mastery': None,
+        'compact_tooltips': False,
+        'downsample_width': None, # px of the plot area, area series are reduced to at most 4 points per px (see downsample_area)
     }
 
     def __init__(self, df, metadata, fight_id, **kwargs):
@@ -39,10 +90,62 @@ class PixolGraphBase:
         self.df_poly = None
         self.plot_bands = None
         self.plot_lines = None
+        self.event_index = None
+        self.df_poly_targets = None # (df_poly, {target: row positions}), see get_target_positions
     
     def set_row_num(self, row_num):
         self.config['row_num'] = row_num
 
+    def set_compact_tooltips(self, compact_tooltips=True):
+        self.config['compact_tooltips'] = compact_tooltips
+
+    def set_downsample_width(self, downsample_width):
+        self.config['downsample_width'] = downsample_width
+
+    def set_event_index(self, event_index):
+        # WCLEventIndex of self.df (see WCLReportFightData.get_event_index), None to filter with boolean scans
+        self.event_index = event_index
+
+    def get_rows(self, types=None, ability_ids=None, source_ids=None, target_ids=None):
+        # rows of self.df with all of the given values, in frame order
+        if self.event_index is not None and self.event_index.num_rows == len(self.df):
+            return self.df.iloc[self.event_index.query(types=types, ability_ids=ability_ids, source_ids=source_ids, target_ids=target_ids)]
+        mask = pd.Series(True, index=self.df.index)
+        for column, values in [('type', types), ('abilityGameID', ability_ids), ('sourceID', source_ids), ('targetID', target_ids)]:
+            if values is not None:
+                mask = (mask) & (self.df[column].isin(values))
+        return self.df[mask]
+
+    def downsample_area(self, df):
+        # M4 downsampling of a step area series: of the points falling into one px column of the fight (downsample_width),
+        # only the first, last, min and max are kept. The rendered step line is the same at full zoom, extremes are kept.
+        # Gaps (no y value) are always kept and split the px columns, so no step is drawn across a gap.
+        width = self.config['downsample_width']
+        if not width or len(df) <= 4*width:
+            return df
+        y = df['y_val_norm'].to_numpy(dtype=np.float64)
+        is_gap = np.isnan(y)
+        bucket = np.clip((df['timestamp'].to_numpy(dtype=np.float64) / self.fight_duration * width).astype(np.int64), 0, width-1)
+        segment = np.cumsum(is_gap)
+        df_points = pd.DataFrame({'y': y, 'key': bucket*(len(df)+1) + segment}, index=np.arange(len(df)))[~is_gap]
+        grouped = df_points.groupby('key', sort=False)['y']
+        keep = is_gap.copy()
+        for idx in [grouped.head(1).index, grouped.tail(1).index, grouped.idxmin().to_numpy(), grouped.idxmax().to_numpy()]:
+            keep[idx] = True
+        return df.iloc[np.flatnonzero(keep)]
+
+    def get_target_positions(self):
+        # {targetNameInstanceUnique: row positions} of df_poly, partitioned once per df_poly instead of one scan per target
+        if self.df_poly_targets is None or self.df_poly_targets[0] is not self.df_poly:
+            self.df_poly_targets = (self.df_poly, self.df_poly.groupby('targetNameInstanceUnique', sort=False, observed=True).indices)
+        return self.df_poly_targets[1]
+
+    def get_target_rows(self, target=None):
+        # rows of df_poly of a target, all rows without a target
+        if not target:
+            return self.df_poly
+        return self.df_poly.iloc[self.get_target_positions().get(target, [])]
+
     def generate_poly(self, x, y_center, y_height, max_stacks=1, linkedTo=None, color='red'):
         if pd.isna(x['polyStart']):
             return
@@ -108,6 +211,143 @@ class PixolGraphBase:
         }]
         return out
 
+    def generate_polys(self, df, y_center, y_height, max_stacks=1, linkedTo=None, color='red'):
+        # generate_poly for every row of df at once: Series of [polygon] (None where polyStart is NaN)
+        out = pd.Series([None]*len(df), index=df.index, dtype=object)
+        df = df[df['polyStart'].notna()]
+        n = len(df)
+        if n == 0:
+            return out
+
+        if pd.isna(color):
+            color = 'red'
+
+        poly_start = df['polyStart'].to_numpy(dtype=np.float64)
+        poly_end = df['polyEnd'].to_numpy(dtype=np.float64)
+        has_stacks = np.zeros(n, dtype=bool)
+        if 'polyStacks' in df.columns:
+            has_stacks = df['polyStacks'].astype(bool).to_numpy()
+        if self.config['compact_tooltips']:
+            df_values = df.assign(isCrit=df['hitTypeStr'].astype(str).str.contains('CRIT', regex=False) if 'hitTypeStr' in df.columns else False)
+            list_custom = [{'fmt': 'poly', 'v': v} for v in zip(*self._get_tooltip_values(df_values, POLY_TOOLTIP_FIELDS, defaults={'absorbed': 0, 'overkill': 0, 'resisted': 0}))]
+        else:
+            list_txt = [
+                [wrap_trtd('Start', v) for v in get_mmss_list(poly_start)],
+                [wrap_trtd('End', v) for v in get_mmss_list(poly_end)],
+                [wrap_trtd('Dur', v) for v in get_mmss_list(poly_end-poly_start)],
+            ]
+            if 'polyStacks' in df.columns:
+                list_txt.append([s and wrap_trtd("Stacks", f"{v:.0f}") or '' for s, v in zip(has_stacks, df['polyStacks'].tolist())])
+            if 'amount' in df.columns:
+                list_txt.append(self._get_amount_txt(df))
+            if 'dmgMultiplier' in df.columns:
+                list_txt.append([pd.notna(v) and wrap_trtd("Bonus", f"{v:0.2f}x") or '' for v in df['dmgMultiplier'].tolist()])
+            if 'targetNameInstanceUnique' in df.columns:
+                list_txt.append([pd.notna(v) and wrap_trtd("Target", v) or '' for v in df['targetNameInstanceUnique'].tolist()])
+            list_custom = [{'txt': ''.join(txt)} for txt in zip(*list_txt)]
+
+        # y extent and color: partial stacks, then clipped, then full height
+        ymax = round(y_center + y_height/2,2)
+        ymin = np.full(n, round(y_center - y_height/2,2))
+        colors = np.full(n, color, dtype=object)
+        mask = has_stacks & (df['polyStacks'].to_numpy(dtype=np.float64) < max_stacks) if 'polyStacks' in df.columns else has_stacks
+        if mask.any():
+            stacks = df['polyStacks'].to_numpy(dtype=np.float64)[mask]
+            dict_ymin = {v: round(ymax - y_height*(v/max_stacks),2) for v in np.unique(stacks).tolist()}
+            ymin[mask] = [dict_ymin[v] for v in stacks.tolist()]
+            colors[mask] = 'yellow'
+        if 'polyClip' in df.columns:
+            mask_clip = ~mask & df['polyClip'].astype(bool).to_numpy()
+            ymin[mask_clip] = round(ymax - y_height*(0.5),2)
+            colors[mask_clip] = 'yellow'
+
+        data = np.empty((n, 4, 2))
+        data[:,[0,1],0] = poly_start[:,np.newaxis]
+        data[:,[2,3],0] = poly_end[:,np.newaxis]
+        data[:,[0,3],1] = ymin[:,np.newaxis]
+        data[:,[1,2],1] = ymax
+
+        if linkedTo:
+            names = [linkedTo]*n
+        elif 'abilityGameName' in df.columns:
+            names = [v or "" for v in df['abilityGameName'].tolist()]
+        else:
+            names = [""]*n
+
+        out[df.index] = [[{
+            'type': 'polygon',
+            'name': name,
+            'linkedTo': name,
+            'data': d,
+            'color': c,
+            'custom': custom,
+        }] for name, d, c, custom in zip(names, data.tolist(), colors.tolist(), list_custom)]
+        return out
+
+    @staticmethod
+    def _get_tooltip_values(df, fields, defaults={}):
+        # columns of df as lists of json values (NaN -> None), missing columns are filled with defaults (None)
+        out = []
+        for c in fields:
+            if c in df.columns:
+                s = df[c]
+                out.append(s.astype(object).where(s.notna(), None).tolist())
+            else:
+                out.append([defaults.get(c)]*len(df))
+        return out
+
+    def generate_area_datapoints(self, df):
+        # generate_area_datapoint of every row, [x, y, *AREA_TOOLTIP_FIELDS] points with compact_tooltips
+        if not self.config['compact_tooltips']:
+            return df.apply(self.generate_area_datapoint, axis=1)
+        values = self._get_tooltip_values(df, ['timestamp','y_val_norm'] + AREA_TOOLTIP_FIELDS.get(self.data_type, []))
+        return pd.Series([v[1] is not None and list(v) or None for v in zip(*values)], index=df.index, dtype=object)
+
+    def generate_scatter_datapoints(self, df, y_center=None):
+        # generate_scatter (generate_cast_scatter with y_center) of every row, [x, y, *SCATTER_TOOLTIP_FIELDS] points with compact_tooltips
+        if not self.config['compact_tooltips']:
+            if y_center is None:
+                return df.apply(self.generate_scatter, axis=1)
+            return df.apply(self.generate_cast_scatter, y_center=y_center, axis=1)
+        x = df['startTime'].fillna(df['timestamp']) if 'startTime' in df.columns else df['timestamp']
+        y = pd.Series(y_center, index=df.index) if y_center is not None else df['y_val_norm_scatter']
+        fields = SCATTER_TOOLTIP_FIELDS
+        if y_center is not None:
+            # cast icons: the data label is built from the icon name (see generate_poly_series)
+            df = df.assign(icon=self.metadata.abilities['icon'].reindex(df['abilityGameID']).fillna('inv_misc_questionmark.jpg').to_numpy())
+            fields = fields + ['icon']
+        values = self._get_tooltip_values(df.assign(x=x, y=y), ['x','y'] + fields)
+        return pd.Series([list(v) for v in zip(*values)], index=df.index, dtype=object)
+
+    def get_series_compact_options(self, fmt, keys=None):
+        # series options telling pixolFormatTooltip how to read the compact points
+        if not self.config['compact_tooltips']:
+            return {}
+        out = {'custom': {'fmt': fmt}}
+        if keys is not None:
+            out['keys'] = keys
+        return out
+
+    @staticmethod
+    def _get_amount_txt(df):
+        # "Amt" tooltip row of generate_poly: *crit*, (A: absorbed) (O: overkill) (R: resisted%) (T: total)
+        amount = df['amount']
+        has_amount = amount.notna().to_numpy()
+        # note: crit flag does not get set on fully absorbed damage events
+        is_crit = df['hitTypeStr'].astype(str).str.contains('CRIT', regex=False).to_numpy()
+        list_str_amt = [s and (c and f"*{v:,.0f}*" or f"{v:,.0f}") or '' for s, c, v in zip(has_amount, is_crit, amount.tolist())]
+        show_total = np.zeros(len(df), dtype=bool)
+        for column, column_value, fmt in [('absorbed', 'absorbed', " (A: {:,.0f})"), ('overkill', 'overkill', " (O: {:,.0f})"), ('resisted', 'resistedRatio', " (R: {:,.0f}%)")]:
+            if column not in df.columns:
+                continue
+            mask = has_amount & (df[column] != 0).to_numpy()
+            values = df[column_value].to_numpy(dtype=np.float64) * (column == 'resisted' and 100 or 1)
+            list_str_amt = [m and s + fmt.format(v) or s for m, s, v in zip(mask, list_str_amt, values.tolist())]
+            show_total |= mask
+        if 'amountTotal' in df.columns:
+            list_str_amt = [m and s + f" (T: {v:,.0f})" or s for m, s, v in zip(show_total, list_str_amt, df['amountTotal'].tolist())]
+        return [s and wrap_trtd("Amt", s) or '' for s in list_str_amt]
+
     def generate_area_datapoint(self, x, data_type=None):
         if pd.isna(x['y_val_norm']):
             return
@@ -314,17 +554,14 @@ class PixolGraphBase:
     def get_uniques(self):
         if isinstance(self.df_poly, pd.DataFrame):
             if 'targetNameInstanceUnique' in self.df_poly.columns:
-                return self.df_poly['targetNameInstanceUnique'].unique().tolist()
+                return list(self.get_target_positions())
 
     def generate_poly_series(self, target=None):
         if self.df_poly is None:
             self.poly_series = None
             return
 
-        if target:
-            df_poly = self.df_poly[self.df_poly.targetNameInstanceUnique==target]
-        else:
-            df_poly = self.df_poly
+        df_poly = self.get_target_rows(target)
 
         if self.config['type'] == 'poly':
             list_poly_results = [ll for l in df_poly['polyResults'].to_list() for ll in l]
@@ -344,7 +581,7 @@ class PixolGraphBase:
                 'id': self.config['id'],
                 'type': 'area',
                 'step': True,
-                'data': df_poly['results'].to_list(),
+                'data': self.downsample_area(df_poly)['results'].to_list(),
                 'threshold': pd.notna(self.config['area_thres']) and self.config['area_thres'] or df_poly['y_val_norm'].max(),
                 'marker': {
                     'enabled': False,
@@ -353,6 +590,7 @@ class PixolGraphBase:
                 'lineWidth': 1,
                 'lineColor': 'rgba(0,0,0,0.5)',
                 'turboThreshold': 100000,
+                **self.get_series_compact_options(self.data_type, ['x','y'] + AREA_TOOLTIP_FIELDS.get(self.data_type, [])),
             }
             
             # if df.get('visible') == False:
@@ -382,133 +620,87 @@ class PixolGraphBase:
                 'turboThreshold': 100000,
                 'data': df_poly['results'].to_list(),
             }]
+            if self.config['compact_tooltips']:
+                # cast icons from the icon name of each point
+                self.poly_series[0].update(self.get_series_compact_options('cast', ['x','y'] + SCATTER_TOOLTIP_FIELDS + ['icon']))
+                self.poly_series[0]['dataLabels']['format'] = "<div style='width: 16px; height: 16px; overflow: hidden; border: 1px solid black;'><img style='width: 19px; height: 19px; margin-left: -7.35%; margin-top: -7.35%' src='https://wow.zamimg.com/images/wow/icons/small/{point.icon}'></div>"
             return self.poly_series
     
 class PixolDotDebuff(PixolGraphBase):
     def generate_graph_df(self):
         if self.config.get("ignore_ability_id_grouping") == True:
-            groupby_settings = ['sourceNameInstanceUnique','targetNameInstanceUnique']
+            groupby_settings = ['sourceKey','targetKey']
         else:
-            groupby_settings = ['abilityGameID','sourceNameInstanceUnique','targetNameInstanceUnique']
-
-        mask = (self.df['abilityGameID'].isin(self.config['ability_ids']))
+            groupby_settings = ['abilityGameID','sourceKey','targetKey']
 
         if self.config.get("show_clip_on_refresh") == True:
-            mask = (mask) & (self.df['type'].isin(['damage','applydebuff','refreshdebuff','removedebuff']))
+            df = self.get_rows(ability_ids=self.config['ability_ids'], types=['damage','applydebuff','refreshdebuff','removedebuff'])
         else:
-            mask = (mask) & (self.df['type'].isin(['damage','applydebuff','removedebuff']))
+            df = self.get_rows(ability_ids=self.config['ability_ids'], types=['damage','applydebuff','removedebuff'])
 
         if self.config.get("ticks_only") == True:
-            mask2 = (self.df['type'].isin(['damage'])) & (self.df['tick']!=True)
-            mask = (mask) & (~mask2)
+            mask2 = (df['type'].isin(['damage'])) & (df['tick']!=True)
+            df = df[~mask2]
 
-        df = self.df[mask].copy()
+        df = df.copy()
         df.insert(1, 'polyStart', np.nan)
         df.insert(2, 'polyEnd', np.nan)
         df.insert(3, 'polyClip', False)
 
-        if self.config.get("show_clip_on_refresh") == True:
-            mask = (df.groupby(groupby_settings)['type'].shift().isin(['applydebuff','refreshdebuff','damage'])) & (df.groupby(groupby_settings)['type'].shift(0) == 'damage')
-        else:
-            # ['applydebuff', 'damage'] -> ['damage']
-            mask = (df.groupby(groupby_settings)['type'].shift().isin(['applydebuff','damage'])) & (df.groupby(groupby_settings)['type'].shift(0) == 'damage')
-
-        df.loc[mask,'polyStart'] = df.groupby(groupby_settings)['timestamp'].shift()
-
-        if self.config.get("show_clip_on_refresh") == True:
-            # ['damage','applydebuff','refreshdebuff'] -> ['refreshdebuff','removedebuff']: clipped if not same timestamp
-            mask = (df.groupby(groupby_settings)['type'].shift().isin(['damage','applydebuff','refreshdebuff'])) \
-                & (df.groupby(groupby_settings)['type'].shift(0).isin(['refreshdebuff','removedebuff'])) \
-                & (df.groupby(groupby_settings)['timestamp'].shift() != df.groupby(groupby_settings)['timestamp'].shift(0))
-        else:
-            # ['damage','applydebuff'] -> ['removedebuff']: clipped if not same timestamp
-            mask = (df.groupby(groupby_settings)['type'].shift().isin(['damage','applydebuff'])) \
-                & (df.groupby(groupby_settings)['type'].shift(0).isin(['removedebuff'])) \
-                & (df.groupby(groupby_settings)['timestamp'].shift() != df.groupby(groupby_settings)['timestamp'].shift(0))
-        df.loc[mask,'polyStart'] = df.groupby(groupby_settings)['timestamp'].shift()
-        df.loc[mask,'polyClip'] = True
+        rules = self.config.get("show_clip_on_refresh") == True and DOT_DEBUFF_RULES_CLIP_ON_REFRESH or DOT_DEBUFF_RULES
+        df['polyStart'], df['polyClip'] = EventTransitions(df, groupby_settings).get_intervals(rules)
 
         mask = df['polyStart'].notna()
         df.loc[mask,'polyEnd'] = df['timestamp']
-        df.loc[mask,'polyResults'] = df.loc[mask].apply(self.generate_poly, y_center=0.5+self.config['row_num']+self.config['yOffset'], y_height=self.config['height'], max_stacks=self.config['max_stacks'], linkedTo=self.config['id'], axis=1)
+        df.loc[mask,'polyResults'] = self.generate_polys(df.loc[mask], y_center=0.5+self.config['row_num']+self.config['yOffset'], y_height=self.config['height'], max_stacks=self.config['max_stacks'], linkedTo=self.config['id'])
 
         if sum(mask) > 0:
-            self.df_poly = df.loc[mask][['abilityGameID', 'polyStart', 'polyEnd', 'polyClip', 'sourceID', 'sourceNameInstance', 'sourceNameInstanceUnique', 'targetID', 'targetNameInstance', 'targetNameInstanceUnique', 'polyResults']]
+            self.df_poly = df.loc[mask][['abilityGameID', 'polyStart', 'polyEnd', 'polyClip', 'sourceID', 'sourceNameInstance', 'sourceNameInstanceUnique', 'sourceKey', 'targetID', 'targetNameInstance', 'targetNameInstanceUnique', 'targetKey', 'polyResults']]
             self.num_poly = len(self.df_poly)
 
 class PixolIgniteDebuff(PixolGraphBase):
     def generate_graph_df(self):
         if self.config.get("ignore_ability_id_grouping") == True:
-            groupby_settings = ['sourceNameInstanceUnique','targetNameInstanceUnique']
+            groupby_settings = ['sourceKey','targetKey']
         else:
-            groupby_settings = ['abilityGameID','sourceNameInstanceUnique','targetNameInstanceUnique']
-        mask = (self.df['abilityGameID'].isin(self.config['ability_ids']))
-        mask = (mask) & (self.df['type'].isin(['damage','applydebuff','removedebuff']))
+            groupby_settings = ['abilityGameID','sourceKey','targetKey']
+        df = self.get_rows(ability_ids=self.config['ability_ids'], types=['damage','applydebuff','removedebuff'])
         if self.config.get("ticks_only") == True:
-            mask2 = (self.df['type'].isin(['damage'])) & (self.df['tick']!=True)
-            mask = (mask) & (~mask2)
-        df = self.df[mask].copy()
+            mask2 = (df['type'].isin(['damage'])) & (df['tick']!=True)
+            df = df[~mask2]
+        df = df.copy()
         df.insert(1, 'polyStart', np.nan)
         df.insert(2, 'polyEnd', np.nan)
         df.insert(3, 'polyClip', False)
 
-        # ['applydebuff', 'damage'] -> ['damage']
-        mask = (df.groupby(groupby_settings)['type'].shift().isin(['applydebuff','damage'])) & (df.groupby(groupby_settings)['type'].shift(0) == 'damage')
-        df.loc[mask,'polyStart'] = df.groupby(groupby_settings)['timestamp'].shift()
-
-        # ['damage','applydebuff'] -> ['removedebuff']: clipped if not same timestamp
-        mask = (df.groupby(groupby_settings)['type'].shift().isin(['damage','applydebuff'])) \
-            & (df.groupby(groupby_settings)['type'].shift(0).isin(['removedebuff'])) \
-            & (df.groupby(groupby_settings)['timestamp'].shift() != df.groupby(groupby_settings)['timestamp'].shift(0))
-        df.loc[mask,'polyStart'] = df.groupby(groupby_settings)['timestamp'].shift()
-        df.loc[mask,'polyClip'] = True
-
-        # ['damage'] -> ['removedebuff'] -> ['damage']: special case for ignite where debuff falls off then tick damage happens
-        mask = (df.groupby(groupby_settings)['type'].shift(2).isin(['damage'])) \
-            & (df.groupby(groupby_settings)['type'].shift().isin(['removedebuff'])) \
-            & (df.groupby(groupby_settings)['type'].shift(0).isin(['damage'])) \
-            & ((df.groupby(groupby_settings)['timestamp'].shift(0) - df.groupby(groupby_settings)['timestamp'].shift()) < 0.1)
-        df.loc[mask,'polyStart'] = df.groupby(groupby_settings)['timestamp'].shift(2)
-
-        # This basically unsets the polyStart/polyClip from earlier
-        # ['damage'] -> ['removedebuff'] -> ['damage']: special case for ignite where debuff falls off then tick damage happens
-        mask = (df.groupby(groupby_settings)['type'].shift(1).isin(['damage'])) \
-            & (df.groupby(groupby_settings)['type'].shift(0).isin(['removedebuff'])) \
-            & (df.groupby(groupby_settings)['type'].shift(-1).isin(['damage'])) \
-            & ((df.groupby(groupby_settings)['timestamp'].shift(-1) - df.groupby(groupby_settings)['timestamp'].shift(0)) < 0.1)
-        df.loc[mask,'polyStart'] = np.nan
-        df.loc[mask,'polyClip'] = False
+        df['polyStart'], df['polyClip'] = EventTransitions(df, groupby_settings).get_intervals(IGNITE_DEBUFF_RULES)
 
         mask = df['polyStart'].notna()
         df.loc[mask,'polyEnd'] = df['timestamp']
-        df.loc[mask,'polyResults'] = df.loc[mask].apply(self.generate_poly, y_center=0.5+self.config['row_num']+self.config['yOffset'], y_height=self.config['height'], max_stacks=self.config['max_stacks'], linkedTo=self.config['id'], axis=1)
+        df.loc[mask,'polyResults'] = self.generate_polys(df.loc[mask], y_center=0.5+self.config['row_num']+self.config['yOffset'], y_height=self.config['height'], max_stacks=self.config['max_stacks'], linkedTo=self.config['id'])
         
         if sum(mask) > 0:
-            self.df_poly = df.loc[mask][['abilityGameID', 'polyStart', 'polyEnd', 'polyClip', 'sourceID', 'sourceNameInstance', 'sourceNameInstanceUnique', 'targetID', 'targetNameInstance', 'targetNameInstanceUnique', 'polyResults']]
+            self.df_poly = df.loc[mask][['abilityGameID', 'polyStart', 'polyEnd', 'polyClip', 'sourceID', 'sourceNameInstance', 'sourceNameInstanceUnique', 'sourceKey', 'targetID', 'targetNameInstance', 'targetNameInstanceUnique', 'targetKey', 'polyResults']]
             self.num_poly = len(self.df_poly)
 
 class PixolMergedDebuff(PixolGraphBase):
     def generate_graph_df(self):
-        mask = (self.df['abilityGameID'].isin(self.config['ability_ids'])) & (self.df['type'].isin(['applydebuff','refreshdebuff','removedebuff']))
-        if pd.notna(self.config.get('target_ids')):
-            mask = (mask) & (self.df.targetID.isin(self.config['target_ids'])) 
-        df = self.df[mask].copy()
+        df = self.get_rows(ability_ids=self.config['ability_ids'], types=['applydebuff','refreshdebuff','removedebuff'], target_ids=pd.notna(self.config.get('target_ids')) and self.config['target_ids'] or None).copy()
         # df = self.df[(self.df['abilityGameID'].isin(self.config['ability_ids'])) & (self.df['type'].isin(['applydebuff','refreshdebuff','removedebuff']))].copy()
         df.insert(1, 'polyStart', np.nan)
         df.insert(2, 'polyEnd', np.nan)
 
         # ['applydebuff', 'refreshdebuff'] -> ['refreshdebuff', 'removedebuff']
-        mask = (df.groupby(['abilityGameID','sourceNameInstanceUnique','targetNameInstanceUnique'])['type'].shift().isin(['applydebuff','refreshdebuff'])) & (df.groupby(['abilityGameID','sourceNameInstanceUnique','targetNameInstanceUnique'])['type'].shift(0).isin(['refreshdebuff','removedebuff']))
-        df.loc[mask,'polyStart'] = df.groupby(['abilityGameID','sourceNameInstanceUnique','targetNameInstanceUnique'])['timestamp'].shift()
+        df['polyStart'] = EventTransitions(df, ['abilityGameID','sourceKey','targetKey']).get_intervals(MERGED_DEBUFF_RULES)[0]
 
         mask = df['polyStart'].notna()
         df.loc[mask,'polyEnd'] = df['timestamp']
         # df.loc[mask,'polyResults'] = df.loc[mask].apply(generate_poly, y_center=0.5+self.config['row_num']+self.config['yOffset'], y_height=self.config['height'], max_stacks=self.config['max_stacks'], linkedTo=self.config['id'], axis=1)
 
         if sum(mask) > 0:
-            df = df.loc[mask][['abilityGameID', 'polyStart', 'polyEnd', 'sourceID', 'sourceNameInstance', 'sourceNameInstanceUnique', 'targetID', 'targetNameInstance', 'targetNameInstanceUnique']].copy()
-            df = merge_overlapping_intervals(df, ["targetNameInstanceUnique"], "polyStart", "polyEnd")
-            df['polyResults'] = df.apply(self.generate_poly, y_center=0.5+self.config['row_num']+self.config['yOffset'], y_height=self.config['height'], max_stacks=self.config['max_stacks'], linkedTo=self.config['id'], axis=1)
+            df = df.loc[mask][['abilityGameID', 'polyStart', 'polyEnd', 'sourceID', 'sourceNameInstance', 'sourceNameInstanceUnique', 'sourceKey', 'targetID', 'targetNameInstance', 'targetNameInstanceUnique', 'targetKey']].copy()
+            df = merge_overlapping_intervals(df, ["targetKey", "targetNameInstanceUnique"], "polyStart", "polyEnd")
+            df['polyResults'] = self.generate_polys(df, y_center=0.5+self.config['row_num']+self.config['yOffset'], y_height=self.config['height'], max_stacks=self.config['max_stacks'], linkedTo=self.config['id'])
             
             self.df_poly = df
             self.num_poly = len(self.df_poly)
@@ -528,7 +720,7 @@ class PixolEnemyHealth(PixolGraphBase):
 
         row_spacing = 0.1
         df_health['y_val_norm'] = (1-(df_health['healthPerc']-0)/(1-0)) * self.config['row_span'] * (1-row_spacing*2/self.config['row_span']) + row_spacing + self.config['row_num']
-        df_health['results'] = df_health.apply(self.generate_area_datapoint, data_type='health', axis=1)
+        df_health['results'] = self.generate_area_datapoints(df_health)
 
         self.config['area_thres'] = (1-(0-0)/(1-0)) * self.config['row_span'] * (1-row_spacing*2/self.config['row_span']) + row_spacing + self.config['row_num']
 
@@ -539,6 +731,7 @@ class PixolEnemyHealth(PixolGraphBase):
         # if resourceActor is 1 (source), then update name
         mask = df_health.resourceActor == 1
         df_health.loc[mask,'targetNameInstanceUnique'] = df_health.loc[mask,'sourceNameInstanceUnique']
+        df_health.loc[mask,'targetKey'] = df_health.loc[mask,'sourceKey']
 
         self.df_poly = df_health
 
@@ -548,15 +741,12 @@ class PixolHeatingUp(PixolGraphBase):
     def generate_graph_df(self):
     #            (self.df["abilityGameName"].isin(["Fireball","Fire Blast","Scorch","Living Bomb","Frostfire Bolt"])) &\
 
-        mask = (
-                    (self.df["type"] == "damage") &
-                    (self.df["abilityGameID"].isin([133,44614,2948,11366,2136])) & # Fireball, Frostfire Bolt, Scorch, Pyroblast, Pyroblast
-                    (self.df["tick"]!=True)
-               )
-        if pd.notna(self.config.get('source_ids')):
-            mask = mask & (self.df["sourceID"].isin(self.config['source_ids']))
-
-        df = self.df.loc[mask].copy()
+        df = self.get_rows(
+            types=["damage"],
+            ability_ids=[133,44614,2948,11366,2136], # Fireball, Frostfire Bolt, Scorch, Pyroblast, Pyroblast
+            source_ids=pd.notna(self.config.get('source_ids')) and self.config['source_ids'] or None,
+        )
+        df = df.loc[df["tick"]!=True].copy()
 
         # Incremental count of crits with reset to 0 every time a non-crit occurs
         # https://stackoverflow.com/questions/45964740/python-pandas-cumsum-with-reset-everytime-there-is-a-0
@@ -578,7 +768,7 @@ class PixolHeatingUp(PixolGraphBase):
 
         row_spacing = 0.1
         df['y_val_norm'] = (1-(df['heatingUp']-0)/(df['heatingUp'].max()-0)) * self.config['row_span'] * (1-row_spacing*2/self.config['row_span']) + row_spacing + self.config['row_num']
-        df['results'] = df.apply(self.generate_area_datapoint, data_type='heating_up', axis=1)
+        df['results'] = self.generate_area_datapoints(df)
 
         df.rename({'heatingUp': 'y_val'}, axis=1, inplace=True)
         df['targetNameInstanceUnique'] = None
@@ -593,7 +783,7 @@ class PixolSpellPower(PixolGraphBase):
 
         row_spacing = 0.1
         df_spellPower['y_val_norm'] = (1-(df_spellPower['spellPower']-df_spellPower['spellPower'].min())/(df_spellPower['spellPower'].max()-df_spellPower['spellPower'].min())) * self.config['row_span'] * (1-row_spacing*2/self.config['row_span']) + row_spacing + self.config['row_num']
-        df_spellPower['results'] = df_spellPower.apply(self.generate_area_datapoint, data_type='spellpower', axis=1)
+        df_spellPower['results'] = self.generate_area_datapoints(df_spellPower)
 
         df_spellPower.rename({'spellPower': 'y_val'}, axis=1, inplace=True)
         # df_spellPower['targetNameInstanceUnique'] = df_spellPower.apply(lambda x: x['resourceActor'] == 1 and x['sourceNameInstanceUnique'] or x['resourceActor'] == 2 and x['targetNameInstanceUnique'] or None, axis=1)
@@ -612,7 +802,7 @@ class PixolMastery(PixolGraphBase):
 
         row_spacing = 0.1
         df_mastery['y_val_norm'] = (1-(df_mastery['mastery']-df_mastery['mastery'].min())/(df_mastery['mastery'].max()-df_mastery['mastery'].min())) * self.config['row_span'] * (1-row_spacing*2/self.config['row_span']) + row_spacing + self.config['row_num']
-        df_mastery['results'] = df_mastery.apply(self.generate_area_datapoint, data_type='mastery', axis=1)
+        df_mastery['results'] = self.generate_area_datapoints(df_mastery)
 
         df_mastery.rename({'mastery': 'y_val'}, axis=1, inplace=True)
         df_mastery['targetNameInstanceUnique'] = None
@@ -631,35 +821,35 @@ class PixolHaste(PixolGraphBase):
             47855: 3.0, # DS R6
         }
 
-        y = self.df[(self.df.sourceID.isin(self.config['source_ids'])) & (self.df["abilityGameID"].isin(dict_abilityGameID_to_castTime.keys())) & (self.df["type"].isin(["begincast","cast"]))].copy()
+        y = self.get_rows(source_ids=self.config['source_ids'], ability_ids=list(dict_abilityGameID_to_castTime.keys()), types=["begincast","cast"]).copy()
         y.insert(1,'castEnd', np.nan)
         y.insert(1,'castStart', np.nan)
         y.insert(1,'castDur', np.nan)
         y.insert(1,'haste', np.nan)
-        mask = (y.groupby(['abilityGameID','sourceNameInstanceUnique'])['type'].shift() == 'begincast') & (y.groupby(['abilityGameID','sourceNameInstanceUnique'])['type'].shift(0) == 'cast')
+        mask = (y.groupby(['abilityGameID','sourceKey'])['type'].shift() == 'begincast') & (y.groupby(['abilityGameID','sourceKey'])['type'].shift(0) == 'cast')
         mask = mask.shift(-1, fill_value=False)
         y.loc[mask,'castStart'] = y['timestamp']
         mask = y['castStart'].notna()
-        y.groupby(['abilityGameID','sourceNameInstanceUnique'])['timestamp'].shift()
-        y.loc[mask,'castEnd'] = y.groupby(['abilityGameID','sourceNameInstanceUnique'])['timestamp'].shift(-1)
-        y.loc[mask,'castDur'] =  y.groupby(['abilityGameID','sourceNameInstanceUnique'])['timestamp'].shift(-1) - y.groupby(['abilityGameID','sourceNameInstanceUnique'])['timestamp'].shift(0)
+        y.groupby(['abilityGameID','sourceKey'])['timestamp'].shift()
+        y.loc[mask,'castEnd'] = y.groupby(['abilityGameID','sourceKey'])['timestamp'].shift(-1)
+        y.loc[mask,'castDur'] =  y.groupby(['abilityGameID','sourceKey'])['timestamp'].shift(-1) - y.groupby(['abilityGameID','sourceKey'])['timestamp'].shift(0)
         mask = y['castDur'] > 0.01 # Lazy way to ignore insta-cast procs instead of checking for the buff at the time of begincast
         y.loc[mask,'haste'] = y["abilityGameID"].map(dict_abilityGameID_to_castTime)/y['castDur'] - 1
         haste1 = y[['timestamp','haste','abilityGameName','castDur','sourceID','sourceNameInstance','sourceNameInstanceUnique']].dropna(subset=['haste'])
 
         # ##############################
-        y = self.df[(self.df.sourceID.isin(self.config['source_ids'])) & (self.df["abilityGameID"].isin(dict_abilityGameID_to_channeledTickTime.keys())) & (self.df["type"].isin(["cast","damage"]))].copy()
+        y = self.get_rows(source_ids=self.config['source_ids'], ability_ids=list(dict_abilityGameID_to_channeledTickTime.keys()), types=["cast","damage"]).copy()
         y.insert(1,'castEnd', np.nan)
         y.insert(1,'castStart', np.nan)
         y.insert(1,'castDur', np.nan)
         y.insert(1,'haste', np.nan)
-        mask = (y.groupby(['abilityGameID','sourceNameInstanceUnique'])['type'].shift() == 'cast') & (y.groupby(['abilityGameID','sourceNameInstanceUnique'])['type'].shift(0) == 'damage')
+        mask = (y.groupby(['abilityGameID','sourceKey'])['type'].shift() == 'cast') & (y.groupby(['abilityGameID','sourceKey'])['type'].shift(0) == 'damage')
         mask = mask.shift(-1).fillna(False)
         y.loc[mask,'castStart'] = y['timestamp']
         mask = y['castStart'].notna()
-        y.groupby(['abilityGameID','sourceNameInstanceUnique'])['timestamp'].shift()
-        y.loc[mask,'castEnd'] = y.groupby(['abilityGameID','sourceNameInstanceUnique'])['timestamp'].shift(-1)
-        y.loc[mask,'castDur'] =  y.groupby(['abilityGameID','sourceNameInstanceUnique'])['timestamp'].shift(-1) - y.groupby(['abilityGameID','sourceNameInstanceUnique'])['timestamp'].shift(0)
+        y.groupby(['abilityGameID','sourceKey'])['timestamp'].shift()
+        y.loc[mask,'castEnd'] = y.groupby(['abilityGameID','sourceKey'])['timestamp'].shift(-1)
+        y.loc[mask,'castDur'] =  y.groupby(['abilityGameID','sourceKey'])['timestamp'].shift(-1) - y.groupby(['abilityGameID','sourceKey'])['timestamp'].shift(0)
         mask = y['castDur'] > 0.01
         y.loc[mask,'haste'] = y["abilityGameID"].map(dict_abilityGameID_to_channeledTickTime)/y['castDur'] - 1
         haste2 = y[['timestamp','haste','abilityGameName','castDur','sourceID','sourceNameInstance','sourceNameInstanceUnique']].dropna(subset=['haste'])
@@ -671,7 +861,7 @@ class PixolHaste(PixolGraphBase):
 
         row_spacing = 0.1
         df_haste['y_val_norm'] = (1-(df_haste['haste']-df_haste['haste'].min())/(df_haste['haste'].max()-df_haste['haste'].min())) * self.config['row_span'] * (1-row_spacing*2/self.config['row_span']) + row_spacing + self.config['row_num']
-        df_haste['results'] = df_haste.apply(self.generate_area_datapoint, data_type='haste', axis=1)
+        df_haste['results'] = self.generate_area_datapoints(df_haste)
         df_haste.rename({'haste': 'y_val'}, axis=1, inplace=True)
 
         self.df_poly = df_haste
@@ -680,22 +870,18 @@ class PixolMana(PixolGraphBase):
     data_type = 'mana'
     
     def generate_graph_df(self):
-        df_mana = self.df[self.df['resourceActorID'].isin(self.config['source_ids'])].dropna(subset='classResources')
-
-        def get_mana(x):
-            amt = [[r['amount'],r['max']] for r in x['classResources'] if r['type'] == 0]
-            if len(amt) > 0:
-                return amt[0]
-            return None, None
-
-        df_mana['mana'], df_mana['manaMax'] = zip(*df_mana.apply(get_mana, axis=1))
+        # manaAmount/manaMax: classResources flattened by WCLReportFightData (RESOURCE_TYPES)
+        if 'manaAmount' not in self.df.columns:
+            self.df_poly = None
+            return
+        df_mana = self.df[self.df['resourceActorID'].isin(self.config['source_ids'])].dropna(subset='manaAmount').copy()
+        df_mana['mana'] = df_mana['manaAmount']
         df_mana['manaPerc'] = df_mana['mana'] / df_mana['manaMax']
-        df_mana = df_mana.dropna(subset='mana')
 
         row_spacing = 0.1
         # df_mana['y_val_norm'] = (1-(df_mana['mana']-df_mana['mana'].min())/(df_mana['mana'].max()-df_mana['mana'].min())) * self.config['row_span'] * (1-row_spacing*2/self.config['row_span']) + row_spacing + self.config['row_num']
         df_mana['y_val_norm'] = (1-(df_mana['mana']-0)/(df_mana['mana'].max()-0)) * self.config['row_span'] * (1-row_spacing*2/self.config['row_span']) + row_spacing + self.config['row_num']
-        df_mana['results'] = df_mana.apply(self.generate_area_datapoint, data_type='mana', axis=1)
+        df_mana['results'] = self.generate_area_datapoints(df_mana)
 
         self.config['area_thres'] = (1-(0-0)/(1-0)) * self.config['row_span'] * (1-row_spacing*2/self.config['row_span']) + row_spacing + self.config['row_num']
 
@@ -722,7 +908,7 @@ class PixolMovement(PixolGraphBase):
 
         row_spacing = 0.1
         df_movement['y_val_norm'] = (1-(df_movement['distMoved']-df_movement['distMoved'].min())/(df_movement['distMoved'].max()-df_movement['distMoved'].min())) * self.config['row_span'] * (1-row_spacing*2/self.config['row_span']) + row_spacing + self.config['row_num']
-        df_movement['results'] = df_movement.apply(self.generate_area_datapoint, data_type='movement', axis=1)
+        df_movement['results'] = self.generate_area_datapoints(df_movement)
 
         df_movement.rename({'distMoved': 'y_val'}, axis=1, inplace=True)
         df_movement['targetNameInstanceUnique'] = None
@@ -733,71 +919,59 @@ class PixolCasts(PixolGraphBase):
     data_type = 'casts'
     
     def generate_graph_df(self):
-        mask = (self.df['sourceID'].isin(self.config['source_ids'])) & (self.df['type'].isin(['begincast','cast']))
+        y = self.get_rows(source_ids=self.config['source_ids'], types=['begincast','cast'])
+        mask = pd.Series(True, index=y.index)
         if pd.isna(self.config.get('include_melee')):
-            mask = (mask) & (self.df['abilityGameID'] > 1)
+            mask = (mask) & (y['abilityGameID'] > 1)
         if pd.notna(self.config.get('spell_ids')) is not False:
-            mask = (mask) & (self.df['abilityGameID'].isin(self.config['spell_ids']))
+            mask = (mask) & (y['abilityGameID'].isin(self.config['spell_ids']))
         if pd.notna(self.config.get('spell_ids_blacklist')) is not False:
-            mask = (mask) & (~self.df['abilityGameID'].isin(self.config['spell_ids_blacklist']))
-        y = self.df[mask].copy()
+            mask = (mask) & (~y['abilityGameID'].isin(self.config['spell_ids_blacklist']))
+        y = y[mask].copy()
 
         # get the start time for each begincast
         mask = (y.groupby('abilityGameID').shift()['type'] == "begincast") & (y.groupby('abilityGameID').shift(0)['type'] == "cast")
         y.loc[mask,'startTime'] = y.groupby(['abilityGameID'])['timestamp'].shift()
 
         df_casts = y[y['type']=='cast'].copy()
-        df_casts['results'] = df_casts.apply(self.generate_cast_scatter, y_center=0.5+self.config['row_num']+self.config['yOffset'], axis=1)
+        df_casts['results'] = self.generate_scatter_datapoints(df_casts, y_center=0.5+self.config['row_num']+self.config['yOffset'])
         df_casts['targetNameInstanceUnique'] = None
 
         self.df_poly = df_casts
 
 class PixolBuff(PixolGraphBase):
     def generate_graph_df(self):
-        mask = (self.df['abilityGameID'].isin(self.config['ability_ids'])) & (self.df['type'].isin(['applybuff','refreshbuff','removebuff']))
-        if pd.notna(self.config.get('target_ids')):
-            mask = (mask) & (self.df.targetID.isin(self.config['target_ids'])) 
-        df = self.df[mask].copy()
+        df = self.get_rows(ability_ids=self.config['ability_ids'], types=['applybuff','refreshbuff','removebuff'], target_ids=pd.notna(self.config.get('target_ids')) and self.config['target_ids'] or None).copy()
         df.insert(1, 'polyStart', np.nan)
         df.insert(2, 'polyEnd', np.nan)
         df.insert(2, 'polyClip', False)
         df.insert(3, 'polyResults', np.empty((len(df), 0)).tolist())
 
+        events = EventTransitions(df, ['abilityGameID','sourceKey','targetKey'])
+
         # handle cases where there's no initial applybuff event by setting initial timestamp to 0
-        # idx = get_idx_from_bool_series(df.groupby(['abilityGameID','sourceNameInstanceUnique','targetNameInstanceUnique']).nth(0)['type'].isin(['removebuff','refreshbuff'])) # only works for pandas >= 2.1.5?
-        idx = df.reset_index().groupby(['abilityGameID','sourceNameInstanceUnique','targetNameInstanceUnique']).nth(0).reset_index()['index']
-        idx = get_idx_from_bool_series(df.loc[idx,'type'].isin(['removebuff','refreshbuff']))
-        df.loc[idx, 'polyStart'] = 0
+        poly_start = np.where(events.match({1: [None], 0: ['removebuff','refreshbuff']}), 0, np.nan)
 
         # handle cases where there's no ending event after applybuff
-        # idx = get_idx_from_bool_series(df.groupby(['abilityGameID','sourceNameInstanceUnique','targetNameInstanceUnique']).nth(-1)['type'].isin(['applybuff','applybuff'])) # only works for pandas >= 2.1.5?
-        idx = df.reset_index().groupby(['abilityGameID','sourceNameInstanceUnique','targetNameInstanceUnique']).nth(-1).reset_index()['index']
-        idx = get_idx_from_bool_series(df.loc[idx,'type'].isin(['applybuff','applybuff']))
-        df.loc[idx, 'polyStart'] = df.loc[idx, 'timestamp']
-        df.loc[idx, 'polyEnd'] = self.fight_duration
+        mask = events.match({0: ['applybuff'], -1: [None]})
+        poly_start[mask] = df['timestamp'].to_numpy(dtype=np.float64)[mask]
+        df.loc[mask, 'polyEnd'] = self.fight_duration
 
-        # ['applybuff', 'refreshbuff'] -> ['refreshbuff', 'removebuff']
-        mask = (df.groupby(['abilityGameID','sourceNameInstanceUnique','targetNameInstanceUnique'])['type'].shift().isin(['applybuff','refreshbuff'])) & (df.groupby(['abilityGameID','sourceNameInstanceUnique','targetNameInstanceUnique'])['type'].shift(0).isin(['refreshbuff','removebuff']))
-        df.loc[mask,'polyStart'] = df.groupby(['abilityGameID','sourceNameInstanceUnique','targetNameInstanceUnique'])['timestamp'].shift()
-
-        if self.config.get("show_clip_on_refresh") == True:
-            mask = (df.groupby(['abilityGameID','sourceNameInstanceUnique','targetNameInstanceUnique'])['type'].shift().isin(['applybuff','refreshbuff'])) & (df.groupby(['abilityGameID','sourceNameInstanceUnique','targetNameInstanceUnique'])['type'].shift(0).isin(['refreshbuff']))
-            df.loc[mask,'polyClip'] = True
+        rules = self.config.get("show_clip_on_refresh") == True and BUFF_RULES_CLIP_ON_REFRESH or BUFF_RULES
+        df['polyStart'], df['polyClip'] = events.get_intervals(rules, poly_start=poly_start)
 
         mask = df['polyStart'].notna()
         df.loc[mask & (df['polyEnd'].isna()),'polyEnd'] = df['timestamp']
-        df.loc[mask,'polyResults'] = df.loc[mask].apply(self.generate_poly, y_center=0.5+self.config['row_num']+self.config['yOffset'], y_height=self.config['height'], max_stacks=self.config['max_stacks'], linkedTo=self.config['id'], axis=1)
+        df.loc[mask,'polyResults'] = self.generate_polys(df.loc[mask], y_center=0.5+self.config['row_num']+self.config['yOffset'], y_height=self.config['height'], max_stacks=self.config['max_stacks'], linkedTo=self.config['id'])
 
         # handle cases where the there's no ending removebuff event by setting initial timestamp to 0
-        # idx = get_idx_from_bool_series(df.groupby(['abilityGameID','sourceNameInstanceUnique','targetNameInstanceUnique']).nth(-1)['type'].isin(['refreshbuff'])) # only works for pandas >= 2.1.5?
-        idx = df.reset_index().groupby(['abilityGameID','sourceNameInstanceUnique','targetNameInstanceUnique']).nth(-1).reset_index()['index']
-        idx = get_idx_from_bool_series(df.loc[idx,'type'].isin(['refreshbuff']))
+        idx = get_idx_from_bool_series(pd.Series(events.match({0: ['refreshbuff'], -1: [None]}), index=df.index))
         df2 = df.loc[idx].copy()
         df2.loc[idx,'polyStart'] = df2.loc[idx,'timestamp']
         df2.loc[idx,'polyEnd'] = self.fight_duration
-        df.loc[idx,'polyResults'] += df2.apply(self.generate_poly, y_center=0.5+self.config['row_num']+self.config['yOffset'], y_height=self.config['height'], max_stacks=self.config['max_stacks'], linkedTo=self.config['id'], axis=1)
+        df.loc[idx,'polyResults'] += self.generate_polys(df2, y_center=0.5+self.config['row_num']+self.config['yOffset'], y_height=self.config['height'], max_stacks=self.config['max_stacks'], linkedTo=self.config['id'])
 
-        self.df_poly = df.loc[:,['abilityGameID', 'polyStart', 'polyEnd', 'sourceID', 'sourceNameInstance', 'sourceNameInstanceUnique', 'targetID', 'targetNameInstance', 'targetNameInstanceUnique', 'polyResults']]
+        self.df_poly = df.loc[:,['abilityGameID', 'polyStart', 'polyEnd', 'sourceID', 'sourceNameInstance', 'sourceNameInstanceUnique', 'sourceKey', 'targetID', 'targetNameInstance', 'targetNameInstanceUnique', 'targetKey', 'polyResults']]
         self.num_poly = len(self.df_poly)
 
 
@@ -131,6 +131,131 @@ function syncExtremes(e) {
     }
 } 
 
+/**
+ * Tooltips of series sent with compact point payloads (compact_tooltips in PixolClassAnalyzerGraph.py).
+ * The series carries custom.fmt, the points only the raw fields; the html is built here on hover.
+ */
+function getMMSS(ts) {
+    var mm = Math.floor(ts/60)
+    var ss = ts - mm*60
+    return mm.toFixed(0) + ":" + ss.toFixed(3).padStart(6, "0")
+}
+
+function wrapTrTd(s1, s2) {
+    return '<tr><td>' + s1 + ':</td><td style="text-align: left">' + s2 + '</td></tr>'
+}
+
+function formatNumber(v, decimals) {
+    // python f"{v:,.<decimals>f}"
+    if (v === null || v === undefined) {
+        return "nan"
+    }
+    return v.toLocaleString("en-US", {minimumFractionDigits: decimals, maximumFractionDigits: decimals})
+}
+
+function formatFixed(v, decimals) {
+    // python f"{v:.<decimals>f}"
+    if (v === null || v === undefined) {
+        return "nan"
+    }
+    return v.toFixed(decimals)
+}
+
+var pixolAreaTooltipFormatters = {
+    haste: function(p) {
+        var txt = wrapTrTd('Haste', formatFixed(p.haste, 1) + '%')
+        txt += wrapTrTd('Spell', p.abilityGameName)
+        if (p.castDur) {
+            txt += wrapTrTd('Dur', getMMSS(p.castDur))
+        }
+        return txt
+    },
+    spellpower: function(p) { return wrapTrTd('SP', formatNumber(p.spellPower, 0)) },
+    mastery: function(p) { return wrapTrTd('Mastery', formatNumber(p.mastery, 5)) },
+    mana: function(p) { return wrapTrTd('Mana', formatNumber(p.mana, 0) + ' / ' + formatNumber(p.manaMax, 0) + ' (' + formatFixed(p.manaPerc*100, 2) + '%)') },
+    enemy_health: function(p) { return wrapTrTd('HP', formatNumber(p.hitPoints, 0) + ' / ' + formatNumber(p.maxHitPoints, 0) + ' (' + formatFixed(p.healthPerc*100, 2) + '%)') },
+    movement: function(p) { return wrapTrTd('Dist', formatFixed(p.distMoved, 0) + ' yds') },
+    heating_up: function(p) { return wrapTrTd('Heating Up', formatFixed(p.heatingUp, 0)) },
+    ignite_storage: function(p) { return wrapTrTd('Ignite Stored', formatNumber(p.igniteStorage, 0)) },
+    ignite_tick_estimate: function(p) { return wrapTrTd('Ignite Tick Estimate', formatNumber(p.y_val, 0)) },
+}
+
+function formatPolyTooltip(v) {
+    // v: POLY_TOOLTIP_FIELDS
+    var [polyStart, polyEnd, polyStacks, amount, isCrit, absorbed, overkill, resisted, resistedRatio, amountTotal, dmgMultiplier, target] = v
+    var txt = wrapTrTd('Start', getMMSS(polyStart))
+    txt += wrapTrTd('End', getMMSS(polyEnd))
+    txt += wrapTrTd('Dur', getMMSS(polyEnd-polyStart))
+    if (polyStacks) {
+        txt += wrapTrTd('Stacks', formatFixed(polyStacks, 0))
+    }
+    if (amount !== null) {
+        var show_total = false
+        // note: crit flag does not get set on fully absorbed damage events
+        var str_amt = isCrit ? '*' + formatNumber(amount, 0) + '*' : formatNumber(amount, 0)
+        if (absorbed !== 0) {
+            str_amt += ' (A: ' + formatNumber(absorbed, 0) + ')'
+            show_total = true
+        }
+        if (overkill !== 0) {
+            str_amt += ' (O: ' + formatNumber(overkill, 0) + ')'
+            show_total = true
+        }
+        if (resisted !== 0) {
+            str_amt += ' (R: ' + formatNumber(resistedRatio === null ? null : resistedRatio*100, 0) + '%)'
+            show_total = true
+        }
+        if (show_total) {
+            str_amt += ' (T: ' + formatNumber(amountTotal, 0) + ')'
+        }
+        txt += wrapTrTd('Amt', str_amt)
+    }
+    if (dmgMultiplier !== null) {
+        txt += wrapTrTd('Bonus', formatFixed(dmgMultiplier, 2) + 'x')
+    }
+    if (target !== null) {
+        txt += wrapTrTd('Target', target)
+    }
+    return txt
+}
+
+function formatScatterTooltip(p, showAmount) {
+    // p: SCATTER_TOOLTIP_FIELDS
+    var txt
+    if (p.startTime !== null && p.startTime !== undefined) {
+        txt = wrapTrTd('Start', getMMSS(p.startTime))
+        txt += wrapTrTd('End', getMMSS(p.timestamp))
+    }
+    else {
+        txt = wrapTrTd('Time', getMMSS(p.timestamp))
+    }
+    txt += wrapTrTd('Spell', p.abilityGameName)
+    txt += wrapTrTd('ID', p.abilityGameID)
+    if (p.targetNameInstanceUnique !== null && p.targetNameInstanceUnique !== undefined) {
+        txt += wrapTrTd('Target', p.targetNameInstanceUnique)
+    }
+    if (showAmount && p.amountTotal !== null && p.amountTotal !== undefined) {
+        txt += wrapTrTd('Amt', formatNumber(p.amountTotal, 0))
+    }
+    return txt
+}
+
+function pixolFormatTooltip(point) {
+    var custom = point.series.userOptions.custom
+    if (custom.fmt == 'poly') {
+        return formatPolyTooltip(custom.v)
+    }
+    if (custom.fmt == 'scatter' || custom.fmt == 'cast') {
+        return formatScatterTooltip(point.options, custom.fmt == 'scatter')
+    }
+    var txt = wrapTrTd('Start', getMMSS(point.x))
+    var formatter = pixolAreaTooltipFormatters[custom.fmt]
+    if (formatter !== undefined) {
+        txt += formatter(point.options)
+    }
+    return txt
+}
+
 
 
 
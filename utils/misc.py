@@ -3,6 +3,8 @@ from typing import (
     Dict,
     TypeVar,
 )
+import numpy as np
+import pandas as pd
 KeyType = TypeVar('KeyType')
 
 # https://github.com/pydantic/pydantic/blob/fd2991fe6a73819b48c906e3c3274e8e47d0f761/pydantic/utils.py#L200
@@ -24,6 +26,11 @@ def get_mmss(ts):
     out = f'{mm:0.0f}:{ss:06.3f}'
     return out
 
+def get_mmss_list(ts):
+    # get_mmss of each value of an array
+    mm, ss = np.divmod(np.asarray(ts, dtype=np.float64), 60)
+    return [f'{m:0.0f}:{s:06.3f}' for m, s in zip(mm.tolist(), ss.tolist())]
+
 def wrap_trtd(s1,s2):
     return f'<tr><td>{s1}:</td><td style="text-align: left">{s2}</td></tr>'
 
@@ -35,4 +42,88 @@ def merge_overlapping_intervals(df, cols_grp, col_start, col_end, col_tmp_overri
     df[col_tmp_override] = df.groupby(cols_grp)[col_end].shift() + 0.002 # 0.002 is to fix a "bug" where debuff refreshes with 0.001s downtime + floating point rounding error
     df[col_tmp_override] = df.groupby(cols_grp)[col_start].shift(0) > df.groupby(cols_grp)[col_tmp_override].cummax()
     df[col_tmp_override] = df.groupby(cols_grp)[col_tmp_override].cumsum()
-    return df.groupby(cols_grp+[col_tmp_override]).agg({col_start:"min", col_end: "max"}).reset_index()[cols_grp+[col_start,col_end]]
\ No newline at end of file
+    return df.groupby(cols_grp+[col_tmp_override], observed=True).agg({col_start:"min", col_end: "max"}).reset_index()[cols_grp+[col_start,col_end]]
+
+class EventTransitions:
+    # Lags/leads of the events of each group (e.g. ability, source, target), for interval rules like
+    # ['applybuff','refreshbuff'] -> ['refreshbuff','removebuff'] without a groupby().shift() per condition.
+    # The frame is sorted once by group (stable, so events keep their order within a group), a shift is then a slice
+    # of the sorted arrays. Same semantics as groupby(keys).shift(periods): missing outside of the group, rows with a
+    # NaN key belong to no group.
+    def __init__(self, df, keys, col_type='type', col_time='timestamp'):
+        group = df.groupby(keys, sort=False).ngroup().to_numpy(dtype=np.float64, na_value=np.nan)
+        group = np.where(np.isnan(group), -1, group).astype(np.int64)
+        self.order = np.argsort(group, kind='stable')
+        self.group = group[self.order]
+        type_codes, self.types = pd.factorize(df[col_type])
+        self.type_codes = type_codes[self.order]
+        self.timestamp = df[col_time].to_numpy(dtype=np.float64)[self.order]
+        self._valid = {}
+
+    def __len__(self):
+        return len(self.order)
+
+    def _is_valid(self, periods):
+        # row i has a row i-periods in the same group
+        if periods not in self._valid:
+            n = len(self)
+            valid = np.zeros(n, dtype=bool)
+            if abs(periods) < n:
+                if periods >= 0:
+                    valid[periods:] = self.group[periods:] == self.group[:n-periods]
+                else:
+                    valid[:periods] = self.group[:periods] == self.group[-periods:]
+            self._valid[periods] = valid & (self.group >= 0)
+        return self._valid[periods]
+
+    def _shift(self, values, periods, fill):
+        # shift of sorted values within the groups
+        n = len(self)
+        out = np.full(n, fill, dtype=values.dtype)
+        if abs(periods) < n:
+            if periods >= 0:
+                out[periods:] = values[:n-periods]
+            else:
+                out[:periods] = values[-periods:]
+        out[~self._is_valid(periods)] = fill
+        return out
+
+    def _unsort(self, values):
+        out = np.empty_like(values)
+        out[self.order] = values
+        return out
+
+    def _match(self, types, new_timestamp=False, max_gap=None):
+        # types: {periods: list of types}, None in the list matches a missing event (e.g. {1: [None]}: first of its group)
+        # new_timestamp: timestamp differs from the previous event, max_gap: {periods: seconds} between the event at periods and the one before it
+        mask = np.ones(len(self), dtype=bool)
+        for periods, list_type in types.items():
+            codes = [i for i, t in enumerate(self.types) if t in list_type] + (None in list_type and [-1] or [])
+            mask &= np.isin(self._shift(self.type_codes, periods, -1), codes)
+        if new_timestamp:
+            mask &= self._shift(self.timestamp, 1, np.nan) != self.timestamp
+        for periods, seconds in (max_gap or {}).items():
+            mask &= (self._shift(self.timestamp, periods, np.nan) - self._shift(self.timestamp, periods+1, np.nan)) < seconds
+        return mask
+
+    def match(self, types, new_timestamp=False, max_gap=None):
+        # bool mask in the row order of the frame, see _match
+        return self._unsort(self._match(types, new_timestamp, max_gap))
+
+    def shift(self, periods=1):
+        # groupby(keys)['timestamp'].shift(periods) in the row order of the frame
+        return self._unsort(self._shift(self.timestamp, periods, np.nan))
+
+    def get_intervals(self, rules, poly_start=None, poly_clip=None):
+        # Run the transition rules in order, a later rule overrides an earlier one on the rows it matches.
+        # rule: dict(types=..., new_timestamp=..., max_gap=... (see _match),
+        #            start=periods of the event starting the interval ending at the row (None: no interval), clip=polyClip)
+        # Returns (polyStart, polyClip) in the row order of the frame.
+        poly_start = np.full(len(self), np.nan) if poly_start is None else np.asarray(poly_start, dtype=np.float64)[self.order]
+        poly_clip = np.zeros(len(self), dtype=bool) if poly_clip is None else np.asarray(poly_clip, dtype=bool)[self.order]
+        for rule in rules:
+            mask = self._match(rule['types'], rule.get('new_timestamp', False), rule.get('max_gap'))
+            poly_start[mask] = np.nan if rule['start'] is None else self._shift(self.timestamp, rule['start'], np.nan)[mask]
+            if 'clip' in rule:
+                poly_clip[mask] = rule['clip']
+        return self._unsort(poly_start), self._unsort(poly_clip)
@@ -0,0 +1,103 @@
+import os
+import time
+import zlib
+import hashlib
+
+from utils.wcl.PixolWCLQuery import is_report_finished
+
+class WCLQueryCache:
+    # Content-addressed on-disk cache of raw WCL GraphQL responses (zlib-compressed blobs in SQLite)
+    # - key: normalized query text + report code
+    # - entries expire after ttl seconds unless their report is finished (immutable),
+    #   WCLClient only puts responses of finished reports (live ones change with every query)
+    # - total size is bounded by max_bytes, least recently used entries are evicted first
+    def __init__(self, path="./.wcl_cache/wcl_cache.sqlite", ttl=3600, max_bytes=512*1024**2, finished_grace=3600):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.finished_grace = finished_grace # seconds since the last fight ended before a report is treated as finished
+        # imported here, sqlite3 is not loaded by default in pyodide and this module is also shipped to the browser
+        import sqlite3
+        self._con = sqlite3.connect(path, check_same_thread=False)
+        self._con.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                report_code TEXT,
+                body BLOB,
+                size INTEGER,
+                created REAL,
+                last_access REAL,
+                immutable INTEGER
+            )
+        """)
+        self._con.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self._con.execute("CREATE INDEX IF NOT EXISTS responses_report_code ON responses (report_code)")
+        self._con.execute("CREATE TABLE IF NOT EXISTS immutable_reports (report_code TEXT PRIMARY KEY)")
+        self._con.commit()
+
+    @staticmethod
+    def normalize_query(query):
+        return " ".join(query.split())
+
+    @classmethod
+    def get_key(cls, query, report_code):
+        return hashlib.sha256(f"{report_code}\0{cls.normalize_query(query)}".encode('utf-8')).hexdigest()
+
+    def get(self, query, report_code):
+        key = self.get_key(query, report_code)
+        row = self._con.execute("SELECT body, created, immutable FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+
+        body, created, immutable = row
+        now = time.time()
+        if not immutable and (now - created) > self.ttl:
+            self._con.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._con.commit()
+            return None
+
+        self._con.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+        self._con.commit()
+        return zlib.decompress(body)
+
+    def put(self, query, report_code, body):
+        key = self.get_key(query, report_code)
+        blob = zlib.compress(body)
+        now = time.time()
+        self._con.execute(
+            "INSERT OR REPLACE INTO responses (key, report_code, body, size, created, last_access, immutable) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, report_code, blob, len(blob), now, now, int(self.is_report_immutable(report_code))),
+        )
+        self._evict()
+        self._con.commit()
+
+    def is_report_immutable(self, report_code):
+        return self._con.execute("SELECT 1 FROM immutable_reports WHERE report_code = ?", (report_code,)).fetchone() is not None
+
+    def is_report_finished(self, report):
+        return is_report_finished(report, self.finished_grace)
+
+    def mark_report_immutable(self, report_code):
+        self._con.execute("INSERT OR IGNORE INTO immutable_reports (report_code) VALUES (?)", (report_code,))
+        self._con.execute("UPDATE responses SET immutable = 1 WHERE report_code = ?", (report_code,))
+        self._con.commit()
+
+    def _evict(self):
+        total = self._con.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._con.execute("SELECT key, size FROM responses ORDER BY last_access ASC").fetchall():
+            self._con.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def clear(self):
+        self._con.execute("DELETE FROM responses")
+        self._con.execute("DELETE FROM immutable_reports")
+        self._con.commit()
+
+    def close(self):
+        self._con.close()
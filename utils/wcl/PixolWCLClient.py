@@ -1,9 +1,18 @@
-import requests
 import json
+import time
+from collections import Counter
+from itertools import takewhile
 from dataclasses import dataclass, field
 import pandas as pd
+import numpy as np
 import asyncio
 from utils.wcl.PixolWCLReport import WCLReportMetaData, WCLReportFightData
+from utils.wcl.PixolWCLTransport import get_default_transport
+from utils.wcl.PixolWCLScheduler import get_scheduler, PRIORITY_INTERACTIVE, PRIORITY_BATCH
+from utils.wcl.PixolWCLToken import get_token_store
+from utils.wcl.PixolWCLQuery import build_metadata_query, is_report_finished, estimate_metadata_query, estimate_events_page
+from utils.wcl.PixolWCLIngest import WCLEventColumns, decode_streaming, get_events_data_path
+from utils.wcl.PixolWCLStore import get_stream_key
 
 # /lib/python3.11/site-packages/urllib3/connectionpool.py:1101:
 # InsecureRequestWarning: Unverified HTTPS request is being made to host 'classic.warcraftlogs.com'.
@@ -34,16 +43,55 @@ class UnauthenticatedQuery(WCLClientException):
 
 class WCLClient:
     base_url = "https://classic.warcraftlogs.com/api/v2/client"
+    token_url = "https://www.warcraftlogs.com/oauth/token"
     _zones = None
-    _token = None
 
-    def __init__(self, client_id="", client_secret=""):
+    # shared by all clients in the process
+    _inflight = {}      # (client_id, normalized query): task of the raw response body, see _get_response_body
+    _metadata_memo = {} # (client_id, report_code, includeAllFightsAsEncounters): (task, created), see _get_metadata
+    metadata_memo_size = 32
+    metadata_ttl = 60   # seconds, metadata of unfinished (live) reports is refetched after this
+
+    def __init__(self, client_id="", client_secret="", transport=None, num_windows=1, max_concurrency=4, cache=None, priority=PRIORITY_INTERACTIVE, scheduler=None, token_store=None, base_url=None, token_url=None, fight_store=None):
         self._client_id = client_id
         self._client_secret = client_secret
-        self._session = None
+        self._session = transport
+
+        # endpoints can be pointed at a local stand-in (see PixolWCLReplay.WCLReplayServer)
+        if base_url is not None:
+            self.base_url = base_url
+        if token_url is not None:
+            self.token_url = token_url
+
+        # oauth tokens are shared by all clients with the same client_id (no extra round trip per new client)
+        self._token_store = token_store or get_token_store()
+        self._cache = cache # optional WCLQueryCache for report queries
+        self._fight_store = fight_store # optional WCLFightStore of processed fight data (finished reports)
+
+        # requests are throttled by a scheduler shared by all clients with the same client_id
+        self._scheduler = scheduler or get_scheduler(client_id)
+        self.priority = priority
+
+        # num_windows > 1 splits each fight into time windows that are paginated concurrently
+        self.num_windows = num_windows
+        self.max_concurrency = max_concurrency
+
+        # whole-report prefetch of the current report, see prefetch_report: dict(report_code, fight_ids, aliases {stream key: alias}, task) or None
+        self._prefetched = None
+
+    def _get_session(self):
+        # Transport is created lazily so the pooled session is bound to the running event loop
+        if self._session is None:
+            self._session = get_default_transport()
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
 
     async def _generate_token(self):
-        url = "https://www.warcraftlogs.com/oauth/token"
+        url = self.token_url
         headers = {
             'Accept': "application/json",
         }
@@ -54,15 +102,15 @@ class WCLClient:
             'grant_type': 'client_credentials'
         }
 
-        response = requests.post(url, headers=headers, data=data)
-        response_json = json.loads(response.text)
+        response = await self._get_session().post(url, headers=headers, data=data)
+        response_json = response.json()
 
         if 'access_token' not in response_json:
-            raise UnauthenticatedQuery()
+            raise UnauthenticatedQuery('Unauthenticated Query')
         
-        return json.loads(response.text)['access_token']
+        return response_json
 
-    async def get_api_rate(self):
+    async def _get_rate_limit_data(self):
         query = """
                 query{
                   rateLimitData {
@@ -72,35 +120,111 @@ class WCLClient:
                   }
                 }
                 """
-        data = await self._query(query)
-        return '%.1f/%d WCL Points Used (%.1f%%) [Reset: %02dm %02ds]'%(data['data']['rateLimitData']['pointsSpentThisHour'],data['data']['rateLimitData']['limitPerHour'],data['data']['rateLimitData']['pointsSpentThisHour']/data['data']['rateLimitData']['limitPerHour']*100,data['data']['rateLimitData']['pointsResetIn']//60,data['data']['rateLimitData']['pointsResetIn']%60)
+        # bypasses the scheduler (it is what feeds the scheduler)
+        response = await self._post_query(query)
+        rate_limit_data = response.json()['data']['rateLimitData']
+        self._scheduler.update_from_rate_limit_data(rate_limit_data)
+        return rate_limit_data
+
+    async def _refresh_rate_limit(self):
+        # concurrent callers share a single in-flight rateLimitData request
+        if self._scheduler.refresh_task is None or self._scheduler.refresh_task.done():
+            self._scheduler.refresh_task = asyncio.ensure_future(self._get_rate_limit_data())
+        await self._scheduler.refresh_task
 
-    async def _query(self, query):
-        if not self._token:
-            self._token = await self._generate_token()
+    async def get_api_rate(self):
+        data = await self._get_rate_limit_data()
+        return '%.1f/%d WCL Points Used (%.1f%%) [Reset: %02dm %02ds]'%(data['pointsSpentThisHour'],data['limitPerHour'],data['pointsSpentThisHour']/data['limitPerHour']*100,data['pointsResetIn']//60,data['pointsResetIn']%60)
+
+    async def _post_query(self, query):
+        token = await self._token_store.get_token(self._client_id, self._client_secret, self._generate_token)
 
         headers = {
             'Content-Type': "application/json",
             'Accept': "application/json",
-            'Authorization': f"Bearer {self._token}"
+            'Authorization': f"Bearer {token}"
         }
-        response = requests.post(self.base_url, json={'query': query}, headers=headers)
-        response_json = json.loads(response.text)
+
+        attempt = 0
+        while True:
+            response = await self._get_session().post(self.base_url, json_body={'query': query}, headers=headers)
+            if not self._scheduler.is_retryable(response.status):
+                return response
+
+            if response.status == 429:
+                self._scheduler.on_throttled()
+            if attempt >= self._scheduler.max_retries:
+                raise TemporaryUnavailable(f'WCL API Temporarily Unavailable (HTTP {response.status})')
+            await asyncio.sleep(self._scheduler.get_backoff(attempt, response.headers.get('Retry-After')))
+            attempt += 1
+
+    async def _request_body(self, query, report_code=None, priority=None, cost=1):
+        # raw response body, from the cache or the API, and whether it still has to be cached
+        # cost: estimated WCL points of the query, taken from the scheduler's bucket (see PixolWCLQuery estimates)
+        if self._cache is not None and report_code is not None:
+            body = self._cache.get(query, report_code)
+            if body is not None:
+                return body, False
+
+        if self._scheduler.is_rate_limit_stale():
+            await self._refresh_rate_limit()
+        await self._scheduler.acquire(priority=self.priority if priority is None else priority, cost=cost)
+
+        response = await self._post_query(query)
+        return response.body, True
+
+    async def _get_response_body(self, query, report_code=None, priority=None, cost=1):
+        # Single-flight: concurrent identical queries of the same API client share one in-flight request and its raw body.
+        # Returns (body, entry), entry['put'] is True until one of the callers has validated and cached the response.
+        key = (self._client_id, " ".join(query.split()))
+        entry = self._inflight.get(key)
+        if entry is None or entry['task'].get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(self._request_body(query, report_code, priority, cost))
+            entry = self._inflight[key] = {'task': task, 'put': None}
+            task.add_done_callback(lambda _: self._inflight.get(key) is entry and self._inflight.pop(key))
+
+        # shielded, a cancelled caller must not cancel the request shared with the others
+        body, put = await asyncio.shield(entry['task'])
+        if entry['put'] is None:
+            entry['put'] = put
+        return body, entry
+
+    async def _query(self, query, report_code=None, priority=None, sinks=None, cost=1):
+        # sinks: {json key path: callable}, arrays at these paths are streamed element by element into the callable
+        # (see decode_streaming) instead of being returned
+        body, entry = await self._get_response_body(query, report_code, priority, cost)
+        response_json = sinks and decode_streaming(body, sinks) or json.loads(body)
 
         if "errors" in response_json:
             # logging.error(response_json["errors"])
             error_msg = response_json["errors"][0]["message"]
 
             if error_msg == "You do not have permission to view this report.":
-                raise Exception('Private Report')
+                raise PrivateReport('Private Report')
             elif error_msg == "This report does not exist.":
-                raise Exception('Invalid Report')
+                raise InvalidReport('Invalid Report')
         elif "error" in response_json:
             if response_json["error"] == "Unauthenticated.":
-                raise Exception('Unauthenticated Query')
+                # token was revoked or expired early, the next query will request a new one
+                self._token_store.invalidate(self._client_id)
+                raise UnauthenticatedQuery('Unauthenticated Query')
+        elif entry['put'] and self._cache is not None and report_code is not None and self._is_cacheable(report_code, response_json):
+            entry['put'] = False
+            self._cache.put(query, report_code, body)
 
         return response_json
 
+    def _is_cacheable(self, report_code, response_json):
+        # Only responses of finished reports are cached, a live report returns more fights/events on every query.
+        # A metadata response tells by itself (and marks the report immutable), other queries once the report is marked.
+        if self._cache.is_report_immutable(report_code):
+            return True
+        report = ((response_json.get('data') or {}).get('reportData') or {}).get('report') or {}
+        if 'fights' in report and self._is_report_finished(report):
+            self._cache.mark_report_immutable(report_code)
+            return True
+        return False
+
     async def _get_encounters(self):
         if not self._zones:
             encounter_query = """
@@ -124,111 +248,49 @@ class WCLClient:
             }
         return self._encounters
 
-    async def _get_metadata(self, report_code, includeAllFightsAsEncounters=False):
-        meta_data_query = """
-            query{
-                reportData
-                {
-                    report(code:"%s")
-                    {
-                        title
-                        startTime
-                        playerDetails(startTime:0, endTime: 10000000000)
-                        fights
-                        {
-                            id
-                            name
-                            difficulty
-                            encounterID
-                            hardModeLevel
-                            bossPercentage
-                            fightPercentage
-                            kill
-                            lastPhase
-                            lastPhaseAsAbsoluteIndex
-                            lastPhaseIsIntermission
-                            friendlyPlayers
-                            startTime
-                            endTime
-                            size
-                            phaseTransitions
-                            {
-                                id,
-                                startTime,
-                            }
-                            enemyNPCs
-                            {
-                                gameID
-                                id
-                                instanceCount
-                                groupCount
-                                petOwner
-                            }
-                            enemyPets
-                            {
-                                gameID
-                                id
-                                instanceCount
-                                groupCount
-                                petOwner
-                            }
-                            enemyPlayers
-                            friendlyNPCs
-                            {
-                                gameID
-                                id
-                                instanceCount
-                                groupCount
-                                petOwner
-                            }
-                            friendlyPets
-                            {
-                                gameID
-                                id
-                                instanceCount
-                                groupCount
-                                petOwner
-                            }
-                        }
-                        guild{
-                            name
-                            server{
-                                name
-                            }
-                        }
-                        masterData
-                        {
-                            abilities
-                            {
-                                gameID
-                                name
-                                type
-                                icon
-                            }
-                            actors
-                            {
-                                gameID
-                                petOwner
-                                icon
-                                id
-                                name
-                                type
-                                subType
-                                server
-                            }
-                        }
-                    }
-                }
-            }
-        """ % (report_code)
+    def _is_report_finished(self, report):
+        if self._cache is not None:
+            return self._cache.is_report_finished(report)
+        return is_report_finished(report)
+
+    async def _get_metadata(self, report_code, includeAllFightsAsEncounters=False, fields=None):
+        # fields: selection under report(code) the analyzer needs (see PixolWCLQuery), None selects everything
+        # In-memory memo shared by all clients: concurrent and repeated calls for a report share one fetch.
+        # Finished reports are kept until evicted, live ones are refetched after metadata_ttl seconds.
+        key = (self._client_id, report_code, includeAllFightsAsEncounters, build_metadata_query(report_code, fields))
+        memo = self._metadata_memo.get(key)
+        now = time.monotonic()
+        if memo is not None:
+            task, created = memo
+            if task.get_loop() is not asyncio.get_running_loop():
+                memo = None
+            elif task.done() and not task.cancelled() and task.exception() is None and now - created > self.metadata_ttl and not self._is_report_finished(task.result().rawData):
+                memo = None
+        if memo is None:
+            memo = self._metadata_memo[key] = (asyncio.ensure_future(self._fetch_metadata(report_code, includeAllFightsAsEncounters, fields)), now)
+            while len(self._metadata_memo) > self.metadata_memo_size:
+                del self._metadata_memo[next(iter(self._metadata_memo))]
+
+        try:
+            return await asyncio.shield(memo[0])
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            if self._metadata_memo.get(key) is memo:
+                del self._metadata_memo[key]
+            raise
+
+    async def _fetch_metadata(self, report_code, includeAllFightsAsEncounters=False, fields=None):
+        meta_data_query = build_metadata_query(report_code, fields)
 
-        return WCLReportMetaData((await self._query(meta_data_query))['data']['reportData']['report'], includeAllFightsAsEncounters, report_code)
+        report = (await self._query(meta_data_query, report_code=report_code, cost=estimate_metadata_query(fields).points))['data']['reportData']['report']
+        return WCLReportMetaData(report, includeAllFightsAsEncounters, report_code)
 
-    async def _fetch_events(self, report_code, fight_id=None, source_id=None, filter_exp=None, include_deaths=False, include_combatant_info=False, metadata=None):
+    async def _fetch_events(self, report_code, fight_id=None, source_id=None, filter_exp=None, include_deaths=False, include_combatant_info=False, metadata=None, num_windows=None, max_concurrency=None, include_resources=True):
+        num_windows = num_windows or self.num_windows
+        max_concurrency = max_concurrency or self.max_concurrency
         deaths = []
-        events = []
         combatant_info = []
-        next_page_timestamp = 0
         entrySourceID = source_id and f"sourceID: {source_id}" or ""
         entryFightID = fight_id and f"fightIDs: [{fight_id}]" or ""
         filter_exp_base = 'type != "combatantinfo"'
@@ -268,10 +330,10 @@ class WCLClient:
     report(code: "%(report_code)s") {
       events(
         startTime: %(next_page_timestamp)s
-        endTime: 100000000000
+        endTime: %(end_timestamp)s
         %(entrySourceID)s
         useActorIDs: true
-        includeResources: true
+        %(entryIncludeResources)s
         %(entryFightID)s
         %(entryFilterExp)s
         limit: 10000
@@ -284,27 +346,299 @@ class WCLClient:
     }
   }
 }
-"""\
+"""
+        query_args = dict(
+            report_code=report_code,
+            entryIncludeResources=include_resources and "includeResources: true" or "",
+            entrySourceID=entrySourceID,
+            entryFightID=entryFightID,
+            entryFilterExp=entryFilterExp,
+        )
+
+        # deaths/combatantInfo are not paginated, so they are only requested alongside the first page of the first window
+        events_query_t_first = events_query_t\
         .replace("%(deathsQuery)s", deaths_query)\
         .replace("%(combatantInfoQuery)s", combatant_info_query)
+        events_query_t = events_query_t\
+        .replace("%(deathsQuery)s", "")\
+        .replace("%(combatantInfoQuery)s", "")
+
+        if num_windows > 1 and metadata is not None and fight_id:
+            windows = self._get_fight_windows(metadata, fight_id, num_windows)
+        else:
+            windows = [(0, 100000000000)]
+
+        # a single window streams its pages straight into columnar buffers, multiple windows are stitched first
+        columns = len(windows) == 1 and WCLEventColumns() or None
+
+        duration = self._get_stream_duration(metadata, fight_id)
+        cost = estimate_events_page(duration and duration/len(windows), source_id is None and 400 or 40, include_resources)
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+        async def fetch_window(i, start_timestamp, end_timestamp):
+            async with semaphore:
+                return await self._fetch_event_window(i == 0 and events_query_t_first or events_query_t, events_query_t, query_args, start_timestamp, end_timestamp, sink=columns is not None and columns.append or None, cost=cost)
+
+        results = await asyncio.gather(*[fetch_window(i, start_timestamp, end_timestamp) for i, (start_timestamp, end_timestamp) in enumerate(windows)])
 
+        r = results[0][1]
+        if r.get('combatantInfo'):
+            combatant_info = r["combatantInfo"]["data"]
+        if r.get('deaths'):
+            deaths = [death for death in r["deaths"]["data"] if death["type"] == "death"]
+
+        if columns is not None:
+            events = columns
+        else:
+            events = WCLEventColumns()
+            events.extend(self._stitch_event_windows([window_events for window_events, _ in results]))
+
+        return WCLReportFightData(events, metadata=metadata, fight_id=fight_id), combatant_info, deaths
+
+    @staticmethod
+    def _build_events_selection(alias, start_timestamp, end_timestamp=100000000000, source_id=None, fight_id=None, filter_exp=None, data_type=None, include_resources=True, paginate=True):
+        # one aliased events() selection, several of these can be sent in a single report query
+        entries = [
+            f"startTime: {start_timestamp}",
+            f"endTime: {end_timestamp}",
+            "useActorIDs: true",
+        ]
+        if source_id is not None:
+            entries.append(f"sourceID: {source_id}")
+        if fight_id:
+            entries.append(f"fightIDs: [{fight_id}]")
+        if data_type:
+            entries.append(f"dataType: {data_type}")
+        if include_resources and paginate:
+            entries.append("includeResources: true")
+        if filter_exp:
+            filter_exp = filter_exp.replace("\"","\\\"")
+            entries.append(f"filterExpression: \"{filter_exp}\"")
+        entries.append("limit: 10000")
+
+        fields = paginate and "nextPageTimestamp\n        data" or "data"
+        return """
+      %s: events(
+        %s
+      ) {
+        %s
+      }""" % (alias, "\n        ".join(entries), fields)
+
+    async def _fetch_events_batched(self, report_code, streams, fight_id=None, metadata=None, partition_by_fight=False, start_timestamps=None, use_cache=True, priority=None):
+        # Fetch several event streams with GraphQL aliases, one request per page for all of them.
+        # streams: {alias: dict(source_id=None, filter_exp=None, data_type=None, include_resources=True)}
+        # dataType CombatantInfo/Deaths streams are not paginated and only requested with the first page.
+        # Paginated streams advance their own nextPageTimestamp until each is exhausted.
+        # partition_by_fight: return {alias: {fight id: (columns, num_rows) or list}} instead (whole-report prefetch)
+        # start_timestamps: {alias: report-relative ms} to resume paginated streams from (live polling, see _fetch_new_events)
+        # priority: scheduler priority of the page requests, None for the client's own (PRIORITY_BATCH for prefetches)
+        if fight_id and not partition_by_fight and start_timestamps is None:
+            out = self._get_prefetched_events(report_code, streams, fight_id, metadata)
+            if out is not None:
+                return out
+            if self._fight_store is not None:
+                out = self._fight_store.load_streams(report_code, fight_id, streams, metadata=metadata)
+                if out is not None:
+                    return out
+
+        filter_exp_base = 'type != "combatantinfo"'
+        list_paginated = [alias for alias, stream in streams.items() if stream.get('data_type') not in ['CombatantInfo','Deaths']]
+        next_page_timestamps = {alias: (start_timestamps or {}).get(alias, 0) for alias in list_paginated}
+        events = {alias: WCLEventColumns() for alias in list_paginated}
+        out = {}
+        # estimated points of one page per paginated stream (combatantinfo/deaths selections are small and not counted)
+        duration = self._get_stream_duration(metadata, fight_id)
+        page_points = {alias: estimate_events_page(duration, streams[alias].get('source_id') is None and 400 or 40, streams[alias].get('include_resources', True)) for alias in list_paginated}
+
+        is_first_page = True
+        while is_first_page or len(next_page_timestamps) > 0:
+            selections = []
+            for alias, stream in streams.items():
+                if alias in next_page_timestamps:
+                    filter_exp = stream.get('filter_exp') and " and ".join([filter_exp_base, stream['filter_exp']]) or filter_exp_base
+                    selections.append(self._build_events_selection(alias, next_page_timestamps[alias], source_id=stream.get('source_id'), fight_id=fight_id, filter_exp=filter_exp, include_resources=stream.get('include_resources', True)))
+                elif is_first_page and alias not in list_paginated:
+                    source_id = stream.get('data_type') == 'Deaths' and -1 or stream.get('source_id')
+                    selections.append(self._build_events_selection(alias, 0, source_id=source_id, fight_id=fight_id, data_type=stream['data_type'] == 'CombatantInfo' and 'CombatantInfo' or None, paginate=False))
+
+            events_query = """
+{
+  reportData {
+    report(code: "%s") {%s
+    }
+  }
+}
+""" % (report_code, "".join(selections))
+            sinks = {get_events_data_path(alias): events[alias].append for alias in next_page_timestamps}
+            cost = sum(page_points[alias] for alias in next_page_timestamps)
+            r = (await self._query(events_query, report_code=use_cache and report_code or None, priority=priority, sinks=sinks, cost=cost))["data"]["reportData"]["report"]
+
+            for alias, stream in streams.items():
+                if alias in next_page_timestamps:
+                    next_page_timestamps[alias] = r[alias]["nextPageTimestamp"]
+                    if next_page_timestamps[alias] is None:
+                        del next_page_timestamps[alias]
+                elif is_first_page and alias not in list_paginated:
+                    data = r[alias] and r[alias]["data"] or []
+                    if stream['data_type'] == 'Deaths':
+                        data = [death for death in data if death["type"] == "death"]
+                    out[alias] = data
+            is_first_page = False
+
+        if partition_by_fight:
+            for alias in list_paginated:
+                out[alias] = events[alias].partition('fight')
+                events[alias].clear()
+            for alias in streams:
+                if alias not in list_paginated:
+                    fights = {}
+                    for event in out[alias]:
+                        fights.setdefault(event.get('fight'), []).append(event)
+                    out[alias] = fights
+            return out
+
+        for alias in list_paginated:
+            out[alias] = WCLReportFightData(events[alias], metadata=metadata, fight_id=fight_id)
+        return out
+
+    async def _fetch_new_events(self, report_code, streams, fight_data, fight_id=None, metadata=None):
+        # Live logs: poll only the events after the last seen timestamp of each paginated stream and append them to
+        # fight_data {alias: WCLReportFightData}. Bypasses the cache, the same query returns more events as the log grows.
+        # Returns {alias: number of appended events}
+        streams = {alias: stream for alias, stream in streams.items() if alias in fight_data and stream.get('data_type') not in ['CombatantInfo','Deaths']}
+        start_timestamps = {alias: int(fight_data[alias].last_timestamp) for alias in streams}
+        new_data = await self._fetch_events_batched(report_code, streams, fight_id=fight_id, metadata=metadata, start_timestamps=start_timestamps, use_cache=False)
+        return {alias: fight_data[alias].append_events(new_data[alias]) for alias in streams}
+
+    @staticmethod
+    def _get_stream_key(stream):
+        return get_stream_key(stream)
+
+    def save_fight_data(self, report_code, fight_id, streams, fight_data, metadata):
+        # Persist the processed streams of a fight (call after the analyzer computed its derived columns) to the fight store,
+        # _fetch_events_batched then loads them instead of downloading. Only finished reports, live ones still change.
+        if self._fight_store is None or not self._is_report_finished(metadata.rawData):
+            return False
+        self._fight_store.save_metadata(metadata)
+        self._fight_store.save_streams(report_code, fight_id, streams, fight_data)
+        return True
+
+    def prefetch_report(self, report_code, streams, metadata):
+        # Start downloading the given event streams for every fight of the report in one fight-spanning paginated pass
+        # (no fightIDs filter) at batch priority, partitioned locally by fight. Once it is done, _fetch_events_batched calls
+        # asking for the same streams (by definition, aliases may differ) for a fight of metadata are served from memory.
+        # Only the current report is kept, the prefetch of the previous one is cancelled. Live reports are not prefetched.
+        # Returns the background task (None if not prefetched), it does not need to be awaited.
+        if self._prefetched is not None:
+            self._prefetched['task'].cancel()
+            self._prefetched = None
+        if not self._is_report_finished(metadata.rawData):
+            return None
+
+        task = asyncio.ensure_future(self._fetch_events_batched(report_code, streams, metadata=metadata, partition_by_fight=True, priority=PRIORITY_BATCH))
+        prefetched = self._prefetched = dict(
+            report_code=report_code,
+            fight_ids=set(metadata.fights.index.to_list()),
+            aliases={self._get_stream_key(stream): alias for alias, stream in streams.items()},
+            task=task,
+        )
+        task.add_done_callback(lambda _: self._on_prefetch_done(prefetched))
+        return task
+
+    def _on_prefetch_done(self, prefetched):
+        # nobody awaits the task: retrieve the exception of a failed prefetch and drop it, fights are then fetched one by one
+        task = prefetched['task']
+        if task.cancelled() or task.exception() is not None:
+            if self._prefetched is prefetched:
+                self._prefetched = None
+
+    def _get_prefetched_events(self, report_code, streams, fight_id, metadata=None):
+        # None if the streams of the fight are not covered by a completed prefetch of this report. A prefetch still
+        # downloading is not waited for (the fight is fetched on its own), a fight missing from the prefetched fight list
+        # was logged after the prefetch started.
+        prefetched = self._prefetched
+        if prefetched is None or prefetched['report_code'] != report_code or fight_id not in prefetched['fight_ids']:
+            return None
+        aliases, task = prefetched['aliases'], prefetched['task']
+        if not task.done() or task.cancelled() or task.exception() is not None:
+            return None
+        if any(self._get_stream_key(stream) not in aliases for stream in streams.values()):
+            return None
+
+        partitions = task.result()
+        out = {}
+        for alias, stream in streams.items():
+            fight_partition = partitions[aliases[self._get_stream_key(stream)]].get(fight_id)
+            if stream.get('data_type') in ['CombatantInfo','Deaths']:
+                out[alias] = list(fight_partition or [])
+            else:
+                events = fight_partition and WCLEventColumns.from_columns(*fight_partition) or WCLEventColumns()
+                out[alias] = WCLReportFightData(events, metadata=metadata, fight_id=fight_id)
+        return out
+
+    async def _fetch_event_window(self, events_query_t_first, events_query_t, query_args, start_timestamp, end_timestamp, sink=None, cost=1):
+        # walk nextPageTimestamp from start_timestamp until the window is exhausted, returns (events, first page report)
+        # with a sink, events are streamed into it page by page and the returned event list stays empty
+        events = []
+        sinks = {get_events_data_path(): sink or events.append}
+        first_page = None
+        next_page_timestamp = start_timestamp
         while next_page_timestamp is not None:
-            events_query = events_query_t % dict(
-                report_code=report_code,
+            events_query = (first_page is None and events_query_t_first or events_query_t) % dict(
+                query_args,
                 next_page_timestamp=next_page_timestamp,
-                entrySourceID=entrySourceID,
-                entryFightID=entryFightID,
-                entryFilterExp=entryFilterExp,
+                end_timestamp=end_timestamp,
             )
-            r = (await self._query(events_query))["data"]["reportData"]["report"]
-
-            if next_page_timestamp == 0:
-                if r.get('combatantInfo'):
-                    combatant_info = r["combatantInfo"]["data"]
-                if r.get('deaths'):
-                    deaths = [death for death in r["deaths"]["data"] if death["type"] == "death"]
+            r = (await self._query(events_query, report_code=query_args['report_code'], sinks=sinks, cost=cost))["data"]["reportData"]["report"]
+            if first_page is None:
+                first_page = r
 
             next_page_timestamp = r["events"]["nextPageTimestamp"]
-            events += r["events"]["data"]
+            if next_page_timestamp is not None and next_page_timestamp >= end_timestamp:
+                next_page_timestamp = None
+
+        return events, first_page
+
+    @staticmethod
+    def _get_stream_duration(metadata, fight_id=None):
+        # seconds of log an events stream covers (the fight, else all fights of the report), None if unknown
+        if metadata is None:
+            return None
+        if fight_id:
+            return metadata.fights.loc[fight_id, 'duration']
+        return metadata.fights['duration'].sum()
+
+    @staticmethod
+    def _get_fight_windows(metadata, fight_id, num_windows):
+        # split the fight into num_windows contiguous [start, end) windows (report-relative ms), the outer edges are left open
+        start_timestamp = int(metadata.fights.loc[fight_id, 'startTime'])
+        end_timestamp = int(metadata.fights.loc[fight_id, 'endTime'])
+        edges = np.linspace(start_timestamp, end_timestamp, num_windows + 1).round().astype(int).tolist()
+        edges[0] = 0
+        edges[-1] = 100000000000
+        return [(edges[i], edges[i+1]) for i in range(num_windows) if edges[i] < edges[i+1]]
+
+    @staticmethod
+    def _stitch_event_windows(list_window_events):
+        events = []
+        for window_events in list_window_events:
+            # adjacent windows may both return the events on their shared boundary timestamp, drop the repeated ones
+            if events and window_events and events[-1]['timestamp'] >= window_events[0]['timestamp']:
+                ts_boundary = window_events[0]['timestamp']
+                ts_last = events[-1]['timestamp']
+                seen = Counter(json.dumps(e, sort_keys=True) for e in takewhile(lambda e: e['timestamp'] >= ts_boundary, reversed(events)))
+
+                i = 0
+                while i < len(window_events) and window_events[i]['timestamp'] <= ts_last:
+                    key = json.dumps(window_events[i], sort_keys=True)
+                    if seen[key] > 0:
+                        seen[key] -= 1
+                    else:
+                        events.append(window_events[i])
+                    i += 1
+                window_events = window_events[i:]
+            events += window_events
 
-        return WCLReportFightData(events, metadata=metadata, fight_id=fight_id), combatant_info, deaths
\ No newline at end of file
+        # stable sort keeps WCL's in-timestamp ordering (near-sorted input, so this is ~linear)
+        events.sort(key=lambda e: e['timestamp'])
+        return events
@@ -0,0 +1,230 @@
+import re
+import json
+import array
+import numpy as np
+import pandas as pd
+
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r'[ \t\n\r]*')
+
+# Typed buffers for the known WCL event fields (array typecodes), every other field is kept in a plain list.
+# Int columns that turn out to have missing values become float64 with NaN, like pandas would infer them.
+EVENT_FIELD_TYPES = {
+    'timestamp': 'd',
+    'fight': 'i',
+    'sourceID': 'i',
+    'sourceInstance': 'i',
+    'sourceMarker': 'i',
+    'targetID': 'i',
+    'targetInstance': 'i',
+    'targetMarker': 'i',
+    'abilityGameID': 'i',
+    'extraAbilityGameID': 'i',
+    'killerID': 'i',
+    'killingAbilityGameID': 'i',
+    'hitType': 'i',
+    'resourceActor': 'i',
+    'stack': 'i',
+    'amount': 'q',
+    'overkill': 'q',
+    'absorbed': 'q',
+    'absorb': 'q',
+    'mitigated': 'q',
+    'unmitigatedAmount': 'q',
+    'resisted': 'q',
+    'blocked': 'q',
+    'hitPoints': 'q',
+    'maxHitPoints': 'q',
+    'attackPower': 'q',
+    'spellPower': 'q',
+    'armor': 'q',
+    'x': 'q',
+    'y': 'q',
+    'facing': 'q',
+    'mapID': 'q',
+    'itemLevel': 'q',
+    'resourceChange': 'q',
+    'resourceChangeType': 'q',
+    'otherResourceChange': 'q',
+    'maxResourceAmount': 'q',
+    'waste': 'q',
+    'tick': '?',
+    'type': 'category',
+}
+_missing = {'i': -2**31, 'q': -2**63, 'd': float('nan'), '?': 0}
+_dtypes = {'i': np.int32, 'q': np.int64, 'd': np.float64, '?': np.bool_}
+
+class _CategoryBuffer:
+    # int16 codes + categories, filled one value at a time
+    def __init__(self, num_missing=0):
+        self.codes = array.array('h', [-1]*num_missing)
+        self.categories = {}
+
+    def __len__(self):
+        return len(self.codes)
+
+    def append(self, v):
+        if v is None:
+            self.codes.append(-1)
+            return
+        code = self.categories.get(v)
+        if code is None:
+            code = self.categories[v] = len(self.categories)
+        self.codes.append(code)
+
+    def pad(self, n):
+        self.codes.extend([-1]*n)
+
+    def finalize(self):
+        return pd.Categorical.from_codes(np.frombuffer(self.codes, dtype=np.int16), categories=list(self.categories))
+
+class WCLEventColumns:
+    # Columnar buffer of WCL events, filled one event at a time.
+    # Known fields (EVENT_FIELD_TYPES) go into typed buffers that become the DataFrame columns without a copy,
+    # the rest into one list per field. No per-event dicts are kept alive next to the final DataFrame.
+    def __init__(self, field_types=EVENT_FIELD_TYPES):
+        self.field_types = field_types
+        self.columns = {}
+        self.num_rows = 0
+
+    def __len__(self):
+        return self.num_rows
+
+    def _new_column(self, k, n):
+        typecode = self.field_types.get(k)
+        if typecode == 'category':
+            return _CategoryBuffer(n)
+        if typecode is not None:
+            return array.array(typecode if typecode != '?' else 'b', [_missing[typecode]]*n)
+        return [None]*n
+
+    def _pad(self, k, col, n):
+        typecode = self.field_types.get(k)
+        if typecode == 'category':
+            col.pad(n)
+        elif typecode is not None and isinstance(col, array.array):
+            col.extend([_missing[typecode]]*n)
+        else:
+            col.extend([None]*n)
+
+    def append(self, event):
+        n = self.num_rows
+        for k, v in event.items():
+            col = self.columns.get(k)
+            if col is None:
+                col = self.columns[k] = self._new_column(k, n)
+            elif len(col) < n:
+                self._pad(k, col, n-len(col))
+            if isinstance(col, array.array):
+                try:
+                    col.append(_missing[self.field_types[k]] if v is None else v)
+                    continue
+                except (TypeError, OverflowError):
+                    # unexpected value for a typed field: keep the column as a plain list
+                    col = self.columns[k] = self._finalize_column(k, col).tolist()
+            col.append(v)
+        self.num_rows = n + 1
+
+    def extend(self, events):
+        for event in events:
+            self.append(event)
+
+    def _finalize_column(self, k, col):
+        if isinstance(col, _CategoryBuffer):
+            return col.finalize()
+        if not isinstance(col, array.array):
+            return col
+        typecode = self.field_types[k]
+        out = np.frombuffer(col, dtype=_dtypes[typecode]) if len(col) else np.empty(0, dtype=_dtypes[typecode])
+        if typecode in ['i', 'q']:
+            mask = out == _missing[typecode]
+            if mask.any():
+                out = out.astype(np.float64)
+                out[mask] = np.nan
+        return out
+
+    def to_dict(self):
+        # pad columns that were missing from the last events, then wrap the typed buffers as numpy arrays/categoricals
+        for k, col in self.columns.items():
+            if isinstance(col, (array.array, list, _CategoryBuffer)) and len(col) < self.num_rows:
+                self._pad(k, col, self.num_rows-len(col))
+        self.columns = {k: self._finalize_column(k, col) for k, col in self.columns.items()}
+        return self.columns
+
+    def clear(self):
+        self.columns = {}
+        self.num_rows = 0
+
+    @classmethod
+    def from_columns(cls, columns, num_rows):
+        out = cls()
+        out.columns = dict(columns)
+        out.num_rows = num_rows
+        return out
+
+    def partition(self, key):
+        # split into {value of column key: (columns, num_rows)}, e.g. per fight for whole-report fetches
+        columns = self.to_dict()
+        values = columns.get(key)
+        if values is None:
+            return {None: (columns, self.num_rows)}
+        values = pd.Series(values)
+        out = {}
+        for value, idx in values.groupby(values, sort=False, dropna=False).indices.items():
+            value = value.item() if hasattr(value, 'item') else value
+            out[None if value != value else value] = ({
+                k: [col[i] for i in idx] if isinstance(col, list) else col[idx]
+                for k, col in columns.items()
+            }, len(idx))
+        return out
+
+def _skip_whitespace(text, idx):
+    return _whitespace.match(text, idx).end()
+
+def _decode_array_into(text, idx, sink):
+    # text[idx] == '[': decode one element at a time and hand it to sink, the array itself is never built
+    idx = _skip_whitespace(text, idx+1)
+    if text[idx] == ']':
+        return None, idx+1
+    while True:
+        item, idx = _decoder.raw_decode(text, idx)
+        sink(item)
+        idx = _skip_whitespace(text, idx)
+        if text[idx] == ']':
+            return None, idx+1
+        idx = _skip_whitespace(text, idx+1) # ','
+
+def _decode_object(text, idx, path, sinks, prefixes):
+    # text[idx] == '{': object on the way to a sink array
+    out = {}
+    idx = _skip_whitespace(text, idx+1)
+    if text[idx] == '}':
+        return out, idx+1
+    while True:
+        key, idx = _decoder.raw_decode(text, idx)
+        idx = _skip_whitespace(text, idx)
+        idx = _skip_whitespace(text, idx+1) # ':'
+        out[key], idx = _decode_value(text, idx, path + (key,), sinks, prefixes)
+        idx = _skip_whitespace(text, idx)
+        if text[idx] == '}':
+            return out, idx+1
+        idx = _skip_whitespace(text, idx+1) # ','
+
+def _decode_value(text, idx, path, sinks, prefixes):
+    if path in sinks and text[idx] == '[':
+        return _decode_array_into(text, idx, sinks[path])
+    if path in prefixes and text[idx] == '{':
+        return _decode_object(text, idx, path, sinks, prefixes)
+    return _decoder.raw_decode(text, idx)
+
+def decode_streaming(body, sinks):
+    # Decode a json response, streaming the arrays at the given key paths element by element into their sink
+    # (e.g. {('data','reportData','report','events','data'): columns.append}) instead of materializing them.
+    # Sink arrays are replaced by None in the returned object, everything else is decoded as usual.
+    text = isinstance(body, (bytes, bytearray)) and body.decode('utf-8') or body
+    prefixes = {path[:i] for path in sinks for i in range(len(path))}
+    out, _ = _decode_value(text, _skip_whitespace(text, 0), (), sinks, prefixes)
+    return out
+
+def get_events_data_path(alias="events"):
+    return ('data', 'reportData', 'report', alias, 'data')
@@ -0,0 +1,202 @@
+import math
+import time
+from dataclasses import dataclass
+
+# Field selections are nested dicts: {field: None} for a leaf, {field: {subfield: ...}} for an object/list.
+# Field names may carry GraphQL arguments, e.g. 'playerDetails(startTime: 0, endTime: 10000000000)'.
+
+FIGHT_ACTOR_FIELDS = {
+    'gameID': None,
+    'id': None,
+    'instanceCount': None,
+    'groupCount': None,
+    'petOwner': None,
+}
+
+# everything the metadata query used to request
+METADATA_FIELDS_ALL = {
+    'title': None,
+    'startTime': None,
+    'playerDetails(startTime: 0, endTime: 10000000000)': None,
+    'fights': {
+        'id': None,
+        'name': None,
+        'difficulty': None,
+        'encounterID': None,
+        'hardModeLevel': None,
+        'bossPercentage': None,
+        'fightPercentage': None,
+        'kill': None,
+        'lastPhase': None,
+        'lastPhaseAsAbsoluteIndex': None,
+        'lastPhaseIsIntermission': None,
+        'friendlyPlayers': None,
+        'startTime': None,
+        'endTime': None,
+        'size': None,
+        'phaseTransitions': {'id': None, 'startTime': None},
+        'enemyNPCs': FIGHT_ACTOR_FIELDS,
+        'enemyPets': FIGHT_ACTOR_FIELDS,
+        'enemyPlayers': None,
+        'friendlyNPCs': FIGHT_ACTOR_FIELDS,
+        'friendlyPets': FIGHT_ACTOR_FIELDS,
+    },
+    'guild': {
+        'name': None,
+        'server': {'name': None},
+    },
+    'masterData': {
+        'abilities': {'gameID': None, 'name': None, 'type': None, 'icon': None},
+        'actors': {'gameID': None, 'petOwner': None, 'icon': None, 'id': None, 'name': None, 'type': None, 'subType': None, 'server': None},
+    },
+}
+
+# what WCLReportMetaData/WCLReportFightData themselves read
+METADATA_FIELDS_BASE = {
+    'title': None,
+    'startTime': None,
+    'playerDetails(startTime: 0, endTime: 10000000000)': None,
+    'fights': {
+        'id': None,
+        'name': None,
+        'difficulty': None,
+        'encounterID': None,
+        'kill': None,
+        'startTime': None,
+        'endTime': None,
+        'phaseTransitions': {'id': None, 'startTime': None},
+    },
+    'guild': {
+        'name': None,
+        'server': {'name': None},
+    },
+    'masterData': {
+        'abilities': {'gameID': None, 'name': None, 'icon': None},
+        'actors': {'id': None, 'name': None, 'type': None},
+    },
+}
+
+def merge_fields(*list_fields):
+    out = {}
+    for fields in list_fields:
+        for k, v in (fields or {}).items():
+            if isinstance(v, dict):
+                out[k] = merge_fields(out.get(k) if isinstance(out.get(k), dict) else {}, v)
+            elif k not in out:
+                out[k] = None
+    return out
+
+def build_selection(fields, indent=0):
+    pad = "    "*indent
+    lines = []
+    for k, v in fields.items():
+        if isinstance(v, dict):
+            lines.append(f"{pad}{k}\n{pad}{{\n{build_selection(v, indent+1)}\n{pad}}}")
+        else:
+            lines.append(f"{pad}{k}")
+    return "\n".join(lines)
+
+def build_metadata_query(report_code, fields=None):
+    # fields: selection under report(code), WCLReportMetaData's own fields are always included
+    fields = fields is None and METADATA_FIELDS_ALL or merge_fields(METADATA_FIELDS_BASE, fields)
+    return """
+query{
+    reportData
+    {
+        report(code:"%s")
+        {
+%s
+        }
+    }
+}
+""" % (report_code, build_selection(fields, 3))
+
+# -----------------------------------------------------------------------------
+# Pre-flight cost estimate
+# -----------------------------------------------------------------------------
+# Heuristics measured on Cataclysm raid logs, WCL does not publish its point formula.
+# They are meant to compare query shapes (what is worth pruning), not to predict exact numbers.
+BYTES_PER_LEAF = 24               # "key":value, in a list item
+BYTES_PER_PLAYER_DETAILS = 450    # one player in playerDetails (specs, ilvl, consumables)
+BYTES_PER_EVENT = 190
+BYTES_PER_EVENT_RESOURCES = 230   # extra per event with includeResources
+POINTS_PER_QUERY = 1.0
+POINTS_PER_MB = 2.0
+
+# default collection sizes of a 25-man raid night
+REPORT_COUNTS_25 = {
+    'fights': 60,
+    'fights.friendlyPlayers': 25,
+    'fights.phaseTransitions': 2,
+    'fights.enemyNPCs': 12,
+    'fights.enemyPets': 1,
+    'fights.friendlyNPCs': 4,
+    'fights.friendlyPets': 20,
+    'masterData.abilities': 1500,
+    'masterData.actors': 450,
+    'players': 25,
+}
+
+@dataclass
+class WCLQueryEstimate:
+    points: float
+    bytes: int
+    pages: int = 1
+
+    def __add__(self, other):
+        return WCLQueryEstimate(self.points + other.points, self.bytes + other.bytes, self.pages + other.pages)
+
+    def __str__(self):
+        return '~%.1f WCL Points, ~%.1f kB over %d request(s)' % (self.points, self.bytes/1024, self.pages)
+
+def _get_points(num_bytes, pages=1):
+    return pages*POINTS_PER_QUERY + POINTS_PER_MB*num_bytes/1024**2
+
+def is_report_finished(report, finished_grace=3600):
+    # a report is finished once every fight has an endTime, and the last one ended long enough ago that no more fights are being uploaded
+    fights = report.get('fights') or []
+    if len(fights) == 0 or any(fight.get('endTime') is None for fight in fights):
+        return False
+    ts_last_fight_end = (report['startTime'] + max(fight['endTime'] for fight in fights))/1000
+    return (time.time() - ts_last_fight_end) > finished_grace
+
+def get_report_counts(metadata):
+    # collection sizes of an already loaded report (WCLReportMetaData), to refine later estimates
+    counts = dict(REPORT_COUNTS_25)
+    counts['fights'] = len(metadata.fights)
+    counts['masterData.abilities'] = len(metadata.abilities)
+    counts['masterData.actors'] = len(metadata.actors)
+    counts['players'] = len(metadata.dps) + len(metadata.healers) + len(metadata.tanks)
+    return counts
+
+def _estimate_fields_bytes(fields, counts, path=""):
+    num_bytes = 0
+    for k, v in fields.items():
+        name = k.split('(')[0]
+        key = path and f"{path}.{name}" or name
+        if name == 'playerDetails':
+            num_bytes += counts['players']*BYTES_PER_PLAYER_DETAILS
+        elif isinstance(v, dict):
+            num_bytes += counts.get(key, 1)*_estimate_fields_bytes(v, counts, key)
+        else:
+            num_bytes += counts.get(key, 1)*BYTES_PER_LEAF
+    return num_bytes
+
+def estimate_metadata_query(fields=None, counts=None):
+    fields = fields is None and METADATA_FIELDS_ALL or merge_fields(METADATA_FIELDS_BASE, fields)
+    num_bytes = _estimate_fields_bytes(fields, counts or REPORT_COUNTS_25)
+    return WCLQueryEstimate(_get_points(num_bytes), int(num_bytes))
+
+def estimate_events_query(duration, events_per_second=40, include_resources=True, limit=10000):
+    # duration: seconds of log covered by the stream, events_per_second: e.g. ~40 for one player, ~400 for a whole raid
+    num_events = duration*events_per_second
+    num_bytes = num_events*(BYTES_PER_EVENT + (include_resources and BYTES_PER_EVENT_RESOURCES or 0))
+    pages = max(1, math.ceil(num_events/limit))
+    return WCLQueryEstimate(_get_points(num_bytes, pages), int(num_bytes), pages)
+
+def estimate_events_page(duration=None, events_per_second=40, include_resources=True, limit=10000):
+    # points of one page request of an events stream: its share of the whole stream, a full page if the duration is unknown
+    if not duration or not duration > 0:
+        duration = limit/events_per_second
+    estimate = estimate_events_query(duration, events_per_second, include_resources, limit)
+    return estimate.points/estimate.pages
@@ -0,0 +1,272 @@
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils.wcl.PixolWCLTransport import WCLTransport, WCLResponse
+
+# Offline record/replay of WCL API traffic, for benchmarks and regression tests without spending API points
+#
+# record:  WCLClient(transport=WCLRecordingTransport(get_default_transport(), "fixtures/"))
+# replay:  WCLClient(transport=WCLReplayTransport("fixtures/"))
+# server:  python -m utils.wcl.PixolWCLReplay fixtures/ --port 8765 --latency 0.05 --page-size 2000
+#          WCLClient(base_url="http://127.0.0.1:8765/api/v2/client", token_url="http://127.0.0.1:8765/oauth/token")
+
+REPLAY_TOKEN = {'access_token': 'replay', 'token_type': 'Bearer', 'expires_in': 31536000}
+
+def normalize_query(query):
+    return " ".join(query.split())
+
+def get_fixture_key(query):
+    return hashlib.sha256(normalize_query(query).encode('utf-8')).hexdigest()
+
+def load_fixtures(fixture_dir):
+    fixtures = {}
+    for filename in sorted(os.listdir(fixture_dir)):
+        if filename.endswith('.json'):
+            with open(os.path.join(fixture_dir, filename)) as f:
+                fixture = json.load(f)
+            fixtures[get_fixture_key(fixture['query'])] = fixture
+    return fixtures
+
+class WCLRecordingTransport(WCLTransport):
+    # Wraps a live transport and saves every GraphQL request/response pair to fixture_dir
+    # (oauth token requests are passed through but never recorded, they contain credentials)
+    def __init__(self, transport, fixture_dir):
+        self._transport = transport
+        self.fixture_dir = fixture_dir
+        os.makedirs(fixture_dir, exist_ok=True)
+
+    async def post(self, url, json_body=None, data=None, headers=None):
+        response = await self._transport.post(url, json_body=json_body, data=data, headers=headers)
+        if json_body is not None and 'query' in json_body and response.status == 200:
+            fixture = {
+                'query': json_body['query'],
+                'status': response.status,
+                'body': response.text,
+            }
+            with open(os.path.join(self.fixture_dir, f"{get_fixture_key(json_body['query'])}.json"), 'w') as f:
+                json.dump(fixture, f)
+        return response
+
+    async def close(self):
+        await self._transport.close()
+
+class WCLReplayTransport(WCLTransport):
+    # Serves recorded fixtures in-process, optionally with a simulated per-request latency (seconds)
+    def __init__(self, fixture_dir, latency=0):
+        self.fixtures = load_fixtures(fixture_dir)
+        self.latency = latency
+
+    async def post(self, url, json_body=None, data=None, headers=None):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if json_body is None:
+            return WCLResponse(200, json.dumps(REPLAY_TOKEN).encode('utf-8'))
+
+        fixture = self.fixtures.get(get_fixture_key(json_body['query']))
+        if fixture is None:
+            raise KeyError(f"No recorded fixture for query: {normalize_query(json_body['query'])[:200]}")
+        return WCLResponse(fixture['status'], fixture['body'].encode('utf-8'))
+
+# -----------------------------------------------------------------------------
+# Local HTTP stand-in
+# -----------------------------------------------------------------------------
+_re_events_selection = re.compile(r'(?:(\w+)\s*:\s*)?events\s*\(')
+_re_selection_arg = re.compile(r'(\w+)\s*:\s*("(?:\\.|[^"\\])*"|\[[^\]]*\]|[^\s,]+)')
+_re_report_code = re.compile(r'report\s*\(\s*code\s*:\s*"([^"]+)"')
+
+def _find_closing(text, idx, open_char, close_char):
+    # index of the bracket closing text[idx], ignoring brackets inside strings
+    depth = 0
+    in_string = False
+    while idx < len(text):
+        c = text[idx]
+        if in_string:
+            if c == '\\':
+                idx += 1
+            elif c == '"':
+                in_string = False
+        elif c == '"':
+            in_string = True
+        elif c == open_char:
+            depth += 1
+        elif c == close_char:
+            depth -= 1
+            if depth == 0:
+                return idx
+        idx += 1
+    raise ValueError("Unbalanced query")
+
+def parse_events_selections(query):
+    # [(alias, {arg: value}, [fields])] for every events(...) { ... } selection in a query
+    out = []
+    for match in _re_events_selection.finditer(query):
+        idx_args_end = _find_closing(query, match.end()-1, '(', ')')
+        args = dict(_re_selection_arg.findall(query[match.end():idx_args_end]))
+        idx_fields_start = query.index('{', idx_args_end)
+        fields = query[idx_fields_start+1:_find_closing(query, idx_fields_start, '{', '}')].split()
+        out.append((match.group(1) or 'events', args, fields))
+    return out
+
+def _get_selection_key(report_code, args):
+    # the pagination window and page size are chosen by the server, everything else identifies the event stream
+    return (report_code,) + tuple(sorted((k, v) for k, v in args.items() if k not in ['startTime', 'endTime', 'limit']))
+
+def split_page(events, page_size):
+    # (page, nextPageTimestamp) of time sorted events. The next page starts at nextPageTimestamp inclusive, so a page
+    # ends on a timestamp boundary: events sharing the next page's first timestamp are left for the next page, and a
+    # page always holds at least one full timestamp group (even if it is larger than page_size).
+    if len(events) <= page_size:
+        return events, None
+    idx = max(page_size, 1)
+    ts_next = events[idx].get('timestamp', 0)
+    while idx > 0 and events[idx-1].get('timestamp', 0) == ts_next:
+        idx -= 1
+    if idx == 0:
+        while idx < len(events) and events[idx].get('timestamp', 0) == ts_next:
+            idx += 1
+        if idx == len(events):
+            return events, None
+    return events[:idx], events[idx].get('timestamp', 0)
+
+class WCLReplayStore:
+    def __init__(self, fixture_dir, page_size=None, points_per_request=1.0, limit_per_hour=3600):
+        self.fixtures = load_fixtures(fixture_dir)
+        self.page_size = page_size
+        self.points_per_request = points_per_request
+        self.limit_per_hour = limit_per_hour
+        self.points_spent = 0
+        self.ts_start = time.time()
+        self._lock = threading.Lock()
+        self.events = self._build_event_streams()
+
+    def _build_event_streams(self):
+        # union of every recorded page per event stream, so it can be re-paginated with any page size.
+        # Overlapping fixtures record the same events again: each distinct event is kept as many times as the page
+        # holding most copies of it (identical events WCL returns more than once within a page are all kept).
+        streams = {}
+        for fixture in self.fixtures.values():
+            selections = parse_events_selections(fixture['query'])
+            match = _re_report_code.search(fixture['query'])
+            if not selections or not match:
+                continue
+            report = (json.loads(fixture['body']).get('data') or {}).get('reportData', {}).get('report') or {}
+            for alias, args, fields in selections:
+                if report.get(alias) is None:
+                    continue
+                events, counts = streams.setdefault(_get_selection_key(match.group(1), args), ({}, Counter()))
+                page_counts = Counter()
+                for event in report[alias]['data']:
+                    event_key = json.dumps(event, sort_keys=True)
+                    events.setdefault(event_key, event)
+                    page_counts[event_key] += 1
+                counts |= page_counts
+        return {key: sorted([event for event_key, event in events.items() for _ in range(counts[event_key])], key=lambda e: e.get('timestamp', 0)) for key, (events, counts) in streams.items()}
+
+    def get_rate_limit_data(self):
+        with self._lock:
+            return {
+                'limitPerHour': self.limit_per_hour,
+                'pointsSpentThisHour': self.points_spent,
+                'pointsResetIn': int(3600 - (time.time() - self.ts_start) % 3600),
+            }
+
+    def query(self, query):
+        with self._lock:
+            self.points_spent += self.points_per_request
+
+        if 'rateLimitData' in query:
+            return 200, {'data': {'rateLimitData': self.get_rate_limit_data()}}
+
+        selections = parse_events_selections(query)
+        match = _re_report_code.search(query)
+        if selections and match and all(_get_selection_key(match.group(1), args) in self.events for _, args, _ in selections):
+            report = {}
+            for alias, args, fields in selections:
+                events = self.events[_get_selection_key(match.group(1), args)]
+                ts_start = float(args.get('startTime', 0))
+                ts_end = float(args.get('endTime', 1e11))
+                page = [e for e in events if ts_start <= e.get('timestamp', 0) <= ts_end]
+                page, next_page_timestamp = split_page(page, self.page_size or int(args.get('limit', 10000)))
+                report[alias] = {'data': page}
+                if 'nextPageTimestamp' in fields:
+                    report[alias]['nextPageTimestamp'] = next_page_timestamp
+            return 200, {'data': {'reportData': {'report': report}}}
+
+        fixture = self.fixtures.get(get_fixture_key(query))
+        if fixture is None:
+            return 200, {'errors': [{'message': 'No recorded fixture for this query.'}]}
+        return fixture['status'], json.loads(fixture['body'])
+
+class WCLReplayServer:
+    # Small local HTTP stand-in for the WCL API that serves recorded fixtures
+    # - latency: seconds added to every response
+    # - page_size: events per page (re-paginates recorded events with nextPageTimestamp), None keeps the query's limit
+    def __init__(self, fixture_dir, host="127.0.0.1", port=8765, latency=0, page_size=None, limit_per_hour=3600):
+        self.store = WCLReplayStore(fixture_dir, page_size=page_size, limit_per_hour=limit_per_hour)
+        self.latency = latency
+        self.httpd = ThreadingHTTPServer((host, port), self._get_handler())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return "http://%s:%d/api/v2/client" % self.httpd.server_address[:2]
+
+    @property
+    def token_url(self):
+        return "http://%s:%d/oauth/token" % self.httpd.server_address[:2]
+
+    def _get_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if server.latency:
+                    time.sleep(server.latency)
+
+                if self.path.startswith('/oauth/token'):
+                    status, response_json = 200, REPLAY_TOKEN
+                else:
+                    status, response_json = server.store.query(json.loads(body)['query'])
+
+                out = json.dumps(response_json).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', "application/json")
+                self.send_header('Content-Length', str(len(out)))
+                self.end_headers()
+                self.wfile.write(out)
+
+            def log_message(self, format, *args):
+                return
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve recorded WCL API fixtures")
+    parser.add_argument('fixture_dir')
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0)
+    parser.add_argument('--page-size', type=int, default=None)
+    args = parser.parse_args()
+
+    server = WCLReplayServer(args.fixture_dir, host=args.host, port=args.port, latency=args.latency, page_size=args.page_size)
+    print(f"Serving {args.fixture_dir} at {server.base_url}")
+    server.httpd.serve_forever()
@@ -1,6 +1,9 @@
 import pandas as pd
 from datetime import datetime
 import numpy as np
+from utils.wcl.PixolWCLIngest import WCLEventColumns
+
+PLAYER_COLUMNS = ['name','id','guid','type','server','icon','specs','minItemLevel','maxItemLevel','potionUse','healthstoneUse','combatantInfo']
 
 class WCLReportMetaData:
     def __init__(
@@ -36,13 +39,13 @@ class WCLReportMetaData:
             self.encounters.insert(2,'formattedName',None)
             pass
 
-        # offset phase transition timestamps
-        def offset_phase_transition_timestamps(x):
-            if x.phaseTransitions:
-                for datum in x.phaseTransitions:
-                    datum['timestamp'] = (datum['startTime'] - x.startTime)/1000
-                    del datum['startTime']
-        self.encounters.apply(offset_phase_transition_timestamps, axis=1)
+        # phase transitions, timestamps in seconds from the start of the fight (the raw metadata is left untouched)
+        self.phase_transitions = self._get_phase_transitions()
+        if 'phaseTransitions' in self.encounters.columns:
+            dict_phases = {}
+            for fight_id, datum in zip(self.phase_transitions['fightID'].to_list(), self.phase_transitions[['id','timestamp']].to_dict('records')):
+                dict_phases.setdefault(fight_id, []).append(datum)
+            self.encounters['phaseTransitions'] = [x is not None and dict_phases.get(fight_id, []) or x for fight_id, x in self.encounters['phaseTransitions'].items()]
 
         # self.dict_encounters = self.encounters.set_index('id').to_dict('index')
 
@@ -53,40 +56,66 @@ class WCLReportMetaData:
         self.actors = pd.DataFrame(metadata['masterData']['actors']).set_index('id')
         # self.dict_actors = self.actors.set_index('id').to_dict('index')
 
-        try:
-            self.dps = pd.DataFrame(metadata['playerDetails']['data']['playerDetails']['dps'])
-        except:
-            self.dps = pd.DataFrame(columns=['name','id','guid','type','server','icon','specs','minItemLevel','maxItemLevel','potionUse','healthstoneUse','combatantInfo'])
+        self.dps = self._get_players(metadata, 'dps')
+        self.healers = self._get_players(metadata, 'healers')
+        self.tanks = self._get_players(metadata, 'tanks')
+
+        # players by (class, spec), a player listed under several roles appears once per role
+        self.player_specs = self._get_player_specs()
+        self.dict_class_spec = self.player_specs.groupby(['type','spec'], sort=False).indices
+        self.df_mage_fire = self.get_class_spec('Mage', 'Fire')
 
-        try:
-            self.healers = pd.DataFrame(metadata['playerDetails']['data']['playerDetails']['healers'])
-        except:
-            self.healers = pd.DataFrame(columns=['name','id','guid','type','server','icon','specs','minItemLevel','maxItemLevel','potionUse','healthstoneUse','combatantInfo'])
 
+    @staticmethod
+    def _get_players(metadata, role):
         try:
-            self.tanks = pd.DataFrame(metadata['playerDetails']['data']['playerDetails']['tanks'])
+            return pd.DataFrame(metadata['playerDetails']['data']['playerDetails'][role])
         except:
-            self.tanks = pd.DataFrame(columns=['name','id','guid','type','server','icon','specs','minItemLevel','maxItemLevel','potionUse','healthstoneUse','combatantInfo'])
-
-        self.df_mage_fire = self._get_class_spec('Mage', 'Fire')
-
-
-    def _get_class_spec(self, c, s):
-        def filter_class_spec(_d, _c, _s):
-            if _d['type'] == _c:
-                for spec in _d['specs']:
-                    if ('spec' in spec) and (spec['spec'] == _s):
-                        return True
-            return False
-        return pd.concat([role[role.apply(lambda x: filter_class_spec(x, c, s),axis=1)] for role in [self.dps, self.healers, self.tanks]])
+            return pd.DataFrame(columns=PLAYER_COLUMNS)
+
+    def _get_player_specs(self):
+        # one row per (role, player, spec): the role tables with their specs lists exploded
+        # empty role tables are left out, concatenating them would turn the int id/guid columns into float
+        roles = [role.assign(role=name) for name, role in [('dps', self.dps), ('healers', self.healers), ('tanks', self.tanks)] if len(role) > 0]
+        if len(roles) == 0:
+            return pd.DataFrame(columns=PLAYER_COLUMNS+['role','spec'])
+        df = pd.concat(roles)
+        df = df.rename_axis('index').reset_index()
+        s = df['specs'].explode()
+        s = pd.Series([isinstance(d, dict) and d.get('spec') or None for d in s], index=s.index, dtype=object).dropna()
+        df = df.loc[s.index].assign(spec=s.values)
+        df = df[~pd.MultiIndex.from_arrays([df.index, df['spec']]).duplicated()]
+        return df.set_index('index').rename_axis(None)
+
+    def get_class_spec(self, c, s):
+        # players of class c with spec s, in dps/healers/tanks order
+        return self.player_specs.iloc[self.dict_class_spec.get((c, s), [])].drop(columns=['role','spec'])
+
+    def _get_phase_transitions(self):
+        # fightID, id, startTime (ms of the report), timestamp (s from the start of the fight)
+        if 'phaseTransitions' not in self.encounters.columns:
+            return pd.DataFrame(columns=['fightID','id','startTime','timestamp'])
+        s = self.encounters['phaseTransitions'].dropna().explode().dropna()
+        df = pd.DataFrame(s.tolist(), index=s.index.rename('fightID'), columns=['id','startTime'])
+        df['timestamp'] = (df['startTime'] - self.encounters.loc[df.index,'startTime'].values)/1000
+        return df.reset_index()
 
     def _get_formatted_encounter_strings(self):
-        def format_encounter_name(x):
-            durationInSeconds = (x['endTime']-x['startTime'])//1000
-
-            return f"{datetime.fromtimestamp((x['startTime']+self.startTime)/1000).strftime('%I:%M %p')} - {x['name']}{x['difficulty'] == 4 and ' [H]' or ''} ({durationInSeconds//60:0d}:{durationInSeconds%60:02d}, {(x['kill'] and 'Kill') or ('Wipe ' + str(x['wipeCounter']))})"
-
-        return self.encounters.apply(format_encounter_name, axis=1).to_list()
+        # "<start time> - <name>[ [H]] (<m:ss>, Kill|Wipe <n>)"
+        df = self.encounters
+        start = df['startTime']+self.startTime
+        offset = [datetime.fromtimestamp(t/1000).astimezone().utcoffset() for t in [start.min(), start.max()]]
+        if offset[0] == offset[1]:
+            # local time: one utc offset for the whole report, unless it spans a DST change
+            start = pd.to_datetime(start + offset[0].total_seconds()*1000, unit='ms')
+        else:
+            start = pd.to_datetime(start.map(lambda t: datetime.fromtimestamp(t/1000)))
+        start = ((start.dt.hour+11)%12+1).astype(str).str.zfill(2) + ':' + start.dt.minute.astype(str).str.zfill(2) + pd.Series(' AM', index=df.index).where(start.dt.hour < 12, ' PM') # '%I:%M %p'
+        durationInSeconds = (df['endTime']-df['startTime'])//1000
+        duration = (durationInSeconds//60).astype(int).astype(str) + ':' + (durationInSeconds%60).astype(int).astype(str).str.zfill(2)
+        difficulty = pd.Series(' [H]', index=df.index).where(df['difficulty'] == 4, '')
+        result = pd.Series('Kill', index=df.index).where(df['kill'] == True, 'Wipe ' + df['wipeCounter'].map(str))
+        return (start + ' - ' + df['name'] + difficulty + ' (' + duration + ', ' + result + ')').to_list()
 
     def _override_ability_name_icon(self):
         if 17941 in self.abilities.index:
@@ -114,32 +143,311 @@ HIT_TYPES = {
     17: "RESIST_PARTIAL_CRIT",
 }
 
+# classResources types flattened into <name>Amount/<name>Max columns (see WCLReportFightData._create_class_resource_columns)
+RESOURCE_TYPES = {
+    0: "mana",
+    1: "rage",
+    2: "focus",
+    3: "energy",
+    6: "runicPower",
+}
+
+# Mobs whose WCL actor ids are not told apart (no id in their name, one actor key for all of their ids)
+BLACKLISTED_NPCS = [
+    'Gas Cloud',
+    'Volatile Ooze',
+]
+
+def _get_categorical(labels, codes):
+    # labels: one (possibly repeated or null) label per actor, codes: actor index per event
+    label_codes, categories = pd.factorize(labels)
+    return pd.Categorical.from_codes(label_codes[codes], categories=categories)
+
+def _fillna_categorical(s, value):
+    if value not in s.cat.categories:
+        s = s.cat.add_categories([value])
+    return s.fillna(value)
+
+def _union_categories(list_df, columns):
+    # give the categorical columns the same categories, so they can be compared, assigned to each other and concatenated
+    list_df_col = [(df, c) for df in list_df for c in columns if c in df.columns and isinstance(df[c].dtype, pd.CategoricalDtype)]
+    if len(list_df_col) < 2:
+        return
+    categories = list_df_col[0][0][list_df_col[0][1]].cat.categories
+    for df, c in list_df_col[1:]:
+        other = df[c].cat.categories
+        categories = categories.append(other[~other.isin(categories)])
+    for df, c in list_df_col:
+        if not df[c].cat.categories.equals(categories):
+            df[c] = df[c].cat.set_categories(categories)
+
+def _is_lossless(values, out):
+    return np.array_equal(out.astype(values.dtype), values, equal_nan=values.dtype.kind == 'f')
+
+# damage/healing amounts that the graphs and tables sum up: int32 is fine (sums are int64), float32 is not
+# (sums would accumulate in float32 and stop being exact above 2**24), so with missing values they stay float64
+SUMMED_COLUMNS = ['amount', 'amountTotal', 'absorbed', 'absorb', 'overkill', 'resisted', 'blocked', 'mitigated', 'unmitigatedAmount']
+
+def _compact_column(s, max_category_ratio=0.5, allow_float32=True):
+    # smallest lossless dtype for an event column: int32/float32 numbers, nullable booleans, categorical strings.
+    # max_category_ratio: strings become categorical if they have at most that many unique values per row
+    # allow_float32: False keeps float columns with non-integral or missing values in float64 (see SUMMED_COLUMNS)
+    if isinstance(s.dtype, pd.CategoricalDtype) or s.dtype == bool or len(s) == 0:
+        return s
+    if s.dtype == object or isinstance(s.dtype, pd.StringDtype):
+        inferred = pd.api.types.infer_dtype(s, skipna=True)
+        if inferred == 'boolean':
+            return s.astype('boolean')
+        if inferred == 'string':
+            if s.nunique() > max_category_ratio*len(s):
+                return s
+            return s.astype('category')
+        if inferred not in ['integer', 'floating', 'mixed-integer-float', 'decimal']:
+            return s # lists (classResources), mixed values
+        s = s.astype(np.float64)
+
+    values = s.to_numpy()
+    if values.dtype.kind in 'iu' and values.dtype.itemsize > 4:
+        out = values.astype(np.int32)
+    elif values.dtype.kind == 'f' and not np.isnan(values).any() and _is_lossless(values, values.astype(np.int32)):
+        out = values.astype(np.int32)
+    elif values.dtype.kind == 'f' and values.dtype.itemsize > 4 and allow_float32:
+        out = values.astype(np.float32)
+    else:
+        return s
+    if not _is_lossless(values, out):
+        return s
+    return pd.Series(out, index=s.index, name=s.name)
+
+def fit_memory_budget(list_fight_data, memory_budget=None):
+    # Compact the event frames (WCLReportFightData.compact); if they are still above memory_budget bytes,
+    # make every string column categorical and drop the raw event dicts. Returns the bytes of the frames.
+    num_bytes = sum(fight_data.compact().memory_usage() for fight_data in list_fight_data)
+    if memory_budget is not None and num_bytes > memory_budget:
+        for fight_data in list_fight_data:
+            fight_data.rawData = None
+        num_bytes = sum(fight_data.compact(max_category_ratio=1).memory_usage() for fight_data in list_fight_data)
+    return num_bytes
+
+class WCLEventIndex:
+    # Row positions of an events frame sorted by the value of each indexed column, built once per frame.
+    # query() starts from the positions of its most selective condition and checks the others on those rows only,
+    # so filtering costs about the size of the result instead of a boolean scan of the whole fight.
+    columns = ['type', 'abilityGameID', 'sourceID', 'targetID']
+
+    def __init__(self, events, columns=None):
+        self.num_rows = len(events)
+        self._index = {}
+        for c in columns or self.columns:
+            if c in events.columns:
+                self._index[c] = self._build(events[c])
+
+    @staticmethod
+    def _build(s):
+        # (values, sorted values, row positions in value order, categories of a categorical column)
+        categories = None
+        if not isinstance(s.dtype, pd.CategoricalDtype) and not pd.api.types.is_numeric_dtype(s.dtype):
+            s = s.astype('category') # strings (e.g. a type column read back from the store) are sorted by code
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            categories = s.cat.categories
+            values = s.cat.codes.to_numpy()
+        else:
+            values = s.to_numpy()
+        order = np.argsort(values, kind='stable')
+        return values, values[order], order, categories
+
+    def _get_ranges(self, column, values):
+        _, sorted_values, _, categories = self._index[column]
+        if categories is not None:
+            values = [categories.get_loc(v) for v in values if v in categories]
+        values = np.asarray(list(values))
+        if len(values) == 0:
+            return values, np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+        return values, np.searchsorted(sorted_values, values, 'left'), np.searchsorted(sorted_values, values, 'right')
+
+    def get(self, column, values):
+        # sorted row positions where column is one of values
+        _, starts, ends = self._get_ranges(column, values)
+        order = self._index[column][2]
+        parts = [order[start:end] for start, end in zip(starts, ends) if end > start]
+        if len(parts) == 0:
+            return np.empty(0, dtype=np.intp)
+        if len(parts) == 1:
+            return parts[0] # stable sort: already in row order
+        return np.sort(np.concatenate(parts))
+
+    def query(self, types=None, ability_ids=None, source_ids=None, target_ids=None):
+        # sorted row positions matching every given condition (lists of accepted values)
+        conditions = [(c, v) for c, v in [('type', types), ('abilityGameID', ability_ids), ('sourceID', source_ids), ('targetID', target_ids)] if v is not None]
+        if len(conditions) == 0:
+            return np.arange(self.num_rows)
+        if any(c not in self._index for c, _ in conditions):
+            return np.empty(0, dtype=np.intp)
+
+        ranges = {c: self._get_ranges(c, v) for c, v in conditions}
+        column = min(ranges, key=lambda c: (ranges[c][2] - ranges[c][1]).sum())
+        out = self.get(column, conditions[[c for c, _ in conditions].index(column)][1])
+        for c, _ in conditions:
+            if c != column and len(out):
+                out = out[np.isin(self._index[c][0][out], ranges[c][0])]
+        return out
+
+# Derived event columns: column -> (WCLReportFightData method creating it, method args, derived columns it needs first).
+# They are computed on first use only (WCLReportFightData.ensure_columns), one method may create several columns.
+DERIVED_COLUMNS = {
+    'amountTotal': ('_create_total_dmg_column', (), []),
+    'dmgMultiplier': ('_create_dmg_multiplier_and_resisted_ratio_columns', (), ['amountTotal']),
+    'resistedRatio': ('_create_dmg_multiplier_and_resisted_ratio_columns', (), ['amountTotal']),
+    'hitTypeStr': ('_create_hit_type_str_column', (), []),
+    'isAbsorbFull': ('_add_is_absorb_full_column', (), ['amountTotal']),
+    'resourceActorID': ('_create_resource_id_column', (), []),
+    'abilityGameName': ('_create_ability_name_column', (), []),
+}
+for _resource in RESOURCE_TYPES.values():
+    for _column in ['Amount', 'Max']:
+        DERIVED_COLUMNS[f'{_resource}{_column}'] = ('_create_class_resource_columns', (), [])
+for _target in ['source', 'target']:
+    for _column in ['Name', 'NameInstance', 'NameInstanceUnique', 'Key']:
+        DERIVED_COLUMNS[f'{_target}{_column}'] = ('_create_target_name_columns', (_target,), [])
+
 class WCLReportFightData:
     def __init__(
         self,
         events,
         metadata=None,
         fight_id=None,
+        keep_raw_data=True,
+        derived_columns=(),
     ):
-        self.rawData = events
-        self.events = pd.DataFrame(events)
+        # events: list of event dicts or WCLEventColumns (streaming ingest path), both end up in typed column buffers
+        # that the DataFrame wraps without copying. keep_raw_data=False drops the list of event dicts afterwards.
+        # derived_columns: DERIVED_COLUMNS to compute right away (None for all), the others are added by ensure_columns.
+        if isinstance(events, WCLEventColumns):
+            self.rawData = None
+        else:
+            self.rawData = events if keep_raw_data else None
+            columns = WCLEventColumns()
+            columns.extend(events)
+            events = columns
+        self.events = pd.DataFrame(events.to_dict(), copy=False)
+        events.clear()
         self.metadata = metadata
+        self.fight_id = fight_id
+        self.last_timestamp, self.num_last_timestamp = 0, 0
         if 'timestamp' in self.events:
-            if self.metadata and fight_id:
-                self.events.timestamp = self.events.timestamp - self.metadata.encounters.loc[fight_id]['startTime']
-            self.events.timestamp = self.events.timestamp/1000
+            # raw report-relative ms of the last event and how many events share it, live polling resumes there (see append_events)
+            if len(self.events):
+                self.last_timestamp = self.events.timestamp.iloc[-1]
+                self.num_last_timestamp = int((self.events.timestamp == self.last_timestamp).sum())
+            self.events.timestamp = self._convert_timestamp(self.events.timestamp)
         self._create_tick_column()
-        self._create_total_dmg_column()
-        self._create_dmg_multiplier_and_resisted_ratio_columns() # Requires amountTotal to be calculated first
-        self._create_hit_type_str_column()
-        self._add_is_absorb_full_column() # Requires amountTotal to be calculated first
-        self._create_resource_id_column()
-        self._create_ability_name_column()
-        self._create_target_name_columns('source')
-        self._create_target_name_columns('target')
-
-        if 'sourceNameInstanceUnique' in self.events.columns:
-            self.events["sourceNameInstanceUnique"] = self.events["sourceNameInstanceUnique"].fillna("Environment")
+        self._event_index = None
+        self.derived = set() # (method, args) of DERIVED_COLUMNS already run
+        self.filled_columns = set() # raw columns missing from the events that a derived column method created (e.g. overkill = 0)
+        self.ensure_columns(derived_columns)
+
+    @classmethod
+    def from_events_frame(cls, events, metadata=None, fight_id=None, last_timestamp=0, num_last_timestamp=0, derived=()):
+        # an already processed events frame (e.g. loaded by PixolWCLStore), nothing is converted again
+        out = cls.__new__(cls)
+        out.rawData = None
+        out.events = events
+        out.metadata = metadata
+        out.fight_id = fight_id
+        out.last_timestamp, out.num_last_timestamp = last_timestamp, num_last_timestamp
+        out.derived = set(derived)
+        out.filled_columns = set()
+        out._event_index = None
+        return out
+
+    def get_event_index(self):
+        # built on first use, dropped whenever the rows or their dtypes change (append_events, compact)
+        if self._event_index is None:
+            self._event_index = WCLEventIndex(self.events)
+        return self._event_index
+
+    def query_positions(self, types=None, ability_ids=None, source_ids=None, target_ids=None):
+        # row positions of the events with all of the given values, e.g. query_positions(types=['cast'], ability_ids=[133])
+        return self.get_event_index().query(types=types, ability_ids=ability_ids, source_ids=source_ids, target_ids=target_ids)
+
+    def ensure_columns(self, columns=None):
+        # Add the derived columns (and the ones they require) that were not computed yet, None for all of DERIVED_COLUMNS.
+        # Other column names are ignored, so a list of every column an analyzer reads can be passed.
+        for column in DERIVED_COLUMNS if columns is None else columns:
+            if column not in DERIVED_COLUMNS:
+                continue
+            method, args, requires = DERIVED_COLUMNS[column]
+            if (method, args) in self.derived:
+                continue
+            self.ensure_columns(requires)
+            getattr(self, method)(*args)
+            self.derived.add((method, args))
+        return self.events
+
+    def compact(self, max_category_ratio=0.5):
+        # downcast the event columns in place, only where no value changes (see _compact_column)
+        for c in self.events.columns:
+            s = self.events[c]
+            out = _compact_column(s, max_category_ratio=max_category_ratio, allow_float32=c not in SUMMED_COLUMNS)
+            if out is not s:
+                self.events[c] = out
+        self._event_index = None
+        return self
+
+    def memory_usage(self):
+        return int(self.events.memory_usage(index=True, deep=True).sum())
+
+    def memory_report(self):
+        # bytes per column (largest first), strings/lists included
+        usage = self.events.memory_usage(index=True, deep=True)
+        out = pd.DataFrame({
+            'dtype': [c == 'Index' and str(self.events.index.dtype) or str(self.events[c].dtype) for c in usage.index],
+            'bytes': usage.values,
+        }, index=usage.index)
+        out['ratio'] = out['bytes']/out['bytes'].sum()
+        return out.sort_values('bytes', ascending=False)
+
+    def _convert_timestamp(self, ts):
+        # report-relative ms -> seconds since the start of the fight
+        if self.metadata and self.fight_id:
+            ts = ts - self.metadata.encounters.loc[self.fight_id]['startTime']
+        return ts/1000
+
+    def append_events(self, other):
+        # Append the events of a later poll of the same stream (a WCLReportFightData built with the same metadata/fight_id,
+        # starting at last_timestamp). Its leading events on last_timestamp were already seen and are skipped.
+        # Returns the number of appended events, they are the last rows of self.events.
+        if 'timestamp' not in other.events or len(other.events) == 0:
+            return 0
+        ts_boundary = self._convert_timestamp(self.last_timestamp)
+        num_skip = int((other.events.timestamp.iloc[:self.num_last_timestamp] == ts_boundary).sum())
+        new_events = other.events.iloc[num_skip:]
+        if len(new_events) == 0:
+            return 0
+
+        if self.rawData is not None and other.rawData is not None:
+            self.rawData += other.rawData[num_skip:]
+        # same derived columns on both polls
+        other.ensure_columns([column for column, (method, args, _) in DERIVED_COLUMNS.items() if (method, args) in self.derived])
+        # categoricals (type, actor names) of both polls need the same categories to stay categorical after the concat
+        for columns in [['sourceNameInstance', 'targetNameInstance'], ['sourceNameInstanceUnique', 'targetNameInstanceUnique']] + [[c] for c in self.events.columns]:
+            _union_categories([self.events, other.events], columns)
+        new_events = other.events.iloc[num_skip:]
+        same_columns = self.events.columns.symmetric_difference(new_events.columns).empty
+        self.events = pd.concat([self.events, new_events], ignore_index=True)
+        self._event_index = None
+        if not same_columns:
+            # A poll without e.g. any damage event lacks the raw columns the derived ones are computed from, the concat fills
+            # them with NaN where a full fetch has 0/False: compute the derived columns again on the joined events.
+            derived = self.derived
+            self.events = self.events.drop(columns=[c for c in self.events.columns if c in DERIVED_COLUMNS or c in self.filled_columns | other.filled_columns])
+            self.derived, self.filled_columns = set(), set()
+            self.ensure_columns([column for column, (method, args, _) in DERIVED_COLUMNS.items() if (method, args) in derived])
+        if other.last_timestamp == self.last_timestamp:
+            self.num_last_timestamp += len(new_events)
+        else:
+            self.last_timestamp, self.num_last_timestamp = other.last_timestamp, other.num_last_timestamp
+        return len(new_events)
 
     def _add_is_absorb_full_column(self):
         if 'amount' not in self.events.columns:
@@ -150,7 +458,10 @@ class WCLReportFightData:
         self.events.loc[mask,'isAbsorbFull'] = True
 
     def _create_tick_column(self):
-        if 'tick' in self.events.columns:
+        if 'tick' in self.events.columns and self.events['tick'].dtype == bool:
+            # typed ingest: missing tick is already False
+            return
+        elif 'tick' in self.events.columns:
             self.events['tick'] = self.events['tick'].notna()
         else:
             self.events['tick'] = False
@@ -161,11 +472,13 @@ class WCLReportFightData:
 
         if 'overkill' not in self.events.columns:
             self.events['overkill'] = 0
+            self.filled_columns.add('overkill')
         s = self.events.loc[self.events.type=='damage', 'overkill'].fillna(0)
         self.events.loc[s.index,'overkill'] = s
 
         if 'absorb' not in self.events.columns:
             self.events['absorbed'] = 0
+            self.filled_columns.add('absorbed')
         s = self.events.loc[self.events.type=='damage', 'absorbed'].fillna(0)
         self.events.loc[s.index,'absorbed'] = s
 
@@ -178,15 +491,16 @@ class WCLReportFightData:
             return
         if 'resisted' not in self.events.columns:
             self.events.loc[:,'resisted'] = 0
+            self.filled_columns.add('resisted')
             
         s = self.events.loc[(self.events.type=='damage') & (self.events.amountTotal.notna()), 'resisted'].fillna(0)
         self.events.loc[s.index,'resisted'] = s
 
         # todo: check resisted
         df = self.events[self.events.type=='damage']
-        self.events.insert(self.events.columns.get_loc('amountTotal')+1, 'dmgMultiplier', None)
+        self.events.insert(self.events.columns.get_loc('amountTotal')+1, 'dmgMultiplier', np.nan)
         self.events.loc[df.index,'dmgMultiplier'] = df.amountTotal/(df.unmitigatedAmount-df.resisted)
-        self.events.insert(self.events.columns.get_loc('resisted')+1, 'resistedRatio', None)
+        self.events.insert(self.events.columns.get_loc('resisted')+1, 'resistedRatio', np.nan)
         self.events.loc[df.index,'resistedRatio'] = df.resisted/df.unmitigatedAmount
 
     def _create_hit_type_str_column(self):
@@ -210,6 +524,26 @@ class WCLReportFightData:
             self.events.loc[mask,'resourceActorID'] = self.events.loc[mask,'targetID']
         return
 
+    def _create_class_resource_columns(self):
+        # classResources ([{'amount', 'max', 'type'}, ...] of the resource actor) -> float columns per resource type,
+        # first entry of a type per event. Only the types present in the fight get columns.
+        if 'classResources' not in self.events.columns:
+            return
+
+        s = self.events['classResources'].dropna().explode().dropna()
+        if len(s) == 0:
+            return
+        df = pd.DataFrame(s.tolist(), index=s.index, columns=['amount','max','type'])
+        df = df[~df.set_index('type', append=True).index.duplicated()]
+        loc = self.events.columns.get_loc('classResources')+1
+        for resource_type, df_type in df.groupby('type', sort=True):
+            name = RESOURCE_TYPES.get(resource_type)
+            if name is None:
+                continue
+            self.events.insert(loc, f'{name}Amount', df_type['amount'].astype(np.float64).reindex(self.events.index))
+            self.events.insert(loc+1, f'{name}Max', df_type['max'].astype(np.float64).reindex(self.events.index))
+            loc += 2
+
     def _create_ability_name_column(self):
         if 'abilityGameID' in self.events.columns:
             # def map_ability_id(x):
@@ -241,34 +575,56 @@ class WCLReportFightData:
             mask = self.events[f'{target}ID'] != -1
             self.events.loc[mask,f'{target}Name'] = self.events.loc[mask,f'{target}ID'].map(self.metadata.actors['name'])
 
-            # add name-instance column
-            self.events.insert(self.events.columns.get_loc(f'{target}Name')+1, f'{target}NameInstance', self.events[f'{target}Name'])
-
-            if f'{target}Instance' in self.events.columns:
-                # Add instance values for npcs with the same name (e.g. two Halions)
-                # self._fix_duplicate_target_instances(target)
+            # Add integer actor key column: one key per actor id + instance, used for all grouping/joining on actors.
+            # The name-instance columns below are categoricals of it, their strings are built once per actor instead of once per event.
+            has_instance = f'{target}Instance' in self.events.columns
+            keys = self._get_actor_keys(target)
+            keys, idx_first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+            df_actors = self.events.iloc[idx_first]
 
+            # add name-instance column
+            name_instance = df_actors[f'{target}Name'].copy()
+            if has_instance:
                 # Add instance value to name (where available)
-                mask2 = self.events[f'{target}Instance'].notna()
-                self.events.loc[mask2,f'{target}NameInstance'] = self.events.loc[mask2,f'{target}Name'] + "-" + self.events.loc[mask2,f'{target}Instance'].apply(lambda x: f"{x:03.0f}")
+                mask2 = df_actors[f'{target}Instance'].notna()
+                name_instance[mask2] = df_actors.loc[mask2,f'{target}Name'] + "-" + df_actors.loc[mask2,f'{target}Instance'].map("{:03.0f}".format).astype(object)
 
                 # Add name-instance-id column
                 # Used to fix bugs where there are two Halions with the same name, different npc id, but no instance id (since most of the code uses name-based tracking)
-                self.events.insert(self.events.columns.get_loc(f'{target}NameInstance')+1, f'{target}NameInstanceUnique', self.events[f'{target}NameInstance'])
-
-                # This blacklist tells the code below not to concatenate the actor id to these mobs
-                # Used to fix bugs such as Professor Putricide where Gas Cloud has 2 different WCL actor IDs (first when it spawns then another when it begins moving)
-                blacklisted_npcs = [
-                    'Gas Cloud',
-                    'Volatile Ooze',
-                ]
-                mask2 = (mask) & (~self.events[f'{target}Name'].isin(blacklisted_npcs))
-                self.events.loc[mask2,f'{target}NameInstanceUnique'] = self.events.loc[mask2,f'{target}NameInstance'] + "-" + self.events.loc[mask2,f'{target}ID'].astype(str)
+                name_instance_unique = name_instance.copy()
+                mask2 = (df_actors[f'{target}ID'] != -1) & (~df_actors[f'{target}Name'].isin(BLACKLISTED_NPCS))
+                name_instance_unique[mask2] = name_instance[mask2] + "-" + df_actors.loc[mask2,f'{target}ID'].astype(str)
             else:
                 # Add name-instance-id column
-                self.events.insert(self.events.columns.get_loc(f'{target}NameInstance')+1, f'{target}NameInstanceUnique', self.events[f'{target}NameInstance'] + "-" + self.events[f'{target}ID'].astype(str))
+                name_instance_unique = name_instance + "-" + df_actors[f'{target}ID'].astype(str)
+
+            loc = self.events.columns.get_loc(f'{target}Name')
+            self.events.insert(loc+1, f'{target}NameInstance', _get_categorical(name_instance, inverse))
+            self.events.insert(loc+2, f'{target}NameInstanceUnique', _get_categorical(name_instance_unique, inverse))
+            self.events.insert(loc+3, f'{target}Key', keys[inverse])
+
+            if target == 'source':
+                self.events["sourceNameInstanceUnique"] = _fillna_categorical(self.events["sourceNameInstanceUnique"], "Environment")
+            _union_categories([self.events], ['sourceNameInstance', 'targetNameInstance'])
+            _union_categories([self.events], ['sourceNameInstanceUnique', 'targetNameInstanceUnique'])
         return
 
+    def _get_actor_keys(self, target='target'):
+        # (actor id << 20) + instance+1, -1 for no actor (environment)
+        ids = self.events[f'{target}ID'].fillna(-1).to_numpy(dtype=np.int64)
+        if f'{target}Instance' not in self.events.columns:
+            return np.where(ids == -1, -1, ids << 20)
+
+        # This blacklist tells the code not to tell apart the actor ids of these mobs
+        # Used to fix bugs such as Professor Putricide where Gas Cloud has 2 different WCL actor IDs (first when it spawns then another when it begins moving)
+        names = self.metadata.actors.loc[self.metadata.actors['name'].isin(BLACKLISTED_NPCS), 'name']
+        if len(names):
+            canonical_ids = names.index.to_series().groupby(names.values).transform('min')
+            canonical_ids = pd.Series(ids).map(canonical_ids)
+            ids = np.where(canonical_ids.notna(), canonical_ids, ids).astype(np.int64)
+        instances = self.events[f'{target}Instance'].fillna(-1).to_numpy(dtype=np.int64) + 1
+        return np.where(ids == -1, -1, (ids << 20) + instances)
+
 
 
 
@@ -0,0 +1,119 @@
+import time
+import heapq
+import random
+import asyncio
+import itertools
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+
+class WCLRequestScheduler:
+    # Token bucket of WCL API points, fed by rateLimitData
+    # - requests wait in a priority queue (interactive before batch, FIFO within a priority)
+    # - batch requests cannot spend the last batch_reserve fraction of the hourly points, so they never starve interactive users
+    # - 429/5xx responses are retried with jittered exponential backoff
+    def __init__(self, limit_per_hour=3600, batch_reserve=0.1, max_retries=5, backoff_base=1.0, backoff_max=60.0, refresh_interval=60):
+        self.limit_per_hour = limit_per_hour
+        self.tokens = limit_per_hour
+        self.batch_reserve = batch_reserve
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.refresh_interval = refresh_interval
+
+        self.ts_reset = time.monotonic() + 3600
+        self.ts_rate_limit_updated = None
+        self.refresh_task = None
+
+        self._waiters = []
+        self._seq = itertools.count()
+        self._cond = None
+        self._loop = None
+
+    def _get_cond(self):
+        # the condition is bound to the running loop, rebuild it if the scheduler outlives a loop
+        loop = asyncio.get_running_loop()
+        if self._cond is None or self._loop is not loop:
+            self._cond = asyncio.Condition()
+            self._loop = loop
+        return self._cond
+
+    def is_rate_limit_stale(self):
+        return self.ts_rate_limit_updated is None or (time.monotonic() - self.ts_rate_limit_updated) > self.refresh_interval
+
+    def update_from_rate_limit_data(self, rate_limit_data):
+        now = time.monotonic()
+        self.limit_per_hour = rate_limit_data['limitPerHour']
+        self.tokens = rate_limit_data['limitPerHour'] - rate_limit_data['pointsSpentThisHour']
+        self.ts_reset = now + rate_limit_data['pointsResetIn']
+        self.ts_rate_limit_updated = now
+        if self._cond is not None and self._loop is asyncio.get_running_loop():
+            self._loop.create_task(self._notify())
+
+    def on_throttled(self):
+        # hard throttled by the API: stop spending until the next rateLimitData refresh says otherwise
+        self.tokens = min(self.tokens, 0)
+        self.ts_rate_limit_updated = None
+
+    async def _notify(self):
+        cond = self._get_cond()
+        async with cond:
+            cond.notify_all()
+
+    def _refill(self):
+        now = time.monotonic()
+        if now >= self.ts_reset:
+            self.tokens = self.limit_per_hour
+            self.ts_reset = now + 3600
+
+    def _can_run(self, priority, cost):
+        reserve = priority >= PRIORITY_BATCH and self.limit_per_hour*self.batch_reserve or 0
+        return self.tokens - cost >= reserve
+
+    async def acquire(self, priority=PRIORITY_INTERACTIVE, cost=1):
+        cond = self._get_cond()
+        entry = (priority, next(self._seq))
+        async with cond:
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    self._refill()
+                    if self._waiters[0] == entry and self._can_run(priority, cost):
+                        heapq.heappop(self._waiters)
+                        self.tokens -= cost
+                        cond.notify_all()
+                        return
+
+                    # out of points: sleep until the hourly reset (or until woken by new rateLimitData / queue changes)
+                    timeout = self._waiters[0] == entry and max(0.01, self.ts_reset - time.monotonic()) or None
+                    try:
+                        await asyncio.wait_for(cond.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+            except BaseException:
+                if entry in self._waiters:
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                    cond.notify_all()
+                raise
+
+    def get_backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        # "full jitter" exponential backoff
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    @staticmethod
+    def is_retryable(status):
+        return status == 429 or status >= 500
+
+# Rate limits are per API client, so every WCLClient with the same client_id shares one scheduler
+_schedulers = {}
+
+def get_scheduler(client_id):
+    if client_id not in _schedulers:
+        _schedulers[client_id] = WCLRequestScheduler()
+    return _schedulers[client_id]
@@ -0,0 +1,231 @@
+import os
+import json
+import hashlib
+import importlib
+import numpy as np
+import pandas as pd
+
+from utils.wcl.PixolWCLReport import WCLReportMetaData, WCLReportFightData, DERIVED_COLUMNS
+
+HAS_PYARROW = importlib.util.find_spec('pyarrow')
+
+# Local store of processed fight data, so a second analysis of a fight is a local read instead of a download
+#
+# <path>/report_code=<code>/metadata.json                          raw report metadata (WCLReportMetaData.rawData)
+# <path>/report_code=<code>/fight_id=<id>/<stream name>.arrow      events frame with its derived columns (Arrow IPC, read through a memory map)
+# <path>/report_code=<code>/fight_id=<id>/<stream name>.parquet    same with format="parquet" (smaller, decompressed on load)
+# <path>/report_code=<code>/fight_id=<id>/<stream name>.json       CombatantInfo/Deaths streams (lists of events)
+#
+# Streams are named by what they select (source, filter, dataType, resources), not by the alias an analyzer gave them.
+# The layout is hive-partitioned, so the files can also be read as one Arrow dataset.
+# On load only the selected columns are read from disk, they are then copied into the pandas frame (to_pandas) and
+# the dtypes of the saved frame are restored (object columns of ints/None/lists, strings).
+
+WCL_SCHEMA_KEY = b'wcl'
+
+def get_stream_key(stream):
+    # stream: dict(source_id=None, filter_exp=None, data_type=None, include_resources=True), see WCLClient._fetch_events_batched
+    return (stream.get('source_id'), stream.get('filter_exp'), stream.get('data_type'), stream.get('include_resources', True))
+
+def get_stream_name(stream):
+    return hashlib.sha1(json.dumps(get_stream_key(stream)).encode('utf-8')).hexdigest()[:16]
+
+def _to_python(v):
+    # Arrow lists/structs come back as numpy arrays of dicts, the events hold python lists (e.g. classResources)
+    if isinstance(v, np.ndarray):
+        return [_to_python(x) for x in v.tolist()]
+    if isinstance(v, list):
+        return [_to_python(x) for x in v]
+    if isinstance(v, dict):
+        return {k: _to_python(x) for k, x in v.items()}
+    return v
+
+def _restore_dtypes(df, dtypes):
+    # dtypes: {column: dtype name} of the saved frame
+    for c, dtype in dtypes.items():
+        if c not in df.columns:
+            continue
+        s = df[c]
+        if dtype == 'object':
+            if s.dtype != object:
+                df[c] = s.astype(object).where(s.notna(), None)
+            elif any(isinstance(v, np.ndarray) for v in s.head(100).tolist()):
+                df[c] = s.map(_to_python)
+        elif str(s.dtype) != dtype:
+            df[c] = s.astype(dtype)
+    return df
+
+def _expand_columns(columns):
+    # a derived column is loaded together with the other columns created by the same method (e.g. all target name columns)
+    columns = list(columns)
+    for method_args in {DERIVED_COLUMNS[c][:2] for c in columns if c in DERIVED_COLUMNS}:
+        columns += [c for c, v in DERIVED_COLUMNS.items() if v[:2] == method_args and c not in columns]
+    return columns
+
+class WCLFightStore:
+    def __init__(self, path="./.wcl_cache/fights", format="arrow"):
+        if not HAS_PYARROW:
+            raise ImportError("WCLFightStore requires pyarrow")
+        if format not in ['arrow', 'parquet']:
+            raise ValueError(f"Unknown format: {format}")
+        self.path = path
+        self.format = format
+
+    def get_report_path(self, report_code):
+        return os.path.join(self.path, f"report_code={report_code}")
+
+    def get_fight_path(self, report_code, fight_id):
+        return os.path.join(self.get_report_path(report_code), f"fight_id={fight_id}")
+
+    def get_stream_path(self, report_code, fight_id, stream):
+        ext = stream.get('data_type') in ['CombatantInfo','Deaths'] and 'json' or self.format
+        return os.path.join(self.get_fight_path(report_code, fight_id), f"{get_stream_name(stream)}.{ext}")
+
+    def has_streams(self, report_code, fight_id, streams):
+        return all(os.path.exists(self.get_stream_path(report_code, fight_id, stream)) for stream in streams.values())
+
+    def list_fights(self, report_code):
+        path = self.get_report_path(report_code)
+        if not os.path.isdir(path):
+            return []
+        return sorted(int(name.split('=', 1)[1]) for name in os.listdir(path) if name.startswith('fight_id='))
+
+    # -------------------------------------------------------------------------
+    # Metadata
+    # -------------------------------------------------------------------------
+    def save_metadata(self, metadata):
+        path = self.get_report_path(metadata.reportCode)
+        os.makedirs(path, exist_ok=True)
+        _write_atomic(os.path.join(path, "metadata.json"), lambda f: f.write(json.dumps(metadata.rawData).encode('utf-8')))
+
+    def load_metadata(self, report_code, includeAllFightsAsEncounters=False):
+        path = os.path.join(self.get_report_path(report_code), "metadata.json")
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return WCLReportMetaData(json.load(f), includeAllFightsAsEncounters, report_code)
+
+    # -------------------------------------------------------------------------
+    # Event streams
+    # -------------------------------------------------------------------------
+    def save_streams(self, report_code, fight_id, streams, fight_data, overwrite=False):
+        # streams: {alias: stream}, fight_data: {alias: WCLReportFightData or list of events}
+        os.makedirs(self.get_fight_path(report_code, fight_id), exist_ok=True)
+        for alias, stream in streams.items():
+            path = self.get_stream_path(report_code, fight_id, stream)
+            if alias not in fight_data or (not overwrite and os.path.exists(path)):
+                continue
+            if path.endswith('.json'):
+                _write_atomic(path, lambda f: f.write(json.dumps(fight_data[alias]).encode('utf-8')))
+            else:
+                self._save_fight_data(path, fight_data[alias])
+
+    def load_streams(self, report_code, fight_id, streams, metadata=None, columns=None):
+        # {alias: WCLReportFightData or list of events}, None unless every stream is stored.
+        # columns: only load these event columns (and the derived columns created along with them)
+        if not self.has_streams(report_code, fight_id, streams):
+            return None
+        out = {}
+        for alias, stream in streams.items():
+            path = self.get_stream_path(report_code, fight_id, stream)
+            if path.endswith('.json'):
+                with open(path) as f:
+                    out[alias] = json.load(f)
+            else:
+                out[alias] = self._load_fight_data(path, metadata=metadata, fight_id=fight_id, columns=columns)
+        return out
+
+    def read_dataset(self, stream, report_code=None, columns=None):
+        # one frame of a stream over every stored fight (of a report), with report_code/fight_id partition columns
+        report_codes = report_code and [report_code] or sorted(name.split('=', 1)[1] for name in os.listdir(self.path) if name.startswith('report_code='))
+        list_df = []
+        for report_code in report_codes:
+            for fight_id in self.list_fights(report_code):
+                path = self.get_stream_path(report_code, fight_id, stream)
+                if os.path.exists(path) and not path.endswith('.json'):
+                    df = self._read_table(path, columns)[0]
+                    df.insert(0, 'fight_id', fight_id)
+                    df.insert(0, 'report_code', report_code)
+                    list_df.append(df)
+        if len(list_df) == 0:
+            return pd.DataFrame()
+        return pd.concat(list_df, ignore_index=True)
+
+    def _save_fight_data(self, path, fight_data):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        df = fight_data.events
+        dtypes = {c: str(df[c].dtype) for c in df.columns}
+        json_columns = []
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # columns Arrow cannot type (mixed python objects) are kept as json strings
+            for c in df.columns:
+                try:
+                    pa.array(df[c], from_pandas=True)
+                except (pa.ArrowInvalid, pa.ArrowTypeError):
+                    json_columns.append(c)
+            df = df.assign(**{c: df[c].map(json.dumps) for c in json_columns})
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        state = {
+            'last_timestamp': float(fight_data.last_timestamp),
+            'num_last_timestamp': int(fight_data.num_last_timestamp),
+            'derived': [[method, list(args)] for method, args in sorted(fight_data.derived)],
+            'json_columns': json_columns,
+            'dtypes': dtypes,
+        }
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), WCL_SCHEMA_KEY: json.dumps(state).encode('utf-8')})
+
+        if self.format == 'parquet':
+            _write_atomic(path, lambda f: pq.write_table(table, f))
+        else:
+            def write_ipc(f):
+                with pa.ipc.new_file(f, table.schema) as writer:
+                    writer.write_table(table)
+            _write_atomic(path, write_ipc)
+
+    def _read_table(self, path, columns=None):
+        # (events frame, stored state), only the selected columns are read from disk
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if path.endswith('.parquet'):
+            if columns is not None:
+                names = pq.read_schema(path).names
+                columns = [c for c in _expand_columns(columns) if c in names]
+            table = pq.read_table(path, columns=columns, memory_map=True)
+            df = table.to_pandas(integer_object_nulls=True)
+            metadata = table.schema.metadata
+        else:
+            with pa.memory_map(path, 'r') as source:
+                table = pa.ipc.open_file(source).read_all()
+                if columns is not None:
+                    table = table.select([c for c in _expand_columns(columns) if c in table.column_names])
+                df = table.to_pandas(integer_object_nulls=True)
+                metadata = table.schema.metadata
+
+        state = json.loads(metadata[WCL_SCHEMA_KEY])
+        for c in state['json_columns']:
+            if c in df.columns:
+                df[c] = df[c].map(json.loads)
+        return _restore_dtypes(df, {c: dtype for c, dtype in state.get('dtypes', {}).items() if c not in state['json_columns']}), state
+
+    def _load_fight_data(self, path, metadata=None, fight_id=None, columns=None):
+        df, state = self._read_table(path, columns)
+        # derived columns that were not loaded (column projection) are computed again on demand
+        derived = set()
+        for method, args in state['derived']:
+            method_args = (method, tuple(args))
+            method_columns = [c for c, v in DERIVED_COLUMNS.items() if v[:2] == method_args]
+            if columns is None or any(c in df.columns for c in method_columns):
+                derived.add(method_args)
+        return WCLReportFightData.from_events_frame(df, metadata=metadata, fight_id=fight_id, last_timestamp=state['last_timestamp'], num_last_timestamp=state['num_last_timestamp'], derived=derived)
+
+def _write_atomic(path, write):
+    # write to a temporary file first, a reader never sees a half written file
+    path_tmp = f"{path}.tmp{os.getpid()}"
+    with open(path_tmp, 'wb') as f:
+        write(f)
+    os.replace(path_tmp, path)
@@ -0,0 +1,79 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+
+class WCLTokenStore:
+    # Process-wide OAuth token cache keyed by client_id, optionally persisted to a json file
+    # - tokens are refreshed refresh_margin seconds before they expire
+    # - concurrent callers for the same client_id share a single in-flight refresh
+    def __init__(self, path=None, refresh_margin=300):
+        self.path = path
+        self.refresh_margin = refresh_margin
+        self._tokens = {}
+        self._inflight = {}
+        self._load()
+
+    @staticmethod
+    def _hash_secret(client_secret):
+        # the secret itself is never stored, only used to detect changed credentials for the same client_id
+        return hashlib.sha256(client_secret.encode('utf-8')).hexdigest()
+
+    def _load(self):
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path) as f:
+                    self._tokens = json.load(f)
+            except (OSError, ValueError):
+                self._tokens = {}
+
+    def _save(self):
+        if not self.path:
+            return
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'w') as f:
+            json.dump(self._tokens, f)
+
+    def _get_valid_token(self, client_id, client_secret):
+        entry = self._tokens.get(client_id)
+        if entry is None or entry['secretHash'] != self._hash_secret(client_secret):
+            return None
+        if time.time() > entry['expiresAt'] - self.refresh_margin:
+            return None
+        return entry['accessToken']
+
+    async def get_token(self, client_id, client_secret, generate_token):
+        # generate_token: coroutine function returning the oauth response json (access_token, expires_in)
+        token = self._get_valid_token(client_id, client_secret)
+        if token:
+            return token
+
+        task = self._inflight.get(client_id)
+        if task is None or task.done():
+            task = asyncio.ensure_future(self._refresh(client_id, client_secret, generate_token))
+            self._inflight[client_id] = task
+        return await task
+
+    async def _refresh(self, client_id, client_secret, generate_token):
+        response_json = await generate_token()
+        self._tokens[client_id] = {
+            'accessToken': response_json['access_token'],
+            'expiresAt': time.time() + response_json.get('expires_in', 3600),
+            'secretHash': self._hash_secret(client_secret),
+        }
+        self._save()
+        return response_json['access_token']
+
+    def invalidate(self, client_id):
+        if self._tokens.pop(client_id, None) is not None:
+            self._save()
+
+_token_store = None
+
+def get_token_store():
+    global _token_store
+    if _token_store is None:
+        _token_store = WCLTokenStore()
+    return _token_store
@@ -0,0 +1,105 @@
+import json
+import importlib
+from dataclasses import dataclass, field
+
+import requests
+from requests.adapters import HTTPAdapter
+
+HAS_AIOHTTP = importlib.util.find_spec('aiohttp')
+HAS_PYODIDE = importlib.util.find_spec('pyodide')
+
+# gzip/deflate keeps multi-megabyte event pages small on the wire
+DEFAULT_HEADERS = {
+    'Accept-Encoding': "gzip, deflate",
+}
+
+@dataclass
+class WCLResponse:
+    status: int
+    body: bytes
+    headers: dict = field(default_factory=dict)
+
+    @property
+    def text(self):
+        return self.body.decode('utf-8')
+
+    def json(self):
+        return json.loads(self.body)
+
+class WCLTransport:
+    async def post(self, url, json_body=None, data=None, headers=None):
+        raise NotImplementedError
+
+    async def close(self):
+        return
+
+class WCLTransportAiohttp(WCLTransport):
+    # Non-blocking transport with a pooled keep-alive session (one TLS handshake per pooled connection, not per page)
+    def __init__(self, limit=16, keepalive_timeout=60, timeout=120):
+        self._limit = limit
+        self._keepalive_timeout = keepalive_timeout
+        self._timeout = timeout
+        self._session = None
+
+    def _get_session(self):
+        # aiohttp sessions must be created inside a running event loop, so build lazily on first request
+        if self._session is None or self._session.closed:
+            import aiohttp
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self._limit, keepalive_timeout=self._keepalive_timeout),
+                timeout=aiohttp.ClientTimeout(total=self._timeout),
+                headers=DEFAULT_HEADERS,
+                auto_decompress=True,
+            )
+        return self._session
+
+    async def post(self, url, json_body=None, data=None, headers=None):
+        async with self._get_session().post(url, json=json_body, data=data, headers=headers) as response:
+            body = await response.read()
+            return WCLResponse(response.status, body, dict(response.headers))
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+class WCLTransportPyfetch(WCLTransport):
+    # Browser (pyscript) transport: fetch() is non-blocking and the browser handles connection reuse and compression
+    async def post(self, url, json_body=None, data=None, headers=None):
+        from pyodide.http import pyfetch
+        from urllib.parse import urlencode
+
+        headers = dict(headers or {})
+        if json_body is not None:
+            headers['Content-Type'] = "application/json"
+            body = json.dumps(json_body)
+        else:
+            headers['Content-Type'] = "application/x-www-form-urlencoded"
+            body = urlencode(data or {})
+
+        response = await pyfetch(url, method="POST", headers=headers, body=body)
+        return WCLResponse(response.status, await response.bytes(), dict(response.headers))
+
+class WCLTransportRequests(WCLTransport):
+    # Synchronous fallback (blocks the event loop) for environments without aiohttp or pyodide.
+    # Still reuses a pooled keep-alive session instead of opening a new connection per request.
+    def __init__(self, pool_maxsize=16):
+        self._session = requests.Session()
+        self._session.headers.update(DEFAULT_HEADERS)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+    async def post(self, url, json_body=None, data=None, headers=None):
+        response = self._session.post(url, json=json_body, data=data, headers=headers)
+        return WCLResponse(response.status_code, response.content, dict(response.headers))
+
+    async def close(self):
+        self._session.close()
+
+def get_default_transport():
+    if HAS_AIOHTTP:
+        return WCLTransportAiohttp()
+    if HAS_PYODIDE:
+        return WCLTransportPyfetch()
+    return WCLTransportRequests()